@@ -1,8 +1,11 @@
 import sys
+import multiprocessing
 from PyQt6.QtWidgets import QApplication
 from src.splash_screen import SplashScreen
 
 if __name__ == "__main__":
+    # Jobs run in spawned worker processes; frozen builds need this to start them.
+    multiprocessing.freeze_support()
     app = QApplication(sys.argv)
     splash = SplashScreen()
     splash.show()
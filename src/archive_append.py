@@ -0,0 +1,93 @@
+import os
+import tempfile
+
+from .core_crypto import append_encrypted_part, decrypt_file_parts, replace_payload
+from .file_operations import (
+    scan_folder, zip_folder, tar_folder, choose_archive_format, extract_archive, delete_path
+)
+from .profiling import profiled
+
+@profiled()
+def append_folder(enc_path: str, folder_path: str, password, progress_callback=None,
+                  archive_format: str = "auto", deduplicate: bool = True) -> int:
+    """
+    Adds the files of a folder to an existing encrypted archive.
+
+    The folder is archived on its own and appended as a new encrypted part;
+    nothing already in the archive is read back or rewritten. Files whose
+    archive names already exist are superseded when the archive is
+    extracted, since parts are extracted oldest first.
+
+    Args:
+        enc_path (str): Path to the envelope archive.
+        folder_path (str): Folder whose files are added, named relative to it.
+        password (str | PasswordKey | KeyfileKey | IdentityKey): Opens the archive.
+        progress_callback (callable, optional): A function to call with
+                                                 (processed_bytes, total_size)
+                                                 while the new part is encrypted.
+        archive_format (str): "zip", "tar" or "auto".
+        deduplicate (bool): If True, store identical files once.
+
+    Returns:
+        int: Number of files added.
+    """
+    inventory = scan_folder(folder_path)
+    if archive_format == "auto":
+        archive_format = choose_archive_format(inventory)
+    temp_archive = enc_path + ".append.tmp"
+    try:
+        if archive_format == "tar":
+            tar_folder(folder_path, temp_archive, inventory=inventory, deduplicate=deduplicate)
+        else:
+            zip_folder(folder_path, temp_archive, inventory=inventory, deduplicate=deduplicate)
+        append_encrypted_part(enc_path, temp_archive, password,
+                              entries=[arcname for _, arcname, _ in inventory],
+                              progress_callback=progress_callback)
+    finally:
+        if os.path.exists(temp_archive):
+            delete_path(temp_archive)
+    return len(inventory)
+
+@profiled()
+def compact_archive(enc_path: str, password, progress_callback=None, archive_format: str = "auto") -> bool:
+    """
+    Rewrites an appended archive as a single part, dropping superseded entries.
+
+    Every part is decrypted and extracted in order into a scratch folder
+    beside the archive, which is then re-archived and encrypted under the
+    archive's existing data key and key slots, so all passwords, keyfiles
+    and recipients keep working. The archive is replaced atomically.
+
+    Args:
+        enc_path (str): Path to the envelope archive.
+        password (str | PasswordKey | KeyfileKey | IdentityKey): Opens the archive.
+        progress_callback (callable, optional): A function to call with
+                                                 (processed_bytes, total_size)
+                                                 while the archive is re-encrypted.
+        archive_format (str): "zip", "tar" or "auto".
+
+    Returns:
+        bool: False if the archive had a single part and was left untouched.
+    """
+    scratch = tempfile.mkdtemp(prefix=".compact-", dir=os.path.dirname(os.path.abspath(enc_path)))
+    try:
+        parts = decrypt_file_parts(enc_path, os.path.join(scratch, "part"), password)
+        if len(parts) == 1:
+            return False
+        tree = os.path.join(scratch, "tree")
+        for part in parts:
+            extract_archive(part, tree, verify=True)
+            delete_path(part)
+
+        inventory = scan_folder(tree)
+        if archive_format == "auto":
+            archive_format = choose_archive_format(inventory)
+        archive = os.path.join(scratch, "compacted")
+        if archive_format == "tar":
+            tar_folder(tree, archive, inventory=inventory, deduplicate=True)
+        else:
+            zip_folder(tree, archive, inventory=inventory, deduplicate=True)
+        replace_payload(enc_path, archive, password, progress_callback=progress_callback)
+        return True
+    finally:
+        delete_path(scratch)
@@ -0,0 +1,300 @@
+import asyncio
+import os
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from .core_crypto import encrypt_file_aes, decrypt_file_parts, encrypt_stream, decrypt_stream
+from .file_operations import (
+    scan_folder, zip_folder, tar_folder, choose_archive_format, extract_archive, delete_path, verify_manifest,
+    HASH_ALGORITHM
+)
+from .resource_limits import cpu_workers
+
+ProgressEvent = namedtuple("ProgressEvent", ["stage", "processed", "total"])
+
+_DONE = object()
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class JobCancelled(Exception):
+    """Raised inside a blocking stage when its asyncio task was cancelled."""
+
+
+def _default_executor():
+    """Returns the shared executor for blocking stages, creating it on first use."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=cpu_workers(), thread_name_prefix="folder-enc")
+        return _executor
+
+
+class ProgressEvents:
+    """
+    Async iterator over the progress of one job.
+
+    Pass an instance as events= to a job and iterate it from another task:
+
+        events = ProgressEvents()
+        job = asyncio.create_task(encrypt_folder(path, out, pw, events=events))
+        async for event in events:
+            print(event.stage, event.processed, event.total)
+
+    Iteration ends when the job finishes, fails or is cancelled. If the
+    consumer falls behind, the oldest pending events are dropped, so a slow
+    consumer never slows the job down.
+    """
+    def __init__(self, maxsize: int = 256):
+        self._queue = asyncio.Queue(maxsize)
+        self._loop = None
+
+    def _bind(self, loop):
+        self._loop = loop
+
+    def _publish(self, event):
+        """Queues an event; safe to call from any thread."""
+        self._loop.call_soon_threadsafe(self._put, event)
+
+    def _put(self, event):
+        if self._queue.full():
+            self._queue.get_nowait()
+        self._queue.put_nowait(event)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> ProgressEvent:
+        event = await self._queue.get()
+        if event is _DONE:
+            raise StopAsyncIteration
+        return event
+
+
+class _Job:
+    """Runs the blocking stages of one job on an executor and relays progress and cancellation."""
+    def __init__(self, events: ProgressEvents = None, executor=None):
+        self.loop = asyncio.get_running_loop()
+        self.events = events
+        self.executor = executor or _default_executor()
+        self.cancelled = threading.Event()
+        self.pending = set()
+        if events is not None:
+            events._bind(self.loop)
+
+    def callback(self, stage: str):
+        """Returns a progress callback that publishes events and aborts once cancelled."""
+        def report(processed, total=None):
+            if self.cancelled.is_set():
+                raise JobCancelled()
+            if self.events is not None:
+                self.events._publish(ProgressEvent(stage, processed, total))
+        return report
+
+    async def run(self, func, *args, **kwargs):
+        """Runs func in the executor; on task cancel, stops it and waits for its cleanup."""
+        if self.cancelled.is_set():
+            raise asyncio.CancelledError()
+        future = self.executor.submit(func, *args, **kwargs)
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            self.cancelled.set()
+            for waiting in list(self.pending):
+                waiting.cancel()
+            # Let the stage unwind (and remove partial output) before the
+            # cancellation propagates to the caller.
+            await self.loop.run_in_executor(None, wait, [future])
+            raise
+
+    def call(self, coroutine):
+        """Runs a coroutine on the loop from a stage thread and waits for its result."""
+        if self.cancelled.is_set():
+            coroutine.close()
+            raise JobCancelled()
+        future = asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+        self.pending.add(future)
+        try:
+            return future.result()
+        finally:
+            self.pending.discard(future)
+
+    def close(self):
+        if self.events is not None:
+            self.events._publish(_DONE)
+
+
+async def encrypt_folder(folder_path: str, output_path: str = None, password=None, *, recipients=None,
+                         events: ProgressEvents = None, archive_format: str = "auto",
+                         deduplicate: bool = True, cipher=None, chunk_size: int = 1024 * 1024,
+                         executor=None) -> str:
+    """
+    Archives and encrypts a folder without blocking the event loop.
+
+    Args:
+        folder_path (str): Folder to encrypt.
+        output_path (str, optional): Path or s3:// URL for the archive. Defaults
+                                     to the folder path with .enc appended.
+        password (str | PasswordKey | KeyfileKey, optional): Password or key.
+        recipients (list, optional): X25519 public keys to encrypt to.
+        events (ProgressEvents, optional): Receives "scan", "archive" and "encrypt" events.
+        archive_format (str): "zip", "tar" or "auto".
+        deduplicate (bool): If True, store identical files once.
+        cipher (str, optional): Forces "aes-gcm" or "chacha20-poly1305".
+        chunk_size (int): Plaintext bytes per encrypted segment.
+        executor (Executor, optional): Runs the blocking stages. Defaults to a
+                                       shared thread pool.
+
+    Returns:
+        str: The output path.
+    """
+    output_path = output_path or folder_path.rstrip("/\\") + ".enc"
+    job = _Job(events, executor)
+    temp_archive = folder_path.rstrip("/\\") + ".zip"
+    try:
+        inventory = await job.run(scan_folder, folder_path)
+        job.callback("scan")(len(inventory), len(inventory))
+        if archive_format == "auto":
+            archive_format = choose_archive_format(inventory)
+        archive = tar_folder if archive_format == "tar" else zip_folder
+        await job.run(archive, folder_path, temp_archive, progress_callback=job.callback("archive"),
+                      inventory=inventory, deduplicate=deduplicate)
+        await job.run(encrypt_file_aes, temp_archive, output_path, password,
+                      progress_callback=job.callback("encrypt"), chunk_size=chunk_size,
+                      recipients=recipients, cipher=cipher)
+        return output_path
+    finally:
+        if os.path.exists(temp_archive):
+            await asyncio.shield(job.loop.run_in_executor(None, delete_path, temp_archive))
+        job.close()
+
+
+async def decrypt_archive(enc_path: str, output_dir: str = None, password=None, *,
+                          events: ProgressEvents = None, verify: bool = False, executor=None) -> str:
+    """
+    Decrypts and extracts an archive without blocking the event loop.
+
+    Args:
+        enc_path (str): Path, volume set or s3:// URL of the archive.
+        output_dir (str, optional): Folder to extract to. Defaults to the archive
+                                    path without its extension; required for URLs.
+        password (str | PasswordKey | KeyfileKey | IdentityKey): Password or key.
+        events (ProgressEvents, optional): Receives "decrypt", "extract" and, with
+                                          verify, "verify" events.
+        verify (bool): If True, read restored files back and check them against
+                       the hash manifest as a separate "verify" stage.
+        executor (Executor, optional): Runs the blocking stages.
+
+    Returns:
+        str: The output folder.
+    """
+    if output_dir is None:
+        if "://" in enc_path:
+            raise ValueError("An output folder is required when decrypting from a URL.")
+        output_dir = os.path.splitext(enc_path)[0]
+    os.makedirs(output_dir, exist_ok=True)
+    job = _Job(events, executor)
+    temp_archive = os.path.join(output_dir, ".decrypt.tmp")
+    parts = [temp_archive]
+    try:
+        parts = await job.run(decrypt_file_parts, enc_path, temp_archive, password,
+                              progress_callback=job.callback("decrypt"))
+        restored = {}
+        for part in parts:
+            manifest = await job.run(extract_archive, part, output_dir, progress_callback=job.callback("extract"))
+            if manifest:
+                restored.update(manifest["files"])
+        if verify and restored:
+            job.callback("verify")(0, len(restored))
+            await job.run(verify_manifest, output_dir, {"algorithm": HASH_ALGORITHM, "files": restored})
+            job.callback("verify")(len(restored), len(restored))
+        return output_dir
+    finally:
+        for part in parts:
+            if os.path.exists(part):
+                await asyncio.shield(job.loop.run_in_executor(None, delete_path, part))
+        job.close()
+
+
+class _BlockingReader:
+    """Blocking read() over an asyncio reader, for use from an executor thread."""
+    def __init__(self, reader, job: _Job):
+        self.reader = reader
+        self.job = job
+
+    def read(self, size: int = -1) -> bytes:
+        return self.job.call(self.reader.read(size))
+
+
+class _BlockingWriter:
+    """Blocking write() over an asyncio writer that waits for drain(), so the peer sets the pace."""
+    def __init__(self, writer, job: _Job):
+        self.writer = writer
+        self.job = job
+
+    async def _write(self, data: bytes):
+        result = self.writer.write(data)
+        if asyncio.iscoroutine(result):
+            await result
+        elif hasattr(self.writer, "drain"):
+            await self.writer.drain()
+
+    def write(self, data) -> int:
+        self.job.call(self._write(bytes(data)))
+        return len(data)
+
+
+async def encrypt_stream_async(reader, writer, password=None, *, recipients=None, events: ProgressEvents = None,
+                               chunk_size: int = 1024 * 1024, total_size: int = None, cipher=None,
+                               executor=None) -> bytes:
+    """
+    Encrypts an async byte stream into another, e.g. an upload body into a socket.
+
+    The reader needs an async read(n) (asyncio.StreamReader, aiohttp's
+    StreamReader, ...); the writer needs write() plus an async drain(), or
+    an async write(). Each segment waits for the writer to drain, so a slow
+    consumer applies backpressure all the way to the reader.
+
+    Args:
+        reader: Async source of plaintext.
+        writer: Async destination of ciphertext.
+        password (str | PasswordKey | KeyfileKey, optional): Password or key.
+        recipients (list, optional): X25519 public keys to encrypt to.
+        events (ProgressEvents, optional): Receives "encrypt" events.
+        chunk_size (int): Plaintext bytes per encrypted segment.
+        total_size (int, optional): Size of the input, if known.
+        cipher (str, optional): Forces "aes-gcm" or "chacha20-poly1305".
+        executor (Executor, optional): Runs the encryption.
+
+    Returns:
+        bytes: The password salt recorded in the header, or None without a password.
+    """
+    job = _Job(events, executor)
+    try:
+        return await job.run(encrypt_stream, _BlockingReader(reader, job), _BlockingWriter(writer, job), password,
+                             progress_callback=job.callback("encrypt"), chunk_size=chunk_size,
+                             total_size=total_size, recipients=recipients, cipher=cipher)
+    finally:
+        job.close()
+
+
+async def decrypt_stream_async(reader, writer, password, *, events: ProgressEvents = None,
+                               total_size: int = None, executor=None):
+    """
+    Decrypts an async byte stream into another; see encrypt_stream_async().
+
+    Args:
+        reader: Async source of ciphertext.
+        writer: Async destination of plaintext.
+        password (str | PasswordKey | KeyfileKey | IdentityKey): Password or key.
+        events (ProgressEvents, optional): Receives "decrypt" events.
+        total_size (int, optional): Size of the input, if known.
+        executor (Executor, optional): Runs the decryption.
+    """
+    job = _Job(events, executor)
+    try:
+        await job.run(decrypt_stream, _BlockingReader(reader, job), _BlockingWriter(writer, job), password,
+                      progress_callback=job.callback("decrypt"), total_size=total_size)
+    finally:
+        job.close()
@@ -0,0 +1,239 @@
+import functools
+import hmac
+import hashlib
+import os
+import socket
+import sqlite3
+import time
+
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+from .core_crypto import derive_key, generate_salt
+
+CATALOG_ENV = "FOLDER_ENC_CATALOG"
+CATALOG_KEY_ENV = "FOLDER_ENC_CATALOG_KEY"
+DEFAULT_CATALOG = os.path.join("~", ".folder-enc", "catalog.sqlite3")
+PLAIN = "plain"
+HMAC_ONLY = "hmac"
+ENCRYPTED = "encrypt"
+PROTECTIONS = (PLAIN, HMAC_ONLY, ENCRYPTED)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value BLOB);
+CREATE TABLE IF NOT EXISTS archives (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    size INTEGER,
+    digest TEXT,
+    source BLOB,
+    host TEXT,
+    created REAL NOT NULL,
+    files INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS entries (
+    archive_id INTEGER NOT NULL REFERENCES archives(id) ON DELETE CASCADE,
+    name_key BLOB NOT NULL,
+    path BLOB,
+    size INTEGER NOT NULL,
+    digest BLOB
+);
+CREATE INDEX IF NOT EXISTS entries_name ON entries(name_key);
+CREATE INDEX IF NOT EXISTS entries_digest ON entries(digest);
+CREATE INDEX IF NOT EXISTS entries_archive ON entries(archive_id);
+"""
+
+
+def default_catalog_path() -> str:
+    """Returns the catalog path from FOLDER_ENC_CATALOG, or the per-user default."""
+    return os.path.expanduser(os.environ.get(CATALOG_ENV) or DEFAULT_CATALOG)
+
+
+def configured_catalog_path():
+    """
+    Returns the catalog path if the user turned the catalog on, else None.
+
+    The catalog is on when FOLDER_ENC_CATALOG or FOLDER_ENC_CATALOG_KEY is
+    set, so file names are never recorded in plain text unless asked for.
+    """
+    if os.environ.get(CATALOG_ENV) or os.environ.get(CATALOG_KEY_ENV):
+        return default_catalog_path()
+    return None
+
+
+@functools.lru_cache(maxsize=None)
+def _catalog_keys(secret: str, salt: bytes) -> bytes:
+    """Derives the HMAC and AES-GCM keys of a catalog; cached, as PBKDF2 is slow by design."""
+    return HKDF(algorithm=hashes.SHA256(), length=64, salt=None,
+                info=b"fenc catalog").derive(derive_key(secret, salt))
+
+
+class Catalog:
+    """
+    Local SQLite index of encrypted archives and the files inside them.
+
+    Answers "which archive contains payroll_2024.xlsx?" without decrypting
+    anything: entries are indexed by their case-folded file name and by
+    content digest, so lookups stay in the milliseconds for millions of
+    entries.
+
+    With a secret, names and digests are indexed by HMAC, so the catalog
+    alone does not reveal them. "encrypt" protection additionally stores
+    entry and source paths encrypted with AES-GCM so they can be shown
+    with the key; "hmac" protection does not store them at all. The
+    protection is fixed when the catalog is created.
+    """
+    def __init__(self, path: str = None, secret: str = None, protection: str = None):
+        """
+        Opens the catalog, creating it if needed.
+
+        Args:
+            path (str, optional): Catalog file. Defaults to default_catalog_path().
+            secret (str, optional): Key for protected catalogs. Defaults to
+                                    FOLDER_ENC_CATALOG_KEY.
+            protection (str, optional): "plain", "hmac" or "encrypt" for a new
+                                        catalog. Defaults to "encrypt" with a
+                                        secret and "plain" without.
+
+        Raises:
+            ValueError: If the secret is missing or wrong for a protected catalog.
+        """
+        self.path = path or default_catalog_path()
+        secret = secret or os.environ.get(CATALOG_KEY_ENV) or None
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._db = sqlite3.connect(self.path, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("PRAGMA foreign_keys=ON")
+        self._db.executescript(_SCHEMA)
+
+        meta = dict(self._db.execute("SELECT key, value FROM meta"))
+        if "protection" in meta:
+            self.protection = meta["protection"]
+        else:
+            self.protection = protection or (ENCRYPTED if secret else PLAIN)
+            if self.protection not in PROTECTIONS:
+                raise ValueError(f"Unknown catalog protection {self.protection!r}.")
+            meta = {"protection": self.protection, "salt": generate_salt()}
+        self._hmac_key = self._aead = None
+        if self.protection != PLAIN:
+            if not secret:
+                raise ValueError(f"The catalog is protected; set {CATALOG_KEY_ENV}.")
+            keys = _catalog_keys(secret, bytes(meta["salt"]))
+            self._hmac_key = keys[:32]
+            self._aead = AESGCM(keys[32:])
+            check = self._index(b"fenc catalog check")
+            if "check" in meta and not hmac.compare_digest(meta["check"], check):
+                raise ValueError("Wrong catalog key.")
+            meta["check"] = check
+        with self._db:
+            self._db.executemany("INSERT OR IGNORE INTO meta VALUES (?, ?)", meta.items())
+
+    def _index(self, value: bytes):
+        """Returns the lookup key of a name or digest."""
+        if self._hmac_key is None:
+            return value.decode("utf-8")
+        return hmac.new(self._hmac_key, value, hashlib.sha256).digest()
+
+    def _name_key(self, path: str):
+        return self._index(os.path.basename(path.replace("\\", "/").rstrip("/")).casefold().encode("utf-8"))
+
+    def _seal(self, text: str, context: bytes):
+        """
+        Returns text as stored: plain, encrypted or dropped, per the protection.
+
+        Encrypted values are bound to context (the row's lookup key or archive
+        path), so they cannot be moved to another row unnoticed.
+        """
+        if text is None or self.protection == HMAC_ONLY:
+            return None
+        if self._aead is None:
+            return text
+        nonce = os.urandom(12)
+        return nonce + self._aead.encrypt(nonce, text.encode("utf-8"), b"fenc catalog" + context)
+
+    def _open(self, value, context: bytes):
+        if value is None or self._aead is None:
+            return value
+        try:
+            return self._aead.decrypt(value[:12], value[12:], b"fenc catalog" + context).decode("utf-8")
+        except InvalidTag:
+            raise ValueError("The catalog was modified or is corrupted.")
+
+    def add_archive(self, archive_path: str, entries, source: str = None, size: int = None,
+                    digest: str = None):
+        """
+        Records an archive and its entries, replacing an earlier record of the same path.
+
+        Args:
+            archive_path (str): Path or URL of the encrypted archive.
+            entries (iterable): (archive name, size, hex digest or None) per file.
+            source (str, optional): Folder the archive was made from.
+            size (int, optional): Size of the encrypted archive.
+            digest (str, optional): Hex digest of the ciphertext, if computed.
+        """
+        entries = list(entries)
+        with self._db:
+            self._db.execute("DELETE FROM archives WHERE path = ?", (archive_path,))
+            archive_id = self._db.execute(
+                "INSERT INTO archives (path, size, digest, source, host, created, files) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (archive_path, size, digest, self._seal(source, archive_path.encode("utf-8")),
+                 socket.gethostname(), time.time(),
+                 len(entries))).lastrowid
+            rows = []
+            for name, file_size, file_digest in entries:
+                name_key = self._name_key(name)
+                rows.append((archive_id, name_key, self._seal(name, name_key), file_size,
+                             self._index(file_digest.lower().encode("ascii")) if file_digest else None))
+            self._db.executemany("INSERT INTO entries VALUES (?, ?, ?, ?, ?)", rows)
+
+    def remove_archive(self, archive_path: str) -> bool:
+        """Forgets an archive; returns False if it was not in the catalog."""
+        with self._db:
+            return self._db.execute("DELETE FROM archives WHERE path = ?", (archive_path,)).rowcount > 0
+
+    def _query(self, column: str, key) -> list:
+        rows = self._db.execute(
+            "SELECT archives.path, entries.name_key, entries.path, entries.size, archives.created, archives.host "
+            f"FROM entries JOIN archives ON archives.id = entries.archive_id WHERE entries.{column} = ? "
+            "ORDER BY archives.created DESC", (key,))
+        return [{"archive": archive, "path": self._open(path, name_key), "size": size, "created": created,
+                 "host": host}
+                for archive, name_key, path, size, created, host in rows]
+
+    def find(self, name: str) -> list:
+        """
+        Finds the archives holding a file with this name, newest archive first.
+
+        Args:
+            name (str): File name, matched case-insensitively. Folders in it are ignored.
+
+        Returns:
+            list: Dicts with "archive", "path" (None under "hmac" protection),
+                  "size", "created" and "host".
+        """
+        return self._query("name_key", self._name_key(name))
+
+    def find_digest(self, digest: str) -> list:
+        """Finds the archives holding a file with this hex content digest; see find()."""
+        return self._query("digest", self._index(digest.lower().encode("ascii")))
+
+    def archives(self) -> list:
+        """Returns every cataloged archive as a dict, newest first."""
+        rows = self._db.execute("SELECT path, size, digest, source, host, created, files FROM archives "
+                                "ORDER BY created DESC")
+        return [{"path": path, "size": size, "digest": digest, "source": self._open(source, path.encode("utf-8")),
+                 "host": host, "created": created, "files": files}
+                for path, size, digest, source, host, created, files in rows]
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
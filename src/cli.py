@@ -0,0 +1,298 @@
+import argparse
+import getpass
+import os
+import ssl
+import sys
+
+from .archive_append import append_folder, compact_archive
+from .catalog import Catalog
+from .core_crypto import (
+    encrypt_stream, decrypt_stream, decrypt_file_parts, rekey_file, recover_rekey, generate_keypair, IdentityKey,
+    RecipientKey, CIPHERS
+)
+from .distributed import ShardWorkerServer, encrypt_distributed, DEFAULT_PORT
+from .mirror import mirror_folder, restore_mirror
+from .resource_limits import set_io_limit, set_cpu_workers, lower_priority
+from .storage import open_sink, open_source, is_local_path
+
+PASSWORD_ENV = "FOLDER_ENC_PASSWORD"
+NEW_PASSWORD_ENV = "FOLDER_ENC_NEW_PASSWORD"
+
+
+def _read_password(password_file: str = None, env: str = PASSWORD_ENV, prompt: str = "Password: ") -> str:
+    """Reads a password from a file, the environment, or the terminal."""
+    if password_file:
+        with open(password_file, encoding="utf-8") as f:
+            return f.readline().rstrip("\r\n")
+    if os.environ.get(env):
+        return os.environ[env]
+    # getpass talks to the terminal directly, so stdin stays free for data.
+    return getpass.getpass(prompt)
+
+
+def _open_input(path: str):
+    """Opens the input and returns (file, size), or (stdin, None) for "-"."""
+    return (sys.stdin.buffer, None) if path == "-" else open_source(path)
+
+
+def _open_output(path: str, volume_size: int = None, total_size: int = None):
+    """Opens the output sink, or stdout for "-"."""
+    return sys.stdout.buffer if path == "-" else open_sink(path, volume_size, total_size=total_size)
+
+
+def _progress_printer(enabled: bool):
+    """Returns a progress callback that prints to stderr, or None."""
+    if not enabled:
+        return None
+
+    def report(processed_bytes, total_size):
+        if total_size:
+            sys.stderr.write(f"\r{processed_bytes * 100 // max(total_size, 1)}% ")
+        else:
+            sys.stderr.write(f"\r{processed_bytes // (1024 * 1024)} MB ")
+        sys.stderr.flush()
+    return report
+
+
+def main(argv=None) -> int:
+    """
+    Encrypts or decrypts a byte stream, so the tool can sit in a pipeline:
+
+        pg_dump db | python -m src.cli encrypt > db.enc
+        python -m src.cli decrypt -i db.enc | psql db
+
+    Inputs and outputs may also be s3://bucket/key URLs (set
+    FOLDER_ENC_S3_ENDPOINT for MinIO and other S3-compatible stores), and
+    --volume-size splits the output into NAME.000, NAME.001, ... which
+    decrypt -i NAME reads back. Decrypting an appended or distributed
+    archive to a file writes one file per part: OUT, OUT.1, OUT.2, ...
+
+    "rekey" changes the password of the archive given with -i in place.
+    "append -i FOLDER -o ARCHIVE" adds a folder's files to an existing
+    archive as a new part, without rewriting it; "compact -i ARCHIVE"
+    merges the parts back into one, dropping superseded files.
+    "keygen -o NAME" writes an X25519 key pair to NAME and NAME.pub; encrypt
+    with --recipient NAME.pub and decrypt with --identity NAME, no password
+    needed.
+
+    "mirror -i FOLDER -o MIRROR" encrypts every file of FOLDER separately,
+    with encrypted names, and on later runs only the files that changed;
+    "restore -i MIRROR -o FOLDER [--path P ...]" restores all or part of it.
+
+    "find --name NAME" (or --digest HEX) lists the cataloged archives that
+    contain a file, without decrypting anything.
+
+    "shard-worker --listen HOST:PORT" serves shards on a worker node, and
+    "distribute -i FOLDER -o OUT --worker HOST:PORT ..." encrypts a folder on
+    those workers; both read the shared secret, a long random string, from
+    $FOLDER_ENC_CLUSTER_SECRET. Workers listen on localhost unless --listen
+    names another address; across a network, give the worker --tls-cert and
+    --tls-key and the coordinator --tls-ca.
+    """
+    parser = argparse.ArgumentParser(prog="folder-enc", description="Encrypt or decrypt a byte stream.")
+    parser.add_argument("mode", choices=["encrypt", "decrypt", "rekey", "append", "compact", "keygen", "mirror",
+                                         "restore", "find", "shard-worker", "distribute"])
+    parser.add_argument("-i", "--input", default="-", help="Input file, volume set or s3:// URL, "
+                                                           "or - for stdin (default).")
+    parser.add_argument("-o", "--output", default="-", help="Output file or s3:// URL, or - for stdout (default).")
+    parser.add_argument("--volume-size", type=int, help="Split the output into volumes of this many MiB.")
+    parser.add_argument("--password-file", help=f"File whose first line is the password. "
+                                                f"Defaults to ${PASSWORD_ENV} or a prompt.")
+    parser.add_argument("--new-password-file", help=f"For rekey: file with the new password. "
+                                                    f"Defaults to ${NEW_PASSWORD_ENV} or a prompt.")
+    parser.add_argument("--recipient", action="append", default=[],
+                        help="For encrypt: PEM public key to encrypt to (repeatable). "
+                             "No password is used unless --password-file is also given.")
+    parser.add_argument("--identity", help="For decrypt, restore, append and compact: PEM private key instead "
+                                           "of a password.")
+    parser.add_argument("--cipher", choices=["auto", *CIPHERS], default="auto",
+                        help="For encrypt: AEAD to use. auto picks the faster one for this CPU.")
+    parser.add_argument("--path", action="append", default=[],
+                        help="For restore: file or folder to restore from the mirror (repeatable).")
+    parser.add_argument("--name", help="For find: file name to look up, case-insensitively.")
+    parser.add_argument("--digest", help="For find: content digest to look up.")
+    parser.add_argument("--catalog", help="Catalog file for find. Defaults to $FOLDER_ENC_CATALOG "
+                                          "or ~/.folder-enc/catalog.sqlite3.")
+    parser.add_argument("--worker", action="append", default=[],
+                        help="For distribute: HOST:PORT of a shard worker (repeatable).")
+    parser.add_argument("--listen", default=f"127.0.0.1:{DEFAULT_PORT}",
+                        help="For shard-worker: address to listen on. Use 0.0.0.0:PORT to accept remote "
+                             "coordinators.")
+    parser.add_argument("--source-root", help="For shard-worker: where this host mounts the folders to encrypt.")
+    parser.add_argument("--tls-cert", help="For shard-worker: PEM certificate chain; serves shards over TLS.")
+    parser.add_argument("--tls-key", help="For shard-worker: PEM private key of --tls-cert.")
+    parser.add_argument("--tls-ca", help="For distribute: PEM CA bundle the workers' certificates are checked "
+                                         "against; talks to the workers over TLS.")
+    parser.add_argument("--chunk-size", type=int, default=1024 * 1024)
+    parser.add_argument("--progress", action="store_true", help="Print progress to stderr.")
+    parser.add_argument("--io-limit", type=float, help="Limit disk throughput to this many MB/s.")
+    parser.add_argument("--cpu-workers", type=int, help="Cap on CPU worker threads.")
+    parser.add_argument("--low-priority", action="store_true", help="Run at lower CPU and I/O priority.")
+    args = parser.parse_args(argv)
+
+    if args.io_limit:
+        set_io_limit(args.io_limit)
+    if args.cpu_workers:
+        set_cpu_workers(args.cpu_workers)
+    if args.low_priority:
+        lower_priority()
+
+    if args.mode == "keygen":
+        if args.output == "-":
+            parser.error("keygen needs a private key path given with -o.")
+        generate_keypair(args.output, args.output + ".pub")
+        return 0
+
+    if args.mode == "find":
+        if not args.name and not args.digest:
+            parser.error("find needs --name or --digest.")
+        try:
+            with Catalog(args.catalog) as catalog:
+                matches = catalog.find(args.name) if args.name else catalog.find_digest(args.digest)
+        except ValueError as e:
+            sys.stderr.write(f"Error: {e}\n")
+            return 1
+        for match in matches:
+            print(f"{match['archive']}\t{match['path'] or ''}\t{match['size']}")
+        return 0 if matches else 1
+
+    if args.mode == "shard-worker":
+        host, _, port = args.listen.rpartition(":")
+        ssl_context = None
+        if args.tls_cert:
+            ssl_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+            ssl_context.load_cert_chain(args.tls_cert, args.tls_key)
+        try:
+            server = ShardWorkerServer((host or "127.0.0.1", int(port)), source_root=args.source_root,
+                                       ssl_context=ssl_context)
+        except ValueError as e:
+            sys.stderr.write(f"Error: {e}\n")
+            return 1
+        with server:
+            server.serve_forever()
+        return 0
+
+    if args.identity and args.mode in ("decrypt", "restore", "append", "compact"):
+        password = IdentityKey.load(args.identity)
+    elif args.recipient and args.mode in ("encrypt", "distribute") and not args.password_file:
+        password = None
+    else:
+        password = _read_password(args.password_file)
+        if not password:
+            parser.error("Password cannot be empty.")
+
+    if args.mode == "distribute":
+        if args.input == "-" or args.output == "-" or not args.worker:
+            parser.error("distribute needs a folder (-i), an output (-o) and at least one --worker.")
+        try:
+            encrypt_distributed(args.input, args.output, password, args.worker,
+                                recipients=[RecipientKey.load(path) for path in args.recipient],
+                                cipher=args.cipher, chunk_size=args.chunk_size,
+                                volume_size=args.volume_size * 1024 * 1024 if args.volume_size else None,
+                                progress_callback=_progress_printer(args.progress),
+                                ssl_context=ssl.create_default_context(cafile=args.tls_ca) if args.tls_ca else None)
+        except (ValueError, RuntimeError) as e:
+            sys.stderr.write(f"Error: {e}\n")
+            return 1
+        return 0
+
+    if args.mode in ("mirror", "restore"):
+        if args.input == "-" or args.output == "-":
+            parser.error(f"{args.mode} needs folders given with -i and -o.")
+        try:
+            if args.mode == "mirror":
+                mirror_folder(args.input, args.output, password,
+                              recipients=[RecipientKey.load(path) for path in args.recipient],
+                              cipher=args.cipher)
+            else:
+                restore_mirror(args.input, args.output, password, paths=args.path or None)
+        except (ValueError, FileNotFoundError) as e:
+            sys.stderr.write(f"Error: {e}\n")
+            return 1
+        return 0
+
+    if args.mode == "rekey":
+        if args.input == "-":
+            parser.error("rekey needs an archive path given with -i.")
+        new_password = _read_password(args.new_password_file, NEW_PASSWORD_ENV, "New password: ")
+        if not new_password:
+            parser.error("New password cannot be empty.")
+        try:
+            rekey_file(args.input, password, new_password)
+        except ValueError as e:
+            sys.stderr.write(f"Error: {e}\n")
+            return 1
+        return 0
+
+    if args.mode == "append":
+        if args.input == "-" or args.output == "-":
+            parser.error("append needs a folder given with -i and an archive given with -o.")
+        try:
+            count = append_folder(args.output, args.input, password, progress_callback=_progress_printer(args.progress))
+        except ValueError as e:
+            sys.stderr.write(f"Error: {e}\n")
+            return 1
+        sys.stderr.write(f"Appended {count} files.\n")
+        return 0
+
+    if args.mode == "compact":
+        if args.input == "-":
+            parser.error("compact needs an archive path given with -i.")
+        try:
+            compacted = compact_archive(args.input, password, progress_callback=_progress_printer(args.progress))
+        except ValueError as e:
+            sys.stderr.write(f"Error: {e}\n")
+            return 1
+        if not compacted:
+            sys.stderr.write("The archive has a single part; nothing to compact.\n")
+        return 0
+
+    if (args.mode == "decrypt" and args.input != "-" and args.output != "-" and not args.volume_size
+            and is_local_path(args.output)):
+        # Appended and distributed archives hold several parts, each of
+        # which decrypts to its own archive file.
+        try:
+            outputs = decrypt_file_parts(args.input, args.output, password,
+                                         progress_callback=_progress_printer(args.progress),
+                                         chunk_size=args.chunk_size)
+        except ValueError as e:
+            sys.stderr.write(f"Error: {e}\n")
+            return 1
+        if len(outputs) > 1:
+            sys.stderr.write(f"Decrypted {len(outputs)} parts; extract them in order: {' '.join(outputs)}\n")
+        return 0
+
+    if args.mode == "decrypt" and args.input != "-" and is_local_path(args.input):
+        recover_rekey(args.input)
+    infile, total_size = _open_input(args.input)
+    volume_size = args.volume_size * 1024 * 1024 if args.volume_size else None
+    outfile = _open_output(args.output, volume_size, total_size)
+    progress = _progress_printer(args.progress)
+    committed = False
+    try:
+        if args.mode == "encrypt":
+            encrypt_stream(infile, outfile, password, progress_callback=progress,
+                           chunk_size=args.chunk_size, total_size=total_size,
+                           recipients=[RecipientKey.load(path) for path in args.recipient],
+                           cipher=args.cipher)
+        else:
+            decrypt_stream(infile, outfile, password, progress_callback=progress,
+                           chunk_size=args.chunk_size, total_size=total_size)
+        if outfile is sys.stdout.buffer:
+            outfile.flush()
+        else:
+            outfile.commit()
+        committed = True
+    except ValueError as e:
+        sys.stderr.write(f"Error: {e}\n")
+        return 1
+    finally:
+        if infile is not sys.stdin.buffer:
+            infile.close()
+        if outfile is not sys.stdout.buffer and not committed:
+            outfile.abort()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,20 +1,76 @@
+import io
 import os
+import hashlib
+import json
+import struct
+import sys
+import threading
+import time
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 from cryptography.hazmat.primitives import hashes, padding
+from cryptography.hazmat.primitives.keywrap import aes_key_wrap, aes_key_unwrap, InvalidUnwrap
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM, ChaCha20Poly1305
+from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PrivateKey, X25519PublicKey
+from cryptography.hazmat.primitives import serialization
+from cryptography.exceptions import InvalidTag
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
 
+from .job_report import stage_timer
+from .profiling import profiled
+from .resource_limits import throttle_io
+from .storage import open_sink, open_source, is_local_path
+
+KDF_ITERATIONS = 390000
+
+# Envelope format: a fixed header (authenticated with every segment), the
+# key slots that each wrap the random per-archive data key, then the payload
+# as AEAD segments. Files without MAGIC use the legacy salt + IV + AES-CBC
+# layout, which is still decrypted but no longer written.
+MAGIC = b"FENC"
+FORMAT_VERSION = 2
+FIXED_HEADER = struct.Struct(">4sBBI7s")
+SLOT_HEADER = struct.Struct(">BH")
+CIPHER_AES_GCM = 1
+CIPHER_CHACHA20_POLY1305 = 2
+CIPHERS = {"aes-gcm": CIPHER_AES_GCM, "chacha20-poly1305": CIPHER_CHACHA20_POLY1305}
+CIPHER_ENV = "FOLDER_ENC_CIPHER"
+CIPHER_BENCHMARK_BYTES = 1024 * 1024
+VERIFY_CHUNK_SIZE = 1024 * 1024
+SLOT_PASSWORD = 1
+SLOT_KEYFILE = 2
+SLOT_X25519 = 3
+SLOT_MASTER = 4
+DATA_KEY_SIZE = 32
+WRAPPED_KEY_SIZE = DATA_KEY_SIZE + 8
+TAG_SIZE = 16
+NONCE_PREFIX_SIZE = 7
+MAX_SEGMENTS = 2 ** 32
+# Appended archives end with an encrypted part index and this footer; the
+# newest footer at the end of the file supersedes earlier ones.
+INDEX_MAGIC = b"FENCIDX1"
+INDEX_FOOTER = struct.Struct(">Q8s")
+# rekey_file() first writes the slot change to PATH.rekey: magic, slot offset,
+# slot length, old slot, new slot, then a SHA-256 of all of it. A complete
+# journal left behind by a crash is replayed before the archive is opened.
+REKEY_JOURNAL_SUFFIX = ".rekey"
+REKEY_MAGIC = b"FENCRKY1"
+REKEY_JOURNAL = struct.Struct(">8sQH")
+
 def generate_salt():
     """Generates a random salt for key derivation."""
     return os.urandom(16)
 
-def derive_key(password: str, salt: bytes) -> bytes:
+@profiled()
+def derive_key(password: str, salt: bytes, iterations: int = KDF_ITERATIONS) -> bytes:
     """
     Derives a cryptographic key from a password and salt using PBKDF2HMAC.
 
     Args:
         password (str): The user's password.
         salt (bytes): The salt generated for key derivation.
+        iterations (int): Number of PBKDF2 iterations.
 
     Returns:
         bytes: The derived cryptographic key.
@@ -23,109 +79,1145 @@ def derive_key(password: str, salt: bytes) -> bytes:
         algorithm=hashes.SHA256(),
         length=32,
         salt=salt,
-        iterations=390000,
+        iterations=iterations,
         backend=default_backend()
     )
     return kdf.derive(password.encode())
 
-def encrypt_file_aes(input_path: str, output_path: str, password: str, export_hashes: bool = False, progress_callback=None):
+class PasswordKey:
+    """
+    Password-based key-encryption key (KEK) for envelope encryption.
+
+    One PasswordKey can be shared by a whole batch: the KEK for new archives
+    is derived once, and KEKs needed to open archives are cached by salt, so
+    a batch written with the same PasswordKey costs a single PBKDF2 run to
+    create and another to unlock.
+    """
+    slot_type = SLOT_PASSWORD
+
+    def __init__(self, password: str, iterations: int = KDF_ITERATIONS, salt: bytes = None):
+        """
+        Initializes the PasswordKey.
+
+        Args:
+            password (str): The user's password.
+            iterations (int): PBKDF2 iterations for new archives.
+            salt (bytes, optional): Salt to use for new archives and to force when
+                                    opening them (e.g. from a .salt file).
+        """
+        if not password:
+            raise ValueError("Password cannot be empty.")
+        self.password = password
+        self.iterations = iterations
+        self.salt_override = salt
+        self.salt = salt or generate_salt()
+        self._keks = {}
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+
+    def __getstate__(self):
+        # Locks cannot be pickled; a copy sent to a worker process gets its own.
+        state = dict(self.__dict__)
+        del state["_locks"], state["_locks_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+
+    def _kek(self, salt: bytes, iterations: int) -> bytes:
+        """Returns the KEK for a salt, deriving it only on first use."""
+        cache_key = (salt, iterations)
+        # Threads opening archives with the same salt wait for one derivation
+        # instead of each running PBKDF2; different salts derive in parallel.
+        with self._locks_lock:
+            lock = self._locks.setdefault(cache_key, threading.Lock())
+        with lock:
+            if cache_key not in self._keks:
+                self._keks[cache_key] = derive_key(self.password, salt, iterations)
+        return self._keks[cache_key]
+
+    def wrap(self, data_key: bytes) -> bytes:
+        """Returns a key slot body holding data_key wrapped under this key."""
+        kek = self._kek(self.salt, self.iterations)
+        return struct.pack(">I", self.iterations) + self.salt + aes_key_wrap(kek, data_key)
+
+    def unwrap(self, body: bytes) -> bytes:
+        """Returns the data key from a slot body; raises InvalidUnwrap on a wrong key."""
+        (iterations,) = struct.unpack(">I", body[:4])
+        salt = self.salt_override or body[4:20]
+        return aes_key_unwrap(self._kek(salt, iterations), body[20:])
+
+class KeyfileKey:
+    """
+    Keyfile-based key-encryption key for envelope encryption.
+
+    The KEK is derived from the keyfile content with HKDF, which is cheap
+    enough that no batching is needed.
+    """
+    slot_type = SLOT_KEYFILE
+
+    def __init__(self, keyfile_path: str):
+        """
+        Initializes the KeyfileKey.
+
+        Args:
+            keyfile_path (str): Path to a file of at least 32 random bytes.
+        """
+        with open(keyfile_path, 'rb') as keyfile:
+            self.secret = keyfile.read()
+        if len(self.secret) < 32:
+            raise ValueError("Keyfile must contain at least 32 bytes.")
+        self.salt = None
+
+    def _kek(self, salt: bytes) -> bytes:
+        return HKDF(algorithm=hashes.SHA256(), length=32, salt=salt,
+                    info=b"fenc keyfile kek").derive(self.secret)
+
+    def wrap(self, data_key: bytes) -> bytes:
+        salt = generate_salt()
+        return salt + aes_key_wrap(self._kek(salt), data_key)
+
+    def unwrap(self, body: bytes) -> bytes:
+        return aes_key_unwrap(self._kek(body[:16]), body[16:])
+
+class MasterKey(KeyfileKey):
+    """
+    Key-encryption key derived from an in-memory master key with HKDF.
+
+    Used for the per-file archives of an encrypted mirror, where a worker
+    pool encrypts thousands of files under one master key.
+    """
+    slot_type = SLOT_MASTER
+
+    def __init__(self, secret: bytes):
+        """
+        Initializes the MasterKey.
+
+        Args:
+            secret (bytes): At least 32 random bytes.
+        """
+        if len(secret) < 32:
+            raise ValueError("Master key must contain at least 32 bytes.")
+        self.secret = secret
+        self.salt = None
+
+    def _kek(self, salt: bytes) -> bytes:
+        return HKDF(algorithm=hashes.SHA256(), length=32, salt=salt,
+                    info=b"fenc master kek").derive(self.secret)
+
+def _x25519_kek(shared_secret: bytes, ephemeral_public: bytes, recipient_public: bytes) -> bytes:
+    """Derives the KEK of an X25519 key slot from the agreed secret."""
+    return HKDF(algorithm=hashes.SHA256(), length=32, salt=ephemeral_public + recipient_public,
+                info=b"fenc x25519 kek").derive(shared_secret)
+
+def _raw_public(public_key: X25519PublicKey) -> bytes:
+    return public_key.public_bytes(serialization.Encoding.Raw, serialization.PublicFormat.Raw)
+
+class RecipientKey:
+    """
+    X25519 public key of an archive recipient.
+
+    Each archive gets a fresh ephemeral key pair; the data key is wrapped
+    under a KEK derived from the ephemeral-static key agreement. Encrypting
+    therefore needs no password, no KDF run and no decryption secret.
+    """
+    slot_type = SLOT_X25519
+
+    def __init__(self, public_key: X25519PublicKey):
+        self.public_key = public_key
+        self.salt = None
+
+    @classmethod
+    def load(cls, path: str):
+        """Loads a recipient from a PEM public key file written by generate_keypair()."""
+        with open(path, 'rb') as key_file:
+            public_key = serialization.load_pem_public_key(key_file.read())
+        if not isinstance(public_key, X25519PublicKey):
+            raise ValueError(f"Not an X25519 public key: {path}")
+        return cls(public_key)
+
+    def wrap(self, data_key: bytes) -> bytes:
+        ephemeral = X25519PrivateKey.generate()
+        ephemeral_public = _raw_public(ephemeral.public_key())
+        kek = _x25519_kek(ephemeral.exchange(self.public_key), ephemeral_public,
+                          _raw_public(self.public_key))
+        return ephemeral_public + aes_key_wrap(kek, data_key)
+
+    def unwrap(self, body: bytes) -> bytes:
+        raise InvalidUnwrap()
+
+class IdentityKey(RecipientKey):
+    """X25519 private key that opens archives encrypted to its public key."""
+    def __init__(self, private_key: X25519PrivateKey):
+        super().__init__(private_key.public_key())
+        self.private_key = private_key
+
+    @classmethod
+    def load(cls, path: str):
+        """Loads an identity from a PEM private key file written by generate_keypair()."""
+        with open(path, 'rb') as key_file:
+            private_key = serialization.load_pem_private_key(key_file.read(), password=None)
+        if not isinstance(private_key, X25519PrivateKey):
+            raise ValueError(f"Not an X25519 private key: {path}")
+        return cls(private_key)
+
+    def unwrap(self, body: bytes) -> bytes:
+        ephemeral_public = body[:32]
+        shared_secret = self.private_key.exchange(X25519PublicKey.from_public_bytes(ephemeral_public))
+        kek = _x25519_kek(shared_secret, ephemeral_public, _raw_public(self.public_key))
+        return aes_key_unwrap(kek, body[32:])
+
+def generate_keypair(private_path: str, public_path: str):
     """
-    Encrypts a file using AES in CBC mode with PBKDF2 key derivation.
+    Creates an X25519 key pair for recipient encryption.
 
     Args:
-        input_path (str): Path to the file to encrypt.
-        output_path (str): Path where the encrypted file will be saved.
-        password (str): The password for encryption.
-        export_hashes (bool): If True, exports the salt to a .salt file.
+        private_path (str): Where to write the PEM private key (mode 0600).
+        public_path (str): Where to write the PEM public key.
+    """
+    private_key = X25519PrivateKey.generate()
+    private_pem = private_key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                            serialization.NoEncryption())
+    fd = os.open(private_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, 'wb') as key_file:
+        key_file.write(private_pem)
+    with open(public_path, 'wb') as key_file:
+        key_file.write(private_key.public_key().public_bytes(serialization.Encoding.PEM,
+                                                             serialization.PublicFormat.SubjectPublicKeyInfo))
+
+def as_key(password):
+    """Returns password as a key object, wrapping plain strings in PasswordKey."""
+    return PasswordKey(password) if isinstance(password, str) else password
+
+def _encryption_keys(password, recipients) -> list:
+    """Returns the key objects that get a slot in a new archive."""
+    keys = [as_key(password)] if password else []
+    for recipient in recipients or []:
+        keys.append(RecipientKey.load(recipient) if isinstance(recipient, str) else recipient)
+    if not keys:
+        raise ValueError("A password, keyfile or recipient is required for encryption.")
+    return keys
+
+class ArchiveHeader:
+    """The fixed header and key slots at the start of an envelope archive."""
+    def __init__(self, cipher: int, segment_size: int, nonce_prefix: bytes, slots: list):
+        self.cipher = cipher
+        self.segment_size = segment_size
+        self.nonce_prefix = nonce_prefix
+        self.slots = slots
+        self.slot_offsets = []
+
+    def fixed_bytes(self) -> bytes:
+        """Returns the fixed header, which is the AAD of every segment."""
+        return FIXED_HEADER.pack(MAGIC, FORMAT_VERSION, self.cipher, self.segment_size, self.nonce_prefix)
+
+    def pack(self) -> bytes:
+        """Serialises the header and key slots."""
+        parts = [self.fixed_bytes(), bytes([len(self.slots)])]
+        for slot_type, body in self.slots:
+            parts.append(SLOT_HEADER.pack(slot_type, len(body)))
+            parts.append(body)
+        return b"".join(parts)
+
+    @classmethod
+    def read(cls, infile, magic: bytes = None):
+        """
+        Reads a header from a stream.
+
+        Args:
+            infile: Readable binary stream positioned at the header.
+            magic (bytes, optional): The first MAGIC bytes, if already consumed.
+        """
+        fixed = (magic or b"") + _read_exact(infile, FIXED_HEADER.size - len(magic or b""))
+        if len(fixed) != FIXED_HEADER.size:
+            raise ValueError("Encrypted file header is truncated.")
+        magic, version, cipher, segment_size, nonce_prefix = FIXED_HEADER.unpack(fixed)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError("Unsupported encrypted file version.")
+        slots = []
+        slot_offsets = []
+        offset = FIXED_HEADER.size + 1
+        (slot_count,) = _read_exact(infile, 1)
+        for _ in range(slot_count):
+            slot_type, length = SLOT_HEADER.unpack(_read_exact(infile, SLOT_HEADER.size))
+            slots.append((slot_type, _read_exact(infile, length)))
+            slot_offsets.append(offset)
+            offset += SLOT_HEADER.size + length
+        header = cls(cipher, segment_size, nonce_prefix, slots)
+        header.slot_offsets = slot_offsets
+        return header
+
+    def unlock(self, key) -> bytes:
+        """Returns the data key from the first slot the key can open."""
+        return self.unlock_slot(key)[1]
+
+    def unlock_slot(self, key) -> tuple:
+        """Returns (slot_index, data_key) for the first slot the key can open."""
+        for index, (slot_type, body) in enumerate(self.slots):
+            if slot_type != key.slot_type:
+                continue
+            try:
+                return index, key.unwrap(body)
+            except InvalidUnwrap:
+                continue
+        raise ValueError("Incorrect password or corrupted file.")
+
+def _new_aead(cipher: int, data_key: bytes):
+    """Returns the AEAD object for a header cipher id."""
+    if cipher == CIPHER_AES_GCM:
+        return AESGCM(data_key)
+    if cipher == CIPHER_CHACHA20_POLY1305:
+        return ChaCha20Poly1305(data_key)
+    raise ValueError(f"Unsupported cipher id {cipher} in encrypted file.")
+
+_preferred_cipher = None
+
+def _cpu_has_aes():
+    """Returns True or False from /proc/cpuinfo on Linux, or None where it cannot tell."""
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        with open("/proc/cpuinfo") as cpuinfo:
+            for line in cpuinfo:
+                # x86 lists "flags", ARM lists "Features"; both call it "aes".
+                name, _, value = line.partition(":")
+                if name.strip() in ("flags", "Features"):
+                    return "aes" in value.split()
+    except OSError:
+        pass
+    return None
+
+def _benchmark_cipher(cipher: int) -> float:
+    """Returns the seconds one AEAD takes to seal CIPHER_BENCHMARK_BYTES."""
+    aead = _new_aead(cipher, os.urandom(DATA_KEY_SIZE))
+    data = bytes(CIPHER_BENCHMARK_BYTES)
+    aead.encrypt(os.urandom(12), data[:4096], None)  # warm up
+    start = time.perf_counter()
+    aead.encrypt(os.urandom(12), data, None)
+    return time.perf_counter() - start
+
+def preferred_cipher() -> int:
+    """
+    Returns the cipher id new archives use by default.
+
+    FOLDER_ENC_CIPHER ("aes-gcm" or "chacha20-poly1305") forces a cipher.
+    Otherwise AES-GCM is used when the CPU reports AES instructions, and
+    ChaCha20-Poly1305 when it reports none; if the CPU cannot be inspected
+    both are benchmarked once and the faster one is kept for the process.
+    """
+    global _preferred_cipher
+    forced = os.environ.get(CIPHER_ENV)
+    if forced:
+        return cipher_id(forced)
+    if _preferred_cipher is None:
+        has_aes = _cpu_has_aes()
+        if has_aes is None:
+            has_aes = _benchmark_cipher(CIPHER_AES_GCM) <= _benchmark_cipher(CIPHER_CHACHA20_POLY1305)
+        _preferred_cipher = CIPHER_AES_GCM if has_aes else CIPHER_CHACHA20_POLY1305
+    return _preferred_cipher
+
+def cipher_id(cipher) -> int:
+    """Resolves a cipher name, id or None ("auto") to a header cipher id."""
+    if cipher is None or cipher == "auto":
+        return preferred_cipher()
+    if cipher in CIPHERS.values():
+        return cipher
+    if cipher in CIPHERS:
+        return CIPHERS[cipher]
+    raise ValueError(f"Unknown cipher {cipher!r}; expected one of {', '.join(CIPHERS)} or auto.")
+
+def _segment_nonce(nonce_prefix: bytes, counter: int, last: bool) -> bytes:
+    """Builds the 12-byte nonce of a segment: prefix, counter, last-segment flag."""
+    if counter >= MAX_SEGMENTS:
+        raise ValueError("Input is too large for the segment size.")
+    return nonce_prefix + struct.pack(">IB", counter, 1 if last else 0)
+
+def encrypt_stream(infile, outfile, password, progress_callback=None, chunk_size: int = 65536,
+                   total_size: int = None, report=None, recipients=None, cipher=None) -> bytes:
+    """
+    Encrypts a binary stream in the envelope format.
+
+    A random data key encrypts the payload as AES-256-GCM or ChaCha20-Poly1305 segments of
+    chunk_size bytes; the data key is stored wrapped under the password (or
+    keyfile) key and under each recipient's public key. The input is read sequentially until EOF, so pipes and
+    other unseekable streams of unknown length are supported.
+
+    Args:
+        infile: Readable binary file-like object.
+        outfile: Writable binary file-like object.
+        password (str | PasswordKey | KeyfileKey): The password, or a key shared by a
+                                                   batch. May be None with recipients.
         progress_callback (callable, optional): A function to call with
-                                                 (current_progress_percentage).
-        
+                                                 (processed_bytes, total_size);
+                                                 total_size is None if unknown.
+        chunk_size (int): Plaintext bytes per encrypted segment.
+        total_size (int, optional): Size of the input, if known.
+        report (JobReport, optional): Receives "kdf" and "encrypt" stage timings.
+        recipients (list, optional): RecipientKey objects or PEM public key paths.
+        cipher (str | int, optional): "aes-gcm", "chacha20-poly1305" or "auto"
+                                      (default) to pick the faster one for this CPU.
+
+    Returns:
+        bytes: The password salt recorded in the header, or None without a password.
     """
-    salt = generate_salt()
-    key = derive_key(password, salt)
-    iv = os.urandom(16)
+    stage = stage_timer(report)
+    cipher = cipher_id(cipher)
+    keys = _encryption_keys(password, recipients)
+    data_key = AESGCM.generate_key(bit_length=256)
+    with stage("kdf"):
+        slots = [(key.slot_type, key.wrap(data_key)) for key in keys]
+    header = ArchiveHeader(cipher, chunk_size, os.urandom(NONCE_PREFIX_SIZE), slots)
+    aead = _new_aead(header.cipher, data_key)
 
-    cipher = Cipher(algorithms.AES(key), modes.CBC(iv), backend=default_backend())
-    encryptor = cipher.encryptor()
-    padder = padding.PKCS7(algorithms.AES.block_size).padder()
+    with stage("encrypt", files=1) as record:
+        outfile.write(header.pack())
+        record["bytes"] = _encrypt_segments(infile, outfile, aead, header, progress_callback, total_size)
+    return keys[0].salt
 
-    file_size = os.path.getsize(input_path)
-    chunk_size = 65536
+def _encrypt_segments(infile, outfile, aead, header: ArchiveHeader, progress_callback=None,
+                      total_size: int = None, nonce_prefix: bytes = None) -> int:
+    """Writes the payload segments and returns the number of plaintext bytes."""
+    aad = header.fixed_bytes()
+    nonce_prefix = nonce_prefix or header.nonce_prefix
     processed_bytes = 0
+    counter = 0
+    chunk = _read_exact(infile, header.segment_size)
+    while True:
+        # Read one segment ahead so the last one can be flagged in its nonce.
+        next_chunk = _read_exact(infile, header.segment_size) if len(chunk) == header.segment_size else b""
+        last = not next_chunk
+        nonce = _segment_nonce(nonce_prefix, counter, last)
+        throttle_io(len(chunk))
+        outfile.write(aead.encrypt(nonce, chunk, aad))
+        processed_bytes += len(chunk)
+        counter += 1
+        if progress_callback:
+            progress_callback(processed_bytes, total_size)
+        if last:
+            return processed_bytes
+        chunk = next_chunk
+
+def decrypt_stream(infile, outfile, password, salt: bytes = None, progress_callback=None,
+                   chunk_size: int = 65536, total_size: int = None, report=None):
+    """
+    Decrypts a binary stream produced by encrypt_stream().
 
-    with open(input_path, 'rb') as infile, open(output_path, 'wb') as outfile:
-        outfile.write(salt)
-        outfile.write(iv)
+    Streams written by earlier versions (salt + IV + AES-CBC) are detected
+    and decrypted too. A seekable infile may also be an indexed archive
+    with a single part; archives with more parts need decrypt_file_parts().
 
+    Args:
+        infile: Readable binary file-like object, positioned at the header.
+        outfile: Writable binary file-like object.
+        password (str | PasswordKey | KeyfileKey | IdentityKey): The password, a key
+                                                               shared by a batch, or a
+                                                               recipient's private key.
+        salt (bytes, optional): Salt to use instead of the one in the header.
+        progress_callback (callable, optional): A function to call with
+                                                 (processed_bytes, total_size);
+                                                 total_size is None if unknown.
+        chunk_size (int): Number of bytes read and decrypted at a time (legacy files).
+        total_size (int, optional): Size of the encrypted input, if known.
+        report (JobReport, optional): Receives "kdf" and "decrypt" stage timings.
+    """
+    stage = stage_timer(report)
+    magic = _read_exact(infile, len(MAGIC))
+    if magic != MAGIC:
+        _decrypt_legacy_stream(infile, outfile, password, magic, salt, progress_callback,
+                               chunk_size, total_size, report)
+        return
+
+    header = ArchiveHeader.read(infile, magic)
+    key = as_key(password)
+    if salt is not None and isinstance(key, PasswordKey):
+        key = PasswordKey(key.password, key.iterations, salt=salt)
+    with stage("kdf"):
+        data_key = header.unlock(key)
+    aead = _new_aead(header.cipher, data_key)
+
+    header_size = len(header.pack())
+    nonce_prefix = None
+    if _is_seekable(infile) and infile.tell() == header_size:
+        # Appended and distributed archives end with a part index that is
+        # not part of the payload; read just the single part in front of it.
+        parts = _read_parts(infile, header, aead, infile.seek(0, os.SEEK_END))
+        if len(parts) > 1:
+            raise ValueError(f"The archive has {len(parts)} parts and cannot be decrypted as one "
+                             f"stream; use decrypt_file_parts().")
+        infile.seek(parts[0]["offset"])
+        infile = _LimitedReader(infile, parts[0]["length"])
+        nonce_prefix = bytes.fromhex(parts[0]["nonce_prefix"])
+
+    with stage("decrypt", files=1) as record:
+        record["bytes"] = _decrypt_segments(infile, outfile, aead, header, progress_callback,
+                                            total_size, header_size, nonce_prefix)
+
+def _is_seekable(f) -> bool:
+    """Returns True for files, volume sets and S3 objects, False for pipes."""
+    seekable = getattr(f, "seekable", None)
+    return seekable() if seekable else hasattr(f, "seek")
+
+def _decrypt_segments(infile, outfile, aead, header: ArchiveHeader, progress_callback=None,
+                      total_size: int = None, header_size: int = 0, nonce_prefix: bytes = None) -> int:
+    """Authenticates and writes the payload segments; returns the ciphertext bytes read."""
+    aad = header.fixed_bytes()
+    nonce_prefix = nonce_prefix or header.nonce_prefix
+    segment = header.segment_size + TAG_SIZE
+    processed_bytes = header_size
+    counter = 0
+    chunk = _read_exact(infile, segment)
+    while True:
+        next_chunk = _read_exact(infile, segment) if len(chunk) == segment else b""
+        last = not next_chunk
+        if len(chunk) < TAG_SIZE:
+            raise ValueError("Encrypted file is truncated.")
+        throttle_io(len(chunk))
+        try:
+            plaintext = aead.decrypt(_segment_nonce(nonce_prefix, counter, last), chunk, aad)
+        except InvalidTag:
+            raise ValueError("Encrypted file is corrupted or truncated.")
+        if outfile is not None:
+            outfile.write(plaintext)
+        processed_bytes += len(chunk)
+        counter += 1
+        if progress_callback:
+            progress_callback(processed_bytes, total_size)
+        if last:
+            return processed_bytes - header_size
+        chunk = next_chunk
+
+def _decrypt_legacy_stream(infile, outfile, password, header_start: bytes, salt: bytes = None,
+                           progress_callback=None, chunk_size: int = 65536, total_size: int = None,
+                           report=None):
+    """Decrypts the legacy salt + IV + AES-CBC layout."""
+    stage = stage_timer(report)
+    header = header_start + _read_exact(infile, 32 - len(header_start))
+    header_salt, iv = header[:16], header[16:32]
+    salt = salt if salt is not None else header_salt
+
+    if len(salt) != 16 or len(iv) != 16:
+        raise ValueError("Invalid salt or IV length in encrypted file.")
+
+    if not isinstance(password, str):
+        if not isinstance(password, PasswordKey):
+            raise ValueError("Legacy encrypted files can only be opened with a password.")
+        password = password.password
+    with stage("kdf"):
+        key = derive_key(password, salt)
+    cipher = Cipher(algorithms.AES(key), modes.CBC(iv), backend=default_backend())
+    decryptor = cipher.decryptor()
+    unpadder = padding.PKCS7(algorithms.AES.block_size).unpadder()
+    processed_bytes = 32
+
+    with stage("decrypt", files=1) as record:
         while True:
             chunk = infile.read(chunk_size)
             if not chunk:
                 break
-            padded_chunk = padder.update(chunk)
-            if padded_chunk:
-                outfile.write(encryptor.update(padded_chunk))
+            throttle_io(len(chunk))
+            decrypted_chunk = decryptor.update(chunk)
+            if decrypted_chunk:
+                outfile.write(unpadder.update(decrypted_chunk))
             processed_bytes += len(chunk)
             if progress_callback:
-                progress_callback(processed_bytes, file_size)
+                progress_callback(processed_bytes, total_size)
 
-        final_data = padder.finalize()
-        outfile.write(encryptor.update(final_data) + encryptor.finalize())
+        try:
+            final_data = decryptor.finalize()
+            unpadded_data = unpadder.update(final_data)
+            unpadded_data += unpadder.finalize()
+            outfile.write(unpadded_data)
+        except ValueError:
+            raise ValueError("Incorrect password or corrupted file.")
+        record["bytes"] = processed_bytes - 32
 
-    if export_hashes:
-        with open(output_path + ".salt", 'wb') as hash_file:
-            hash_file.write(salt)
+class _LimitedReader:
+    """Read-only view of the next length bytes of a file."""
+    def __init__(self, fileobj, length: int):
+        self.fileobj = fileobj
+        self.remaining = length
+
+    def read(self, size: int = -1) -> bytes:
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.fileobj.read(size)
+        self.remaining -= len(data)
+        return data
+
+def _open_envelope(f, password):
+    """Reads the header of an open envelope archive and unlocks its data key."""
+    magic = _read_exact(f, len(MAGIC))
+    if magic != MAGIC:
+        raise ValueError("Only envelope archives support this operation; legacy files must be re-encrypted.")
+    header = ArchiveHeader.read(f, magic)
+    data_key = header.unlock(as_key(password))
+    return header, data_key, _new_aead(header.cipher, data_key)
+
+def _open_archive(path: str):
+    """Opens an archive with open_source(), first finishing an interrupted rekey of a local file."""
+    if is_local_path(path):
+        recover_rekey(path)
+    return open_source(path)
+
+def _read_parts(f, header: ArchiveHeader, aead, size: int = None) -> list:
+    """
+    Returns the payload parts of an open envelope archive.
+
+    Each part is a dict with the ciphertext "offset" and "length", its hex
+    "nonce_prefix" and the "entries" it added (None if unknown). Archives
+    that were never appended to have a single part running to EOF.
+
+    f must be seekable; size defaults to the size of the underlying file.
+    """
+    if size is None:
+        size = os.fstat(f.fileno()).st_size
+    header_size = len(header.pack())
+    single = [{"offset": header_size, "length": size - header_size,
+               "nonce_prefix": header.nonce_prefix.hex(), "entries": None}]
+    if size < header_size + INDEX_FOOTER.size + NONCE_PREFIX_SIZE + TAG_SIZE:
+        return single
+    f.seek(size - INDEX_FOOTER.size)
+    index_offset, magic = INDEX_FOOTER.unpack(f.read(INDEX_FOOTER.size))
+    if magic != INDEX_MAGIC or not header_size <= index_offset < size - INDEX_FOOTER.size:
+        return single
+    f.seek(index_offset)
+    nonce_prefix = f.read(NONCE_PREFIX_SIZE)
+    index = io.BytesIO()
+    _decrypt_segments(_LimitedReader(f, size - INDEX_FOOTER.size - index_offset - NONCE_PREFIX_SIZE),
+                      index, aead, header, nonce_prefix=nonce_prefix)
+    return json.loads(index.getvalue())["parts"]
+
+def _write_index(f, header: ArchiveHeader, aead, parts: list, index_offset: int = None):
+    """Appends an encrypted part index and its footer at the current position (index_offset)."""
+    if index_offset is None:
+        index_offset = f.tell()
+    nonce_prefix = os.urandom(NONCE_PREFIX_SIZE)
+    f.write(nonce_prefix)
+    _encrypt_segments(io.BytesIO(json.dumps({"parts": parts}).encode()), f, aead, header,
+                      nonce_prefix=nonce_prefix)
+    f.write(INDEX_FOOTER.pack(index_offset, INDEX_MAGIC))
 
-def decrypt_file_aes(input_path: str, output_path: str, password: str, import_hashes: bool = False, progress_callback=None):
+def new_envelope(password, recipients=None, cipher=None, chunk_size: int = 65536) -> tuple:
     """
-    Decrypts a file using AES in CBC mode with PBKDF2 key derivation.
+    Creates the header and data key of an archive whose parts are encrypted separately.
 
     Args:
-        input_path (str): Path to the encrypted file.
-        output_path (str): Path where the decrypted file will be saved.
-        password (str): The password for decryption.
+        password (str | PasswordKey | KeyfileKey): The password or key. May be
+                                                   None with recipients.
+        recipients (list, optional): RecipientKey objects or PEM public key paths.
+        cipher (str | int, optional): Forces "aes-gcm" or "chacha20-poly1305".
+        chunk_size (int): Plaintext bytes per encrypted segment.
+
+    Returns:
+        tuple: (ArchiveHeader, data key) for encrypt_part() and write_indexed_archive().
+    """
+    data_key = AESGCM.generate_key(bit_length=256)
+    slots = [(key.slot_type, key.wrap(data_key)) for key in _encryption_keys(password, recipients)]
+    return ArchiveHeader(cipher_id(cipher), chunk_size, os.urandom(NONCE_PREFIX_SIZE), slots), data_key
+
+def encrypt_part(infile, outfile, header: ArchiveHeader, data_key: bytes, nonce_prefix: bytes,
+                 progress_callback=None, total_size: int = None) -> int:
+    """
+    Encrypts one payload part for an archive created with new_envelope().
+
+    Only the fixed header fields are used, so a worker that was sent the
+    cipher, segment size, header nonce prefix and data key can encrypt a
+    part without the key slots.
+
+    Returns:
+        int: The number of plaintext bytes encrypted.
+    """
+    return _encrypt_segments(infile, outfile, _new_aead(header.cipher, data_key), header,
+                             progress_callback, total_size, nonce_prefix=nonce_prefix)
+
+def write_indexed_archive(outfile, header: ArchiveHeader, data_key: bytes, parts: list, chunk_size: int = 1024 * 1024):
+    """
+    Writes an archive from separately encrypted parts, followed by its part index.
+
+    The result is read like an appended archive: decrypt_file_parts()
+    returns one plaintext file per part, in order.
+
+    Args:
+        outfile: Writable binary file-like object or sink; tell() is not needed.
+        header (ArchiveHeader): From new_envelope().
+        data_key (bytes): From new_envelope().
+        parts (list): (readable ciphertext, length, nonce prefix, entries) per
+                      part, as produced by encrypt_part().
+        chunk_size (int): Bytes copied at a time.
+    """
+    packed = header.pack()
+    outfile.write(packed)
+    offset = len(packed)
+    index = []
+    for reader, length, nonce_prefix, entries in parts:
+        copied = 0
+        while copied < length:
+            data = reader.read(min(chunk_size, length - copied))
+            if not data:
+                raise ValueError("Encrypted part is truncated.")
+            outfile.write(data)
+            copied += len(data)
+        index.append({"offset": offset, "length": length, "nonce_prefix": nonce_prefix.hex(), "entries": entries})
+        offset += length
+    _write_index(outfile, header, _new_aead(header.cipher, data_key), index, index_offset=offset)
+
+@profiled()
+def append_encrypted_part(path: str, input_path: str, password, entries: list = None,
+                          progress_callback=None):
+    """
+    Appends a file as a new encrypted part of an existing archive.
+
+    The new part is encrypted under the archive's existing data key with its
+    own nonce prefix and written after everything already in the file,
+    followed by a new index that supersedes the previous one. Existing data
+    is never rewritten; if appending fails the file is truncated back.
+
+    Args:
+        path (str): Path to the envelope archive.
+        input_path (str): Plaintext file to add, usually a zip or solid archive.
+        password (str | PasswordKey | KeyfileKey | IdentityKey): Opens the archive.
+        entries (list, optional): Archive names added by this part, used to
+                                  resolve superseded entries when compacting.
+        progress_callback (callable, optional): A function to call with
+                                                 (processed_bytes, total_size).
+    """
+    recover_rekey(path)
+    with open(path, 'r+b') as f:
+        header, _, aead = _open_envelope(f, password)
+        parts = _read_parts(f, header, aead)
+        original_size = f.seek(0, os.SEEK_END)
+        try:
+            used = {part["nonce_prefix"] for part in parts}
+            nonce_prefix = os.urandom(NONCE_PREFIX_SIZE)
+            while nonce_prefix.hex() in used:
+                nonce_prefix = os.urandom(NONCE_PREFIX_SIZE)
+            with open(input_path, 'rb') as infile:
+                _encrypt_segments(infile, f, aead, header, progress_callback,
+                                  os.path.getsize(input_path), nonce_prefix=nonce_prefix)
+            parts.append({"offset": original_size, "length": f.tell() - original_size,
+                          "nonce_prefix": nonce_prefix.hex(), "entries": entries})
+            _write_index(f, header, aead, parts)
+            f.flush()
+            os.fsync(f.fileno())
+        except BaseException:
+            f.truncate(original_size)
+            raise
+
+@profiled()
+def decrypt_file_parts(input_path: str, output_path: str, password, import_hashes: bool = False,
+                       progress_callback=None, chunk_size: int = 65536, report=None) -> list:
+    """
+    Decrypts every part of an archive, including parts added by appending.
+
+    The first part is written to output_path and part n to output_path.n;
+    extracting them in order gives the newest version of every entry.
+
+    Args:
+        input_path (str): Path, volume set base path or s3://bucket/key URL of the file.
+        output_path (str): Path for the first decrypted part.
+        password (str | PasswordKey | KeyfileKey | IdentityKey): Opens the archive.
         import_hashes (bool): If True, imports the salt from a .salt file.
+        progress_callback (callable, optional): A function to call with
+                                                 (processed_bytes, total_size).
+        chunk_size (int): Number of bytes read and decrypted at a time (legacy files).
+        report (JobReport, optional): Receives "kdf" and "decrypt" stage timings.
+
+    Returns:
+        list: Paths of the decrypted parts, oldest first.
+    """
+    stage = stage_timer(report)
+    source, total_size = _open_archive(input_path)
+    with source as f:
+        if _read_exact(f, len(MAGIC)) != MAGIC or import_hashes or not hasattr(f, "seek"):
+            parts = None
+        else:
+            f.seek(0)
+            # The data key unlocked here decrypts every part, so the
+            # password is only run through PBKDF2 once.
+            with stage("kdf"):
+                header, _, aead = _open_envelope(f, password)
+            parts = _read_parts(f, header, aead, total_size)
+    if parts is None:
+        decrypt_file_aes(input_path, output_path, password, import_hashes=import_hashes,
+                         progress_callback=progress_callback, chunk_size=chunk_size, report=report)
+        return [output_path]
+
+    outputs = []
+    done = 0
+    source, _ = open_source(input_path)
+    with source as f, stage("decrypt", files=len(parts)) as record:
+        try:
+            for number, part in enumerate(parts):
+                part_path = output_path if number == 0 else f"{output_path}.{number}"
+                f.seek(part["offset"])
+                offset = done
+                def part_progress(processed, _total, offset=offset):
+                    if progress_callback:
+                        progress_callback(offset + processed, total_size)
+                outputs.append(part_path)
+                with open(part_path, 'wb') as outfile:
+                    done += _decrypt_segments(_LimitedReader(f, part["length"]), outfile, aead, header,
+                                              part_progress, nonce_prefix=bytes.fromhex(part["nonce_prefix"]))
+        except BaseException:
+            # Do not leave unauthenticated plaintext behind.
+            for part_path in outputs:
+                if os.path.exists(part_path):
+                    os.remove(part_path)
+            raise
+        record["bytes"] = done
+    return outputs
+
+@profiled()
+def replace_payload(path: str, input_path: str, password, progress_callback=None):
+    """
+    Re-encrypts an archive with a new payload, keeping its key slots.
+
+    Used to compact appended archives: the data key and every password,
+    keyfile and recipient slot stay valid, only the payload (and nonce
+    prefix) change. The new file is written beside the old one and moved
+    over it atomically.
+
+    Args:
+        path (str): Path to the envelope archive.
+        input_path (str): New plaintext payload.
+        password (str | PasswordKey | KeyfileKey | IdentityKey): Opens the archive.
+        progress_callback (callable, optional): A function to call with
+                                                 (processed_bytes, total_size).
+    """
+    recover_rekey(path)
+    with open(path, 'rb') as f:
+        header, data_key, _ = _open_envelope(f, password)
+    header = ArchiveHeader(header.cipher, header.segment_size, os.urandom(NONCE_PREFIX_SIZE), header.slots)
+    aead = _new_aead(header.cipher, data_key)
+    temp_path = path + ".compact.tmp"
+    try:
+        with open(input_path, 'rb') as infile, open(temp_path, 'wb') as outfile:
+            outfile.write(header.pack())
+            _encrypt_segments(infile, outfile, aead, header, progress_callback, os.path.getsize(input_path))
+            outfile.flush()
+            os.fsync(outfile.fileno())
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+class _HashingWriter:
+    """Passes writes through to a sink while hashing them."""
+    def __init__(self, sink, hasher):
+        self.sink = sink
+        self.hasher = hasher
+
+    def write(self, data) -> int:
+        self.hasher.update(data)
+        return self.sink.write(data)
+
+class _HashingReader:
+    """Hashes everything read from a file object."""
+    def __init__(self, fileobj, hasher):
+        self.fileobj = fileobj
+        self.hasher = hasher
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.fileobj.read(size)
+        self.hasher.update(data)
+        return data
+
+def _ciphertext_hasher():
+    return hashlib.blake2b(digest_size=32)
+
+def _drop_cached(path: str):
+    """Evicts a local file from the page cache, so it is read back from disk."""
+    if not hasattr(os, "posix_fadvise") or not is_local_path(path):
+        return
+    try:
+        with open(path, 'rb') as f:
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+    except OSError:
+        pass
+
+@profiled()
+def verify_encrypted_file(path: str, password=None, expected_digest: str = None,
+                          progress_callback=None, report=None):
+    """
+    Reads an encrypted file back and checks that it can be opened and authenticated.
+
+    Every segment tag is checked, but nothing is written and the payload is
+    not decompressed, so this is much cheaper than a test restore. Local
+    files are evicted from the page cache first where supported, so the
+    check sees what actually reached the disk.
+
+    Args:
+        path (str): Path, volume set base path or s3://bucket/key URL of the file.
+        password (str | PasswordKey | KeyfileKey | IdentityKey, optional): Opens the
+                 archive. Without it only expected_digest is checked.
+        expected_digest (str, optional): BLAKE2b-256 hex digest of the ciphertext,
+                                         as returned by encrypt_file_aes(ciphertext_digest=True).
+        progress_callback (callable, optional): A function to call with
+                                                 (processed_bytes, total_size).
+        report (JobReport, optional): Receives a "verify" stage timing.
+
+    Raises:
+        ValueError: If the file cannot be authenticated or does not match the digest.
+    """
+    if password is None and expected_digest is None:
+        raise ValueError("Verifying needs a password or key, or an expected digest.")
+    stage = stage_timer(report)
+    _drop_cached(path)
+    infile, total_size = _open_archive(path)
+    hasher = _ciphertext_hasher()
+    reader = _HashingReader(infile, hasher)
+    with infile, stage("verify", total_size, 1):
+        if password is not None:
+            magic = _read_exact(reader, len(MAGIC))
+            if magic != MAGIC:
+                raise ValueError("Only envelope archives can be verified.")
+            header = ArchiveHeader.read(reader, magic)
+            aead = _new_aead(header.cipher, header.unlock(as_key(password)))
+            header_size = len(header.pack())
+            if hasattr(infile, "seek"):
+                parts = _read_parts(infile, header, aead, total_size)
+                if expected_digest and len(parts) > 1:
+                    raise ValueError("Encrypted file was appended to after it was written.")
+                # Each part is read up to its length only: an indexed archive
+                # continues with its index, which is not part of any payload.
+                # A single part is read in order, so the digest stays intact.
+                for part in parts:
+                    infile.seek(part["offset"])
+                    _decrypt_segments(_LimitedReader(reader, part["length"]), None, aead, header,
+                                      progress_callback, total_size, part["offset"],
+                                      bytes.fromhex(part["nonce_prefix"]))
+                if len(parts) > 1:
+                    return
+            else:
+                _decrypt_segments(reader, None, aead, header, progress_callback, total_size, header_size)
+        while True:
+            chunk = reader.read(VERIFY_CHUNK_SIZE)
+            if not chunk:
+                break
+            throttle_io(len(chunk))
+    if expected_digest and hasher.hexdigest() != expected_digest:
+        raise ValueError("Encrypted file does not match what was written.")
+
+def _read_exact(infile, size: int) -> bytes:
+    """Reads exactly size bytes unless EOF is reached; pipes may return short reads."""
+    data = b""
+    while len(data) < size:
+        chunk = infile.read(size - len(data))
+        if not chunk:
+            break
+        data += chunk
+    return data
+
+def rekey_file(path: str, old_password, new_password):
+    """
+    Changes the password (or keyfile) of an archive without touching its payload.
+
+    The data key is unwrapped with the old key and re-wrapped under the new
+    one, and only that key slot is rewritten, so the change takes
+    milliseconds regardless of the archive size. Other key slots are kept.
+    The new slot is first written and fsynced to a journal next to the
+    archive and only then written in place; if the rekey is interrupted,
+    recover_rekey() (run by this module before opening an archive by path)
+    finishes it, so the archive opens with either the old or the new key,
+    never with neither.
+
+    A .salt file exported for the old password is updated to the new
+    password's salt, or removed if the new key is not a password.
+
+    Args:
+        path (str): Path to the encrypted file.
+        old_password (str | PasswordKey | KeyfileKey): The current password or key.
+        new_password (str | PasswordKey | KeyfileKey): The new password or key.
+
+    Raises:
+        ValueError: For legacy files, a wrong old password, or if the new key's
+                    slot does not have the same size as the old one.
+    """
+    recover_rekey(path)
+    old_key = as_key(old_password)
+    new_key = as_key(new_password)
+    with open(path, 'rb') as f:
+        magic = _read_exact(f, len(MAGIC))
+        if magic != MAGIC:
+            raise ValueError("Legacy encrypted files cannot be rekeyed; decrypt and encrypt them again.")
+        header = ArchiveHeader.read(f, magic)
+    index, data_key = header.unlock_slot(old_key)
+    old_slot_type, old_body = header.slots[index]
+    new_body = new_key.wrap(data_key)
+    if len(new_body) != len(old_body):
+        raise ValueError("The new key needs a different slot size; decrypt and encrypt the file again.")
+
+    old_slot = SLOT_HEADER.pack(old_slot_type, len(old_body)) + old_body
+    new_slot = SLOT_HEADER.pack(new_key.slot_type, len(new_body)) + new_body
+    journal = REKEY_JOURNAL.pack(REKEY_MAGIC, header.slot_offsets[index], len(new_slot)) + old_slot + new_slot
+    journal_path = path + REKEY_JOURNAL_SUFFIX
+    with open(journal_path, 'wb') as f:
+        f.write(journal + hashlib.sha256(journal).digest())
+        f.flush()
+        os.fsync(f.fileno())
+    _fsync_directory(journal_path)
+    _apply_rekey_journal(path, header.slot_offsets[index], old_slot, new_slot)
+
+def recover_rekey(path: str) -> bool:
+    """
+    Finishes a rekey_file() that was interrupted, using its journal.
+
+    A journal that was not completely written is discarded: the archive was
+    not touched yet and still opens with the old key.
+
+    Args:
+        path (str): Path to the encrypted file.
+
+    Returns:
+        bool: True if an interrupted rekey was completed.
+    """
+    journal_path = path + REKEY_JOURNAL_SUFFIX
+    try:
+        with open(journal_path, 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return False
+    journal, digest = data[:-32], data[-32:]
+    if len(journal) < REKEY_JOURNAL.size or hashlib.sha256(journal).digest() != digest:
+        os.remove(journal_path)
+        return False
+    magic, offset, slot_size = REKEY_JOURNAL.unpack(journal[:REKEY_JOURNAL.size])
+    slots = journal[REKEY_JOURNAL.size:]
+    if magic != REKEY_MAGIC or len(slots) != 2 * slot_size:
+        raise ValueError(f"Unreadable rekey journal: {journal_path}")
+    _apply_rekey_journal(path, offset, slots[:slot_size], slots[slot_size:])
+    return True
+
+def _apply_rekey_journal(path: str, offset: int, old_slot: bytes, new_slot: bytes):
+    """Writes a journaled key slot in place, updates the .salt file and drops the journal."""
+    with open(path, 'r+b') as f:
+        f.seek(offset)
+        f.write(new_slot)
+        f.flush()
+        os.fsync(f.fileno())
+    old_type, new_type = old_slot[0], new_slot[0]
+    if old_type == SLOT_PASSWORD:
+        new_salt = new_slot[SLOT_HEADER.size + 4:SLOT_HEADER.size + 20] if new_type == SLOT_PASSWORD else None
+        _update_salt_file(path, old_slot[SLOT_HEADER.size + 4:SLOT_HEADER.size + 20], new_salt)
+    os.remove(path + REKEY_JOURNAL_SUFFIX)
+
+def _fsync_directory(path: str):
+    """Makes a newly created file's directory entry durable, where the OS allows it."""
+    if os.name == "nt":
+        return
+    fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def _update_salt_file(path: str, old_salt: bytes, new_salt: bytes):
+    """Replaces an exported .salt file that holds old_salt after a rekey, or removes it if new_salt is None."""
+    salt_path = path + ".salt"
+    try:
+        with open(salt_path, 'rb') as salt_file:
+            if salt_file.read() != old_salt:
+                return
+    except FileNotFoundError:
+        return
+    if new_salt is None:
+        os.remove(salt_path)
+        return
+    temp_path = salt_path + ".tmp"
+    with open(temp_path, 'wb') as salt_file:
+        salt_file.write(new_salt)
+        salt_file.flush()
+        os.fsync(salt_file.fileno())
+    os.replace(temp_path, salt_path)
+
+@profiled()
+def encrypt_file_aes(input_path: str, output_path: str, password, export_hashes: bool = False, progress_callback=None,
+                     chunk_size: int = 65536, report=None, recipients=None, volume_size: int = None,
+                     cipher=None, ciphertext_digest: bool = False, memory_budget=None):
+    """
+    Encrypts a file with an AEAD under a random data key wrapped by the password.
+
+    Args:
+        input_path (str): Path to the file to encrypt.
+        output_path (str): Path or s3://bucket/key URL where the encrypted file will be saved.
+        password (str | PasswordKey | KeyfileKey): The password, or a key shared by a
+                                                   batch. May be None with recipients.
+        export_hashes (bool): If True, exports the salt to a .salt file.
         progress_callback (callable, optional): A function to call with
                                                  (current_progress_percentage).
+        chunk_size (int): Plaintext bytes per encrypted segment.
+        report (JobReport, optional): Receives "kdf", "encrypt" and "fsync" stage timings.
+        recipients (list, optional): RecipientKey objects or PEM public key paths.
+        volume_size (int, optional): If set, split the output into volumes
+                                     output_path.000, .001, ... of this many bytes.
+        cipher (str | int, optional): Forces "aes-gcm" or "chacha20-poly1305";
+                                      by default the faster one for this CPU.
+        ciphertext_digest (bool): If True, hash the ciphertext as it is written.
+        memory_budget (MemoryBudget, optional): If given, bounds the parts buffered
+                                                for an S3 upload.
+
+    Returns:
+        str: The BLAKE2b-256 hex digest of the written file for
+             verify_encrypted_file() if ciphertext_digest is set, else None.
     """
+    if export_hashes and (volume_size or not is_local_path(output_path)):
+        raise ValueError("Exporting the salt needs a single local output file.")
+    stage = stage_timer(report)
+    file_size = os.path.getsize(input_path)
+
+    hasher = _ciphertext_hasher() if ciphertext_digest else None
     with open(input_path, 'rb') as infile:
-        if import_hashes:
-            hash_file_path = input_path + ".salt"
-            if not os.path.exists(hash_file_path):
-                raise FileNotFoundError(f"Salt file not found: {hash_file_path}")
-            with open(hash_file_path, 'rb') as hf:
-                salt = hf.read()
-            iv = infile.read(16)
-        else:
-            salt = infile.read(16)
-            iv = infile.read(16)
+        sink = open_sink(output_path, volume_size, memory_budget, file_size)
+        outfile = _HashingWriter(sink, hasher) if hasher else sink
+        try:
+            salt = encrypt_stream(infile, outfile, password, progress_callback=progress_callback,
+                                  chunk_size=chunk_size, total_size=file_size, report=report,
+                                  recipients=recipients, cipher=cipher)
+        except BaseException:
+            sink.abort()
+            raise
+        # Committing flushes local files to disk or completes the upload.
+        with stage("fsync", files=1):
+            sink.commit()
 
-        if len(salt) != 16 or len(iv) != 16:
-            raise ValueError("Invalid salt or IV length in encrypted file.")
+    if export_hashes and salt:
+        with open(output_path + ".salt", 'wb') as hash_file:
+            hash_file.write(salt)
+    return hasher.hexdigest() if hasher else None
 
-        key = derive_key(password, salt)
-        cipher = Cipher(algorithms.AES(key), modes.CBC(iv), backend=default_backend())
-        decryptor = cipher.decryptor()
-        unpadder = padding.PKCS7(algorithms.AES.block_size).unpadder()
-
-        file_size = os.path.getsize(input_path) - 32 # Account for salt and IV
-        processed_bytes = 0
-
-        with open(output_path, 'wb') as outfile:
-            while True:
-                chunk = infile.read(65536)
-                if not chunk:
-                    break
-                decrypted_chunk = decryptor.update(chunk)
-                if decrypted_chunk:
-                    outfile.write(unpadder.update(decrypted_chunk))
-                processed_bytes += len(chunk)
-                if progress_callback:
-                    progress_callback(processed_bytes, file_size)
+@profiled()
+def decrypt_file_aes(input_path: str, output_path: str, password, import_hashes: bool = False, progress_callback=None,
+                     chunk_size: int = 65536, report=None):
+    """
+    Decrypts a file produced by encrypt_file_aes(), including legacy AES-CBC files.
 
-            try:
-                final_data = decryptor.finalize()
-                unpadded_data = unpadder.update(final_data)
-                unpadded_data += unpadder.finalize()
-                outfile.write(unpadded_data)
-            except ValueError:
-                raise ValueError("Incorrect password or corrupted file.")
\ No newline at end of file
+    Args:
+        input_path (str): Path, volume set base path or s3://bucket/key URL of the
+                          encrypted file.
+        output_path (str): Path where the decrypted file will be saved.
+        password (str | PasswordKey | KeyfileKey | IdentityKey): The password, a key
+                                                               shared by a batch, or a
+                                                               recipient's private key.
+        import_hashes (bool): If True, imports the salt from a .salt file.
+        progress_callback (callable, optional): A function to call with
+                                                 (current_progress_percentage).
+        chunk_size (int): Number of bytes read and decrypted at a time (legacy files).
+        report (JobReport, optional): Receives "kdf" and "decrypt" stage timings.
+    """
+    if is_local_path(input_path):
+        # Finishing an interrupted rekey may replace the .salt file.
+        recover_rekey(input_path)
+    salt = None
+    if import_hashes:
+        hash_file_path = input_path + ".salt"
+        if not os.path.exists(hash_file_path):
+            raise FileNotFoundError(f"Salt file not found: {hash_file_path}")
+        with open(hash_file_path, 'rb') as hf:
+            salt = hf.read()
+
+    infile, file_size = open_source(input_path)
+    with infile, open(output_path, 'wb') as outfile:
+        decrypt_stream(infile, outfile, password, salt=salt, progress_callback=progress_callback,
+                       chunk_size=chunk_size, total_size=file_size, report=report)
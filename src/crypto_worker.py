@@ -1,10 +1,29 @@
 import os
+import multiprocessing
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from PyQt6.QtCore import Qt, QThread, pyqtSignal, QObject
 import sys
 import subprocess
 
-from .core_crypto import encrypt_file_aes, decrypt_file_aes
-from .file_operations import zip_folder, unzip_folder, delete_path
+from .catalog import Catalog
+from .core_crypto import encrypt_file_aes, decrypt_file_parts, verify_encrypted_file, as_key
+from .file_operations import (
+    scan_folder, zip_folder, tar_folder, choose_archive_format, extract_archive, delete_path,
+    export_manifest, check_source_unchanged, archive_name, verify_manifest, HASH_ALGORITHM
+)
+from .job_report import JobReport
+from .prescan import prescan_folder, ScanCancelled
+from .profiling import profile_session, profiling_directory, enable_profiling
+from .resource_limits import (
+    MemoryBudget, peak_rss, reset_peak_rss, io_concurrency, MIN_MEMORY_BUDGET_MB, job_limits
+)
+
+# Jobs running in this process. The peak RSS is process-wide, so a job
+# only reports it as its own if no other job ran at the same time.
+_running_jobs = set()
+_running_jobs_lock = threading.Lock()
 
 class CryptoWorker(QObject):
     """
@@ -15,21 +34,56 @@ class CryptoWorker(QObject):
     encryption_finished = pyqtSignal(str, str)
     decryption_finished = pyqtSignal(str, str)
     error_occurred = pyqtSignal(str)
+    report_ready = pyqtSignal(dict)
 
     def __init__(self, mode: str, path: str, password: str, output_path: str = None,
                  delete_source: bool = False, export_hashes: bool = False,
-                 import_hashes: bool = False):
+                 import_hashes: bool = False, memory_budget_mb: int = None,
+                 write_report: bool = False, deduplicate: bool = True,
+                 archive_format: str = "auto", verify_restore: bool = False,
+                 recipients: list = None, cipher: str = "auto", io_limit_mb_s: float = None,
+                 cpu_workers: int = None, low_priority: bool = False, in_subprocess: bool = False,
+                 catalog: str = None):
         """
         Initializes the CryptoWorker.
 
         Args:
             mode (str): "encrypt" or "decrypt".
             path (str): Input file or folder path.
-            password (str): Password for the operation.
+            password (str | PasswordKey | KeyfileKey | IdentityKey): Password or key for
+                                                                   the operation.
             output_path (str, optional): Output path for encrypted/decrypted file.
             delete_source (bool): Whether to delete the source after operation.
-            export_hashes (bool): Whether to export salt file during encryption.
+            export_hashes (bool): Whether to export the salt file and the per-file
+                                  hash manifest (.hashes.json) during encryption.
             import_hashes (bool): Whether to import salt file during decryption.
+            memory_budget_mb (int, optional): Memory budget for the whole job in MB.
+                                              Defaults to FOLDER_ENC_MEMORY_MB or 256.
+            write_report (bool): Whether to write the job report as JSON next to the output.
+            deduplicate (bool): Whether to store identical files only once when encrypting.
+            archive_format (str): "zip", "tar" (solid) or "auto" to choose from the
+                                  folder's file-size distribution.
+            verify_restore (bool): Whether to read restored files back and check them
+                                   against the archive's hash manifest when
+                                   decrypting. The archive is authenticated
+                                   anyway; this only catches disk or extraction
+                                   faults, at the cost of a second read of the
+                                   output, reported as a "verify_restore" stage.
+            recipients (list, optional): X25519 public key paths to encrypt to, in
+                                         addition to or instead of the password.
+            cipher (str): "aes-gcm", "chacha20-poly1305" or "auto" to use the
+                          faster one on this CPU.
+            io_limit_mb_s (float, optional): Disk throughput limit in MB/s for this job.
+                                             The process-wide limit, if any, applies
+                                             on top of it.
+            cpu_workers (int, optional): Cap on CPU worker threads for this job.
+            low_priority (bool): Whether to run the job at lower CPU and I/O priority.
+            in_subprocess (bool): Whether to run the job in a separate process, so
+                                  its CPU-bound stages never hold this process's GIL.
+                                  The password and recipients must be picklable.
+            catalog (str, optional): Catalog file to record encrypted archives in
+                                     and remove decrypted ones from. A protected
+                                     catalog's key is read from FOLDER_ENC_CATALOG_KEY.
         """
         super().__init__()
         self.mode = mode
@@ -39,85 +93,311 @@ class CryptoWorker(QObject):
         self.delete_source = delete_source
         self.export_hashes = export_hashes
         self.import_hashes = import_hashes
+        self.memory_budget_mb = memory_budget_mb
+        self.memory_budget = None
+        self.write_report = write_report
+        self.deduplicate = deduplicate
+        self.archive_format = archive_format
+        self.verify_restore = verify_restore
+        self.recipients = recipients
+        self.cipher = cipher
+        self.io_limit_mb_s = io_limit_mb_s
+        self.cpu_workers = cpu_workers
+        self.low_priority = low_priority
+        self.in_subprocess = in_subprocess
+        self.catalog = catalog
+        self.peak_rss = 0
+        self.peak_rss_scope = "process"
+        self.profile_files = {}
+        self.report = None
+        self._last_progress = None
         
     def run(self):
         """Executes the encryption or decryption operation based on the mode."""
         try:
+            message, out_path = self.execute()
+        except Exception as e:
+            self.error_occurred.emit(str(e))
+            return
+        if self.mode == "encrypt":
+            self.encryption_finished.emit(message, out_path)
+        else:
+            self.decryption_finished.emit(message, out_path)
+
+    def execute(self):
+        """
+        Runs the job in the calling thread.
+
+        The job's I/O limit, CPU worker cap and priority only apply while it
+        runs; the previous settings are restored afterwards. With profiling
+        on, the job is profiled where it runs, in this thread or in the job
+        process, and profile_files lists the written files.
+
+        Returns:
+            tuple: (completion message, output path).
+
+        Raises:
+            Exception: Whatever made the job fail, after the report is finished.
+        """
+        if self.in_subprocess:
+            return self._execute_in_process()
+        with job_limits(self.io_limit_mb_s, self.cpu_workers, self.low_priority), \
+                profile_session("CryptoWorker.run") as self.profile_files:
+            return self._execute()
+
+    def _execute(self):
+        """Runs the job under its limits; see execute()."""
+        self.report = JobReport(self.mode, self.path)
+        with _running_jobs_lock:
+            alone = not _running_jobs
+            for job in _running_jobs:
+                job.peak_rss_scope = "process"
+            _running_jobs.add(self)
+            # Resetting the high-water mark would cut into a concurrent job's peak.
+            self.peak_rss_scope = "job" if alone and reset_peak_rss() else "process"
+        try:
+            self.memory_budget = MemoryBudget(self.memory_budget_mb)
             if self.mode == "encrypt":
                 out_path = self._encrypt_folder_threaded()
-                self.encryption_finished.emit("Encryption complete.", out_path)
+                message = "Encryption complete."
             elif self.mode == "decrypt":
                 out_path = self._decrypt_folder_threaded()
-                self.decryption_finished.emit("Decryption complete.", out_path)
+                message = "Decryption complete."
+            else:
+                raise ValueError(f"Unknown mode {self.mode!r}.")
+            self._finish_report("ok", output_path=out_path)
+            return self._finished_message(message), out_path
         except Exception as e:
-            self.error_occurred.emit(str(e))
+            self._finish_report("failed", error=str(e))
+            raise
+        finally:
+            with _running_jobs_lock:
+                _running_jobs.discard(self)
+
+    def _process_options(self) -> dict:
+        """Returns the constructor arguments for running this job in a worker process."""
+        return dict(mode=self.mode, path=self.path, password=self.password, output_path=self.output_path,
+                    delete_source=self.delete_source, export_hashes=self.export_hashes,
+                    import_hashes=self.import_hashes, memory_budget_mb=self.memory_budget_mb,
+                    write_report=self.write_report, deduplicate=self.deduplicate,
+                    archive_format=self.archive_format, verify_restore=self.verify_restore,
+                    recipients=self.recipients, cipher=self.cipher, io_limit_mb_s=self.io_limit_mb_s,
+                    cpu_workers=self.cpu_workers, low_priority=self.low_priority, catalog=self.catalog)
+
+    def _execute_in_process(self):
+        """Runs the job in a spawned process, relaying its progress and report over a pipe."""
+        context = multiprocessing.get_context("spawn")
+        receiver, sender = context.Pipe(duplex=False)
+        # A profiling directory set with enable_profiling() is not inherited
+        # by a spawned process, so the job process is told explicitly.
+        process = context.Process(target=_run_job_process,
+                                  args=(self._process_options(), sender, profiling_directory()),
+                                  name="folder-enc-job", daemon=True)
+        process.start()
+        sender.close()
+        try:
+            while True:
+                try:
+                    message = receiver.recv()
+                except EOFError:
+                    process.join()
+                    raise RuntimeError(f"The worker process stopped unexpectedly (exit code {process.exitcode}).")
+                kind = message[0]
+                if kind == "progress":
+                    self._emit_progress(message[1])
+                elif kind == "report":
+                    self.report_ready.emit(message[1])
+                elif kind == "profile":
+                    self.profile_files = message[1]
+                elif kind == "finished":
+                    return message[1], message[2]
+                else:
+                    raise RuntimeError(message[1])
+        finally:
+            receiver.close()
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+
+    def _finish_report(self, status: str, error: str = None, output_path: str = None):
+        """Completes the job report, emits it and optionally writes it as JSON."""
+        self.peak_rss = peak_rss()
+        self.report.finish(status, error=error, output_path=output_path)
+        self.report.extra["peak_rss_bytes"] = self.peak_rss
+        # "job" if the peak was measured over this job alone, "process" if it
+        # may include other jobs or earlier work in this process.
+        self.report.extra["peak_rss_scope"] = self.peak_rss_scope
+        if self.memory_budget:
+            self.report.extra["memory_budget_bytes"] = self.memory_budget.budget_bytes
+        report = self.report.to_dict()
+        if self.write_report:
+            try:
+                self.report.write_json((output_path or self.output_path or self.path) + ".report.json")
+            except OSError:
+                pass
+        self.report_ready.emit(report)
+
+    def _finished_message(self, message: str) -> str:
+        """Appends the measured peak memory use to a completion message."""
+        mb = 1024 * 1024
+        label = "Peak memory" if self.peak_rss_scope == "job" else "Peak process memory"
+        return (f"{message}\n{label}: {self.peak_rss // mb} MB "
+                f"(budget {self.memory_budget.budget_bytes // mb} MB).")
+
+    def _emit_progress(self, progress: int):
+        """Emits progress only when it changes, so queued signals stay bounded."""
+        if progress != self._last_progress:
+            self._last_progress = progress
+            self.progress_updated.emit(progress)
 
     def _zip_progress(self, current_bytes, total_bytes):
         """Callback for zip progress, mapping to 0-10% of overall progress."""
         progress = int((current_bytes / total_bytes) * 10)
-        self.progress_updated.emit(progress)
+        self._emit_progress(progress)
 
     def _encryption_file_progress(self, current_bytes, total_bytes):
         """Callback for file encryption progress, mapping to 10-90% of overall progress."""
         # Scale encryption progress from 10 to 90%
         progress = 10 + int((current_bytes / total_bytes) * 80)
-        self.progress_updated.emit(progress)
+        self._emit_progress(progress)
 
     def _decryption_file_progress(self, current_bytes, total_bytes):
         """Callback for file decryption progress, mapping to 0-90% of overall progress."""
         # Scale decryption progress from 0 to 90%
         progress = int((current_bytes / total_bytes) * 90)
-        self.progress_updated.emit(progress)
+        self._emit_progress(progress)
 
     def _unzip_progress(self, current_bytes, total_bytes):
         """Callback for unzip progress, mapping to 90-100% of overall progress."""
         progress = 90 + int((current_bytes / total_bytes) * 10)
-        self.progress_updated.emit(progress)
+        self._emit_progress(progress)
+
+    def _verify_progress(self, current_bytes, total_bytes):
+        """Callback for read-back verification progress, mapping to 90-95% of overall progress."""
+        progress = 90 + int((current_bytes / max(total_bytes, 1)) * 5)
+        self._emit_progress(progress)
+
+    def _delete_progress(self, deleted_files, total_files):
+        """Callback for source deletion progress, mapping to 95-100% of overall progress."""
+        progress = 95 + int((deleted_files / max(total_files, 1)) * 5)
+        self._emit_progress(progress)
 
     def _encrypt_folder_threaded(self):
         """Handles the multi-step encryption process for a folder."""
-        self.progress_updated.emit(0)
-        temp_zip = self.path + ".zip"
-        
-        zip_folder(self.path, temp_zip, progress_callback=self._zip_progress)
+        self._emit_progress(0)
+        temp_archive = self.path + ".zip"
+
+        with self.report.stage("scan") as record:
+            inventory = scan_folder(self.path)
+            record["files"] = len(inventory)
+            record["bytes"] = sum(size for _, _, size in inventory)
+
+        archive_format = self.archive_format
+        if archive_format == "auto":
+            archive_format = choose_archive_format(inventory, self.memory_budget)
+        self.report.extra["archive_format"] = archive_format
+
+        with self.report.stage("compress", record["bytes"], record["files"]):
+            if archive_format == "tar":
+                manifest = tar_folder(self.path, temp_archive, progress_callback=self._zip_progress,
+                           inventory=inventory, deduplicate=self.deduplicate, memory_budget=self.memory_budget)
+            else:
+                manifest = zip_folder(self.path, temp_archive, progress_callback=self._zip_progress,
+                           memory_budget=self.memory_budget, inventory=inventory,
+                           deduplicate=self.deduplicate)
         
-        encrypt_file_aes(temp_zip, self.output_path, self.password,
-                         self.export_hashes, progress_callback=self._encryption_file_progress)
+        # One key object for encrypting and verifying, so the read-back
+        # check reuses the derived KEK instead of running PBKDF2 again.
+        key = as_key(self.password) if self.password else None
+        digest = encrypt_file_aes(temp_archive, self.output_path, key,
+                                  self.export_hashes, progress_callback=self._encryption_file_progress,
+                                  chunk_size=self.memory_budget.chunk_size, report=self.report,
+                                  recipients=self.recipients, cipher=self.cipher,
+                                  ciphertext_digest=self.delete_source, memory_budget=self.memory_budget)
+        if self.delete_source:
+            # The source is only deleted once the written archive has been
+            # read back and authenticated.
+            verify_encrypted_file(self.output_path, key, digest,
+                                  progress_callback=self._verify_progress, report=self.report)
         
-        self.progress_updated.emit(95)
-        delete_path(temp_zip)
+        if self.export_hashes:
+            export_manifest(manifest, self.output_path + ".hashes.json")
+
+        if self.catalog:
+            with self.report.stage("catalog", files=record["files"]):
+                entries = [(arcname.replace(os.sep, "/"), size, manifest["files"].get(archive_name(arcname)))
+                           for _, arcname, size in inventory]
+                self._update_catalog(lambda catalog: catalog.add_archive(
+                    self.output_path, entries, source=os.path.abspath(self.path),
+                    size=os.path.getsize(self.output_path) if os.path.isfile(self.output_path) else None,
+                    digest=digest))
+
+        self._emit_progress(95)
+        with self.report.stage("cleanup", files=1):
+            delete_path(temp_archive)
         
         if self.delete_source:
-            delete_path(self.path)
-        self.progress_updated.emit(100)
+            check_source_unchanged(self.path, inventory, manifest)
+            with self.report.stage("delete_source", record["bytes"], record["files"]):
+                delete_path(self.path, progress_callback=self._delete_progress,
+                            total_files=record["files"])
+        self._emit_progress(100)
         return self.output_path
 
     def _decrypt_folder_threaded(self):
         """Handles the multi-step decryption process for an encrypted file."""
-        self.progress_updated.emit(0)
+        self._emit_progress(0)
         file_dir = os.path.dirname(self.path)
         base_name_enc = os.path.basename(self.path)
         base_name_zip = os.path.splitext(base_name_enc)[0]
 
         output_folder_path = os.path.join(file_dir, base_name_zip)
         os.makedirs(output_folder_path, exist_ok=True)
-        temp_zip = os.path.join(output_folder_path, f"{base_name_zip}_temp.zip")
+        temp_archive = os.path.join(output_folder_path, f"{base_name_zip}_temp.zip")
 
-        decrypt_file_aes(self.path, temp_zip, self.password,
-                         self.import_hashes, progress_callback=self._decryption_file_progress)
+        # Appended archives decrypt to several parts; extracting them in
+        # order lets later parts replace the entries they supersede.
+        parts = decrypt_file_parts(self.path, temp_archive, self.password,
+                                   self.import_hashes, progress_callback=self._decryption_file_progress,
+                                   chunk_size=self.memory_budget.chunk_size, report=self.report)
         
-        unzip_folder(temp_zip, output_folder_path, progress_callback=self._unzip_progress)
+        restored = {}
+        with self.report.stage("extract", files=len(parts)) as record:
+            for part in parts:
+                manifest = extract_archive(part, output_folder_path, progress_callback=self._unzip_progress)
+                if manifest:
+                    restored.update(manifest["files"])
+                record["bytes"] += os.path.getsize(part)
+
+        if self.verify_restore and restored:
+            # Later parts' hashes replace those of the entries they supersede,
+            # so the merged manifest describes the restored folder.
+            with self.report.stage("verify_restore", files=len(restored)):
+                verify_manifest(output_folder_path, {"algorithm": HASH_ALGORITHM, "files": restored},
+                                self.memory_budget.max_workers)
         
-        self.progress_updated.emit(95)
-        delete_path(temp_zip)
+        self._emit_progress(95)
+        with self.report.stage("cleanup", files=len(parts)):
+            for part in parts:
+                delete_path(part)
 
-        delete_path(self.path)
-        if self.import_hashes and os.path.exists(self.path + ".salt"):
-            delete_path(self.path + ".salt")
+            delete_path(self.path)
+            if self.catalog:
+                self._update_catalog(lambda catalog: catalog.remove_archive(self.path))
+            if self.import_hashes and os.path.exists(self.path + ".salt"):
+                delete_path(self.path + ".salt")
 
-        self.progress_updated.emit(100)
+        self._emit_progress(100)
         return output_folder_path
 
+    def _update_catalog(self, update):
+        """Applies update to the catalog; a catalog error is reported but does not fail the job."""
+        try:
+            with Catalog(self.catalog) as catalog:
+                update(catalog)
+        except (sqlite3.Error, ValueError) as e:
+            self.report.extra["catalog_error"] = str(e)
+
     def open_explorer_and_highlight(self, file_path):
         """Opens file explorer and highlights the given file/folder."""
         if os.name == 'nt':  # For Windows
@@ -126,4 +406,173 @@ class CryptoWorker(QObject):
             if sys.platform == 'darwin':
                 subprocess.Popen(['open', '-R', file_path])
             else:
-                subprocess.Popen(['xdg-open', os.path.dirname(file_path)])
\ No newline at end of file
+                subprocess.Popen(['xdg-open', os.path.dirname(file_path)])
+
+
+def _run_job_process(options: dict, sender, profile_dir: str = None):
+    """Entry point of a job process: runs one CryptoWorker job and reports over sender."""
+    if profile_dir:
+        enable_profiling(profile_dir)
+    worker = CryptoWorker(**options)
+    # There is no event loop in this process, so signals are delivered directly.
+    worker.progress_updated.connect(lambda progress: sender.send(("progress", progress)),
+                                    Qt.ConnectionType.DirectConnection)
+    worker.report_ready.connect(lambda report: sender.send(("report", report)),
+                                Qt.ConnectionType.DirectConnection)
+    try:
+        try:
+            message, out_path = worker.execute()
+            result = ("finished", message, out_path)
+        except Exception as e:
+            result = ("error", str(e))
+        if worker.profile_files:
+            sender.send(("profile", worker.profile_files))
+        sender.send(result)
+    finally:
+        sender.close()
+
+
+class ScanWorker(QObject):
+    """
+    Worker class that pre-scans a folder in a separate thread.
+    Emits running counts while walking and the finished estimate.
+    """
+    scan_progress = pyqtSignal(int, object)
+    scan_finished = pyqtSignal(str, dict)
+    scan_failed = pyqtSignal(str, str)
+    done = pyqtSignal()
+
+    def __init__(self, path: str):
+        """
+        Initializes the ScanWorker.
+
+        Args:
+            path (str): Folder to scan.
+        """
+        super().__init__()
+        self.path = path
+        self._cancel = threading.Event()
+
+    def cancel(self):
+        """Asks the scan to stop; no result is emitted afterwards. Safe from any thread."""
+        self._cancel.set()
+
+    def run(self):
+        """Scans the folder and emits scan_finished or scan_failed unless cancelled."""
+        try:
+            estimate = prescan_folder(self.path, cancel_event=self._cancel,
+                                      progress_callback=self.scan_progress.emit)
+            if not self._cancel.is_set():
+                self.scan_finished.emit(self.path, estimate)
+        except ScanCancelled:
+            pass
+        except Exception as e:
+            if not self._cancel.is_set():
+                self.scan_failed.emit(self.path, str(e))
+        finally:
+            self.done.emit()
+
+
+class BatchDecryptWorker(QObject):
+    """
+    Worker class that decrypts many .enc files in a separate thread.
+
+    Files are decrypted by a pool sized to the disk they live on, share one
+    password key so archives with the same salt derive their KEK once, and
+    report a combined progress weighted by file size.
+
+    Only archives written with one PasswordKey share a salt; each encryption
+    started from a plain password (as the GUI does) gets a salt of its own,
+    so a batch of those still costs one PBKDF2 run per file. The runs happen
+    on the pool threads, so they overlap rather than add up.
+    """
+    progress_updated = pyqtSignal(int)
+    file_progress = pyqtSignal(str, int)
+    file_finished = pyqtSignal(str, bool, str)
+    batch_finished = pyqtSignal(str, list)
+
+    def __init__(self, paths: list, password, import_hashes: bool = False,
+                 memory_budget_mb: int = None, verify_restore: bool = False, workers: int = None,
+                 catalog: str = None):
+        """
+        Initializes the BatchDecryptWorker.
+
+        Args:
+            paths (list): Encrypted files to decrypt.
+            password (str | PasswordKey | KeyfileKey | IdentityKey): Password or key for
+                                                                   all files.
+            import_hashes (bool): Whether to import each file's .salt file.
+            memory_budget_mb (int, optional): Memory budget shared by all concurrent jobs.
+            verify_restore (bool): Whether to read restored files back and check them
+                                   against their manifests; see CryptoWorker.
+            workers (int, optional): Concurrent jobs. Defaults to what the disk handles well.
+            catalog (str, optional): Catalog file to remove the decrypted archives from.
+        """
+        super().__init__()
+        self.paths = list(paths)
+        self.password = password
+        self.import_hashes = import_hashes
+        self.memory_budget_mb = memory_budget_mb
+        self.verify_restore = verify_restore
+        self.workers = workers
+        self.catalog = catalog
+        self._sizes = {}
+        self._done = {}
+        self._lock = threading.Lock()
+        self._last_progress = None
+
+    def run(self):
+        """Decrypts every file and emits batch_finished with the output folders."""
+        key = as_key(self.password)
+        workers = self.workers or (io_concurrency(self.paths[0]) if self.paths else 1)
+        workers = max(1, min(workers, len(self.paths)))
+        budget_mb = self.memory_budget_mb or MemoryBudget().budget_bytes // (1024 * 1024)
+        job_budget_mb = max(MIN_MEMORY_BUDGET_MB, budget_mb // workers)
+        for path in self.paths:
+            self._sizes[path] = max(os.path.getsize(path), 1) if os.path.exists(path) else 1
+            self._done[path] = 0
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(lambda path: self._decrypt_one(path, key, job_budget_mb), self.paths))
+
+        outputs = [out_path for ok, out_path in results if ok]
+        failed = len(results) - len(outputs)
+        message = f"Decrypted {len(outputs)} of {len(results)} files."
+        if failed:
+            message += f" {failed} failed."
+        self._emit_progress(100)
+        self.batch_finished.emit(message, outputs)
+
+    def _decrypt_one(self, path: str, key, memory_budget_mb: int):
+        """Decrypts one file in the calling pool thread; returns (ok, output path)."""
+        worker = CryptoWorker(mode="decrypt", path=path, password=key, import_hashes=self.import_hashes,
+                              memory_budget_mb=memory_budget_mb, verify_restore=self.verify_restore,
+                              catalog=self.catalog)
+        # The job runs in this pool thread, which has no event loop, so
+        # progress must be delivered directly rather than queued.
+        worker.progress_updated.connect(lambda progress: self._update(path, progress),
+                                        Qt.ConnectionType.DirectConnection)
+        try:
+            message, out_path = worker.execute()
+        except Exception as e:
+            self._update(path, 100)
+            self.file_finished.emit(path, False, str(e))
+            return False, None
+        self._update(path, 100)
+        self.file_finished.emit(path, True, out_path)
+        return True, out_path
+
+    def _update(self, path: str, progress: int):
+        """Records one file's progress and emits the size-weighted total."""
+        self.file_progress.emit(path, progress)
+        with self._lock:
+            self._done[path] = progress
+            total = sum(self._sizes.values())
+            combined = int(sum(self._sizes[p] * self._done[p] for p in self._sizes) / total)
+            self._emit_progress(combined)
+
+    def _emit_progress(self, progress: int):
+        """Emits progress only when it changes, so queued signals stay bounded."""
+        if progress != self._last_progress:
+            self._last_progress = progress
+            self.progress_updated.emit(progress)
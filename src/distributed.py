@@ -0,0 +1,365 @@
+import functools
+import heapq
+import json
+import os
+import queue
+import shutil
+import socket
+import socketserver
+import ssl
+import struct
+import tempfile
+import threading
+
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+from .core_crypto import (
+    ArchiveHeader, new_envelope, encrypt_part, write_indexed_archive, derive_key, generate_salt, NONCE_PREFIX_SIZE
+)
+from .file_operations import scan_folder, zip_folder
+from .profiling import profiled
+from .storage import open_sink, is_local_path
+
+CLUSTER_SECRET_ENV = "FOLDER_ENC_CLUSTER_SECRET"
+DEFAULT_PORT = 7465
+PROTOCOL = "fenc-shard/2"
+SHARDS_PER_WORKER = 4
+SHARD_RETRIES = 2
+CONNECT_TIMEOUT = 10
+SHARD_TIMEOUT = 600
+FRAME = struct.Struct(">I")
+
+# Protocol, one shard per connection:
+#   worker      -> coordinator  {"protocol", "salt", "challenge"}    (JSON frame)
+#   coordinator -> worker       nonce + AES-GCM(job, aad=challenge)  (frame)
+#   worker      -> coordinator  {"status", "length" | "message"}     (JSON frame)
+#   worker      -> coordinator  "length" bytes of encrypted part     (raw)
+# Jobs carry the archive's data key, so they are sealed under a key derived
+# from the cluster secret; a worker only runs jobs that authenticate. The
+# returned parts are AEAD ciphertext and are authenticated when decrypted.
+# Anyone who can capture a sealed job can try to guess the secret offline,
+# so the key is derived with PBKDF2 under a salt the worker picks at
+# startup, and the secret should be random (e.g. secrets.token_urlsafe(32))
+# rather than a memorable password. Outside a trusted network, also pass an
+# ssl.SSLContext to both ends so the connection itself is TLS.
+
+
+def _cluster_secret(secret: str = None) -> str:
+    secret = secret or os.environ.get(CLUSTER_SECRET_ENV)
+    if not secret:
+        raise ValueError(f"Distributed encryption needs a cluster secret; set {CLUSTER_SECRET_ENV}.")
+    return secret
+
+
+@functools.lru_cache(maxsize=None)
+def _cluster_key(secret: str, salt: bytes) -> AESGCM:
+    """Derives the job sealing key; cached, so each worker's salt costs one PBKDF2 run."""
+    return AESGCM(HKDF(algorithm=hashes.SHA256(), length=32, salt=None,
+                       info=b"fenc cluster").derive(derive_key(secret, salt)))
+
+
+def _recv_exact(sock, size: int) -> bytes:
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(min(size - len(data), 1024 * 1024))
+        if not chunk:
+            raise ConnectionError("Connection closed by peer.")
+        data += chunk
+    return bytes(data)
+
+
+def _send_frame(sock, data: bytes):
+    sock.sendall(FRAME.pack(len(data)) + data)
+
+
+def _recv_frame(sock) -> bytes:
+    (length,) = FRAME.unpack(_recv_exact(sock, FRAME.size))
+    return _recv_exact(sock, length)
+
+
+def _send_json(sock, message: dict):
+    _send_frame(sock, json.dumps(message).encode("utf-8"))
+
+
+def _recv_json(sock) -> dict:
+    return json.loads(_recv_frame(sock))
+
+
+def partition_inventory(inventory, shards: int) -> list:
+    """
+    Splits a scan_folder() inventory into shards of similar total size.
+
+    Files are assigned largest first to the currently smallest shard; each
+    shard keeps the inventory's order so workers read folders together.
+
+    Returns:
+        list: Non-empty inventory lists.
+    """
+    heap = [(0, number) for number in range(max(1, shards))]
+    assignment = {}
+    for position in sorted(range(len(inventory)), key=lambda i: -inventory[i][2]):
+        total, number = heapq.heappop(heap)
+        assignment[position] = number
+        heapq.heappush(heap, (total + inventory[position][2], number))
+    result = [[] for _ in heap]
+    for position, entry in enumerate(inventory):
+        result[assignment[position]].append(entry)
+    return [shard for shard in result if shard]
+
+
+class _ShardHandler(socketserver.BaseRequestHandler):
+    """Serves one shard request on a ShardWorkerServer."""
+    def handle(self):
+        server = self.server
+        self.request.settimeout(SHARD_TIMEOUT)
+        challenge = os.urandom(16)
+        _send_json(self.request, {"protocol": PROTOCOL, "salt": server.salt.hex(), "challenge": challenge.hex()})
+        sealed = _recv_frame(self.request)
+        try:
+            job = json.loads(server.cluster_key.decrypt(sealed[:12], sealed[12:], challenge))
+        except InvalidTag:
+            _send_json(self.request, {"status": "error", "message": "Job is not signed with the cluster secret."})
+            return
+        scratch = tempfile.mkdtemp(prefix=".shard-", dir=server.scratch_dir)
+        try:
+            segment = os.path.join(scratch, "segment")
+            try:
+                self._encrypt_shard(job, scratch, segment)
+            except (OSError, ValueError) as e:
+                _send_json(self.request, {"status": "error", "message": str(e)})
+                return
+            _send_json(self.request, {"status": "ok", "length": os.path.getsize(segment)})
+            with open(segment, "rb") as f:
+                self.request.sendfile(f)
+        finally:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+    def _encrypt_shard(self, job: dict, scratch: str, segment: str):
+        """Archives the shard's files and encrypts them as one part."""
+        root = self.server.source_root or job["folder"]
+        inventory = []
+        for arcname in job["files"]:
+            full_path = os.path.join(root, *arcname.split("/"))
+            inventory.append((full_path, arcname, os.path.getsize(full_path)))
+        archive = os.path.join(scratch, "shard.zip")
+        zip_folder(root, archive, inventory=inventory, deduplicate=job["deduplicate"])
+        header = ArchiveHeader(job["cipher"], job["segment_size"], bytes.fromhex(job["header_nonce_prefix"]), [])
+        with open(archive, "rb") as infile, open(segment, "wb") as outfile:
+            encrypt_part(infile, outfile, header, bytes.fromhex(job["data_key"]),
+                         bytes.fromhex(job["nonce_prefix"]))
+
+
+class ShardWorkerServer(socketserver.ThreadingTCPServer):
+    """
+    Worker node for encrypt_distributed(): archives and encrypts shards sent by a coordinator.
+
+    Each connection carries one shard and is served on its own thread, so
+    a coordinator can keep several shards in flight per worker. Run it
+    with serve_forever(); workers on localhost can stand in for remote
+    hosts when testing.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address: tuple = ("127.0.0.1", DEFAULT_PORT), secret: str = None,
+                 source_root: str = None, scratch_dir: str = None, ssl_context: ssl.SSLContext = None):
+        """
+        Initializes the ShardWorkerServer.
+
+        Args:
+            address (tuple): (host, port) to listen on; port 0 picks a free port. Listens
+                             on localhost only unless a host is given.
+            secret (str, optional): Cluster secret, a long random string. Defaults to
+                                    FOLDER_ENC_CLUSTER_SECRET.
+            source_root (str, optional): Where this host mounts the folder being
+                                         encrypted. Defaults to the coordinator's path.
+            scratch_dir (str, optional): Folder for temporary shard archives.
+            ssl_context (ssl.SSLContext, optional): Server-side TLS context holding this
+                                                    worker's certificate.
+        """
+        self.ssl_context = ssl_context
+        self.salt = generate_salt()
+        self.cluster_key = _cluster_key(_cluster_secret(secret), self.salt)
+        self.source_root = source_root
+        self.scratch_dir = scratch_dir
+        super().__init__(address, _ShardHandler)
+
+    def get_request(self):
+        sock, address = super().get_request()
+        if self.ssl_context:
+            # The handshake runs on the handler's thread, at its first read.
+            sock = self.ssl_context.wrap_socket(sock, server_side=True, do_handshake_on_connect=False)
+        return sock, address
+
+
+def _parse_address(address: str) -> tuple:
+    host, _, port = address.rpartition(":")
+    return (host, int(port)) if host else (address, DEFAULT_PORT)
+
+
+def _run_shard(address: tuple, secret: str, job: dict, segment: str, ssl_context: ssl.SSLContext = None) -> int:
+    """Sends one shard to a worker and stores the returned part; returns its length."""
+    with socket.create_connection(address, timeout=CONNECT_TIMEOUT) as sock:
+        if ssl_context:
+            sock = ssl_context.wrap_socket(sock, server_hostname=address[0])
+        # The worker archives the whole shard before it answers.
+        sock.settimeout(SHARD_TIMEOUT)
+        hello = _recv_json(sock)
+        if hello.get("protocol") != PROTOCOL:
+            raise ConnectionError(f"{address[0]}:{address[1]} is not a shard worker.")
+        cluster_key = _cluster_key(secret, bytes.fromhex(hello["salt"]))
+        nonce = os.urandom(12)
+        _send_frame(sock, nonce + cluster_key.encrypt(nonce, json.dumps(job).encode("utf-8"),
+                                                      bytes.fromhex(hello["challenge"])))
+        result = _recv_json(sock)
+        if result["status"] != "ok":
+            raise ValueError(f"Worker {address[0]}:{address[1]} failed: {result['message']}")
+        remaining = result["length"]
+        with open(segment, "wb") as f:
+            while remaining:
+                chunk = sock.recv(min(remaining, 1024 * 1024))
+                if not chunk:
+                    raise ConnectionError("Connection closed by peer.")
+                f.write(chunk)
+                remaining -= len(chunk)
+        return result["length"]
+
+
+@profiled()
+def encrypt_distributed(folder_path: str, output_path: str, password, workers: list, secret: str = None,
+                        recipients=None, cipher=None, volume_size: int = None, shards: int = None,
+                        chunk_size: int = 1024 * 1024, deduplicate: bool = True,
+                        progress_callback=None, ssl_context: ssl.SSLContext = None) -> int:
+    """
+    Encrypts a folder on several worker nodes into one indexed archive.
+
+    The folder is scanned here and split into shards of similar size.
+    Workers (see ShardWorkerServer) read the shard's files from their own
+    mount of the folder, archive and encrypt them as one part under the
+    archive's data key, and send the part back. The parts are assembled
+    into an archive that decrypt_file_parts() reads like an appended one.
+    A shard that fails on one worker is retried on the others, under a
+    fresh nonce prefix so no two attempts encrypt with the same nonces.
+
+    Args:
+        folder_path (str): Folder to encrypt, as seen by this host.
+        output_path (str): Path or s3:// URL of the archive.
+        password (str | PasswordKey | KeyfileKey): Password or key. May be None
+                                                   with recipients.
+        workers (list): "host:port" addresses of worker nodes. An address may be
+                        repeated to keep more shards in flight on that node.
+        secret (str, optional): Cluster secret, a long random string. Defaults to
+                                FOLDER_ENC_CLUSTER_SECRET.
+        recipients (list, optional): X25519 public keys to encrypt to.
+        cipher (str, optional): Forces "aes-gcm" or "chacha20-poly1305".
+        volume_size (int, optional): If set, split the output into volumes of this many bytes.
+        shards (int, optional): Number of shards. Defaults to four per worker.
+        chunk_size (int): Plaintext bytes per encrypted segment.
+        deduplicate (bool): If True, store identical files once within each shard.
+        progress_callback (callable, optional): A function to call with
+                                                 (encrypted_bytes, total_bytes).
+        ssl_context (ssl.SSLContext, optional): Client-side TLS context for talking
+                                                to the workers.
+
+    Returns:
+        int: Number of parts in the archive.
+
+    Raises:
+        RuntimeError: If a shard failed on every worker.
+    """
+    if not workers:
+        raise ValueError("Distributed encryption needs at least one worker address.")
+    secret = _cluster_secret(secret)
+    inventory = scan_folder(folder_path)
+    shard_list = partition_inventory(inventory, shards or len(workers) * SHARDS_PER_WORKER)
+    header, data_key = new_envelope(password, recipients, cipher, chunk_size)
+    used_prefixes = {header.nonce_prefix}
+    prefixes = {}
+
+    scratch_parent = os.path.dirname(os.path.abspath(output_path)) if is_local_path(output_path) else None
+    scratch = tempfile.mkdtemp(prefix=".distributed-", dir=scratch_parent)
+    pending = queue.Queue()
+    for number in range(len(shard_list)):
+        pending.put((number, 0))
+    lengths = {}
+    errors = {}
+    total_bytes = sum(size for _, _, size in inventory)
+    done = [0]
+    lock = threading.Lock()
+
+    outstanding = [len(shard_list)]
+
+    def fresh_prefix():
+        # A failed attempt may have encrypted some of its shard already, so
+        # every attempt gets a prefix that no other part has used.
+        with lock:
+            prefix = os.urandom(NONCE_PREFIX_SIZE)
+            while prefix in used_prefixes:
+                prefix = os.urandom(NONCE_PREFIX_SIZE)
+            used_prefixes.add(prefix)
+            return prefix
+
+    def dispatch(address):
+        while True:
+            with lock:
+                if not outstanding[0]:
+                    return
+            try:
+                number, attempts = pending.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            prefix = fresh_prefix()
+            job = {"folder": os.path.abspath(folder_path), "files": [arcname for _, arcname, _ in shard_list[number]],
+                   "cipher": header.cipher, "segment_size": header.segment_size,
+                   "header_nonce_prefix": header.nonce_prefix.hex(), "nonce_prefix": prefix.hex(),
+                   "data_key": data_key.hex(), "deduplicate": deduplicate}
+            try:
+                length = _run_shard(address, secret, job, os.path.join(scratch, f"{number}.part"), ssl_context)
+            except (OSError, ValueError) as e:
+                with lock:
+                    errors[number] = str(e)
+                if attempts < SHARD_RETRIES:
+                    pending.put((number, attempts + 1))
+                else:
+                    with lock:
+                        outstanding[0] -= 1
+                # A worker that cannot be reached takes no further shards.
+                if isinstance(e, OSError):
+                    return
+                continue
+            with lock:
+                lengths[number] = length
+                prefixes[number] = prefix
+                errors.pop(number, None)
+                outstanding[0] -= 1
+                done[0] += sum(size for _, _, size in shard_list[number])
+                if progress_callback:
+                    progress_callback(done[0], total_bytes)
+
+    try:
+        threads = [threading.Thread(target=dispatch, args=(_parse_address(address),), daemon=True)
+                   for address in workers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if len(lengths) != len(shard_list):
+            failed = sorted(set(range(len(shard_list))) - set(lengths))
+            raise RuntimeError(f"{len(failed)} of {len(shard_list)} shards could not be encrypted: "
+                               f"{errors.get(failed[0], 'no worker was reachable')}")
+
+        files = [open(os.path.join(scratch, f"{number}.part"), "rb") for number in range(len(shard_list))]
+        try:
+            with open_sink(output_path, volume_size, total_size=total_bytes) as sink:
+                write_indexed_archive(sink, header, data_key, [
+                    (f, lengths[number], prefixes[number], [arcname for _, arcname, _ in shard_list[number]])
+                    for number, f in enumerate(files)])
+        finally:
+            for f in files:
+                f.close()
+        return len(shard_list)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
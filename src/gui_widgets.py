@@ -11,20 +11,25 @@ class DragDropWidget(QFrame):
     A custom QFrame widget that supports drag-and-drop for files or folders,
     and also provides a browse button.
     """
-    def __init__(self, callback=None, is_file_mode=False):
+    def __init__(self, callback=None, is_file_mode=False, multiple=False):
         """
         Initializes the DragDropWidget.
 
         Args:
             callback (callable, optional): Function to call when a path is selected/dropped.
             is_file_mode (bool): If True, accepts only files; otherwise, accepts only folders.
+            multiple (bool): In file mode, accept several files at once and call
+                             callback with a list of paths.
         """
         super().__init__()
         self.callback = callback
         self.is_file_mode = is_file_mode
+        self.multiple = multiple and is_file_mode
         self.setAcceptDrops(True)
         self.setFixedSize(600, 200)
         self.original_text = "Drag & Drop folder here" if not is_file_mode else "Drag & Drop encrypted file here"
+        if self.multiple:
+            self.original_text = "Drag & Drop encrypted files here"
         self.setStyleSheet("""
             QFrame {
                 border: 2px dashed #aaa;
@@ -75,6 +80,17 @@ class DragDropWidget(QFrame):
 
     def dropEvent(self, event: QDropEvent):
         """Handles drop events, processing the dropped file/folder."""
+        if self.multiple:
+            paths = [url.toLocalFile() for url in event.mimeData().urls()]
+            files = [path for path in paths if os.path.isfile(path) and path.lower().endswith(".enc")]
+            if len(files) < len(paths):
+                QMessageBox.warning(self, "Invalid File", "Only .enc files are allowed; other files were skipped.")
+            if files:
+                self._select_files(files)
+                event.acceptProposedAction()
+            else:
+                event.ignore()
+            return
         for url in event.mimeData().urls():
             path = url.toLocalFile()
             if self.is_file_mode:
@@ -99,7 +115,11 @@ class DragDropWidget(QFrame):
 
     def browse(self):
         """Opens a file or folder dialog for selection."""
-        if self.is_file_mode:
+        if self.multiple:
+            files, _ = QFileDialog.getOpenFileNames(self, "Select Encrypted Files", filter="Encrypted Files (*.enc)")
+            if files:
+                self._select_files(files)
+        elif self.is_file_mode:
             file, _ = QFileDialog.getOpenFileName(self, "Select Encrypted File", filter="Encrypted Files (*.enc)")
             if file:
                 self.text_label.setText(file)
@@ -112,6 +132,12 @@ class DragDropWidget(QFrame):
                 if self.callback:
                     self.callback(folder)
     
+    def _select_files(self, files: list):
+        """Shows and reports a multi-file selection."""
+        self.text_label.setText(files[0] if len(files) == 1 else f"{len(files)} encrypted files selected")
+        if self.callback:
+            self.callback(files)
+
     def reset(self):
         """Resets the widget's text label to its original state."""
         self.text_label.setText(self.original_text)
@@ -0,0 +1,100 @@
+import json
+import time
+from contextlib import contextmanager
+
+
+class JobReport:
+    """
+    Collects per-stage timings, byte and file counts for one crypto job.
+
+    Stages are recorded with the stage() context manager; the finished
+    report can be emitted as a dict or written as JSON next to the output.
+    """
+    def __init__(self, mode: str, input_path: str):
+        """
+        Initializes the JobReport.
+
+        Args:
+            mode (str): "encrypt" or "decrypt".
+            input_path (str): Input file or folder of the job.
+        """
+        self.mode = mode
+        self.input_path = input_path
+        self.output_path = None
+        self.status = "running"
+        self.error = None
+        self.stages = []
+        self.extra = {}
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        self.total_seconds = 0.0
+
+    @contextmanager
+    def stage(self, name: str, bytes_processed: int = 0, files: int = 0):
+        """
+        Times a pipeline stage.
+
+        The yielded dict can be updated inside the block, e.g. to set
+        "bytes" or "files" once they are known.
+
+        Args:
+            name (str): Stage name, e.g. "scan", "kdf" or "encrypt".
+            bytes_processed (int): Bytes handled by the stage, if known up front.
+            files (int): Files handled by the stage, if known up front.
+        """
+        record = {"name": name, "bytes": bytes_processed, "files": files}
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record["seconds"] = time.perf_counter() - start
+            self.stages.append(record)
+
+    def finish(self, status: str = "ok", error: str = None, output_path: str = None):
+        """Marks the job as finished and records the total run time."""
+        self.status = status
+        self.error = error
+        if output_path:
+            self.output_path = output_path
+        self.total_seconds = time.perf_counter() - self._started
+
+    def to_dict(self) -> dict:
+        """Returns the report as a JSON-serialisable dict."""
+        stages = []
+        for record in self.stages:
+            stage = dict(record)
+            seconds = stage["seconds"]
+            stage["throughput_mb_s"] = (
+                round(stage["bytes"] / seconds / (1024 * 1024), 2) if seconds > 0 and stage["bytes"] else None)
+            stage["seconds"] = round(seconds, 4)
+            stages.append(stage)
+        slowest = max(stages, key=lambda s: s["seconds"])["name"] if stages else None
+        report = {
+            "mode": self.mode,
+            "input_path": self.input_path,
+            "output_path": self.output_path,
+            "status": self.status,
+            "error": self.error,
+            "started_at": self.started_at,
+            "total_seconds": round(self.total_seconds, 4),
+            "slowest_stage": slowest,
+            "stages": stages,
+        }
+        report.update(self.extra)
+        return report
+
+    def write_json(self, path: str):
+        """Writes the report as JSON to the given path."""
+        with open(path, "w", encoding="utf-8") as report_file:
+            json.dump(self.to_dict(), report_file, indent=2)
+
+
+@contextmanager
+def untimed_stage(name: str, bytes_processed: int = 0, files: int = 0):
+    """Stand-in for JobReport.stage() when no report is being collected."""
+    yield {"name": name, "bytes": bytes_processed, "files": files}
+
+
+def stage_timer(report):
+    """Returns report.stage, or a no-op equivalent if report is None."""
+    return report.stage if report is not None else untimed_stage
@@ -5,13 +5,15 @@ import subprocess
 from PyQt6.QtWidgets import (
     QApplication, QWidget, QLabel, QLineEdit, QPushButton,
     QFileDialog, QVBoxLayout, QHBoxLayout, QMessageBox, QComboBox,
-    QProgressBar, QCheckBox, QTabWidget, QFrame, QToolButton
+    QProgressBar, QCheckBox, QTabWidget, QFrame, QToolButton, QListWidget
 )
 from PyQt6.QtGui import QIcon, QPixmap, QFont
 from PyQt6.QtCore import Qt, QThread, pyqtSignal, QTimer, QObject
 
 from .gui_widgets import DragDropWidget, PasswordInput
-from .crypto_worker import CryptoWorker
+from .catalog import configured_catalog_path
+from .crypto_worker import CryptoWorker, ScanWorker, BatchDecryptWorker
+from .prescan import format_estimate
 
 class CryptoGUI(QWidget):
     """
@@ -172,6 +174,13 @@ class CryptoGUI(QWidget):
         self.drag_widget = DragDropWidget(callback=self.set_input_path, is_file_mode=False)
         layout.addWidget(self.drag_widget)
 
+        self.scan_worker = None
+        self.scan_threads = set()
+        self.scan_label = QLabel("")
+        self.scan_label.setWordWrap(True)
+        self.scan_label.setStyleSheet("color: #888;")
+        layout.addWidget(self.scan_label)
+
         self.password_enc_input = PasswordInput("Password")
         layout.addLayout(self.password_enc_input)
         self.confirm_password_enc_input = PasswordInput("Confirm Password")
@@ -213,7 +222,8 @@ class CryptoGUI(QWidget):
         """Initializes the UI elements for the decryption tab."""
         layout = QVBoxLayout()
         self.enc_file_path = ""
-        self.file_drop_widget = DragDropWidget(callback=self.set_enc_path, is_file_mode=True)
+        self.enc_file_paths = []
+        self.file_drop_widget = DragDropWidget(callback=self.set_enc_path, is_file_mode=True, multiple=True)
         layout.addWidget(self.file_drop_widget)
 
         self.password_dec_input = PasswordInput("Password")
@@ -244,17 +254,75 @@ class CryptoGUI(QWidget):
         """)
         self.btn_decrypt.clicked.connect(self.decrypt)
 
+        # Per-file status for batch decryption; hidden for a single file.
+        self.batch_list = QListWidget()
+        self.batch_list.setVisible(False)
+        self.batch_items = {}
+        layout.addWidget(self.batch_list)
         layout.addWidget(self.progress_dec)
         layout.addWidget(self.btn_decrypt)
         self.decrypt_tab.setLayout(layout)
 
     def set_input_path(self, path: str):
-        """Sets the input path for encryption."""
+        """Sets the input path for encryption and starts a background pre-scan of it."""
         self.input_path = path
+        self.start_prescan(path)
 
-    def set_enc_path(self, path: str):
-        """Sets the input path for decryption."""
-        self.enc_file_path = path
+    def start_prescan(self, path: str):
+        """Cancels any running pre-scan and starts sizing up the given folder."""
+        self.cancel_prescan()
+        if not path or not os.path.isdir(path):
+            return
+        self.scan_label.setText("Scanning folder...")
+        thread = QThread()
+        worker = ScanWorker(path)
+        worker.moveToThread(thread)
+        worker.scan_progress.connect(self.on_prescan_progress)
+        worker.scan_finished.connect(self.on_prescan_finished)
+        worker.scan_failed.connect(self.on_prescan_failed)
+        worker.done.connect(thread.quit)
+        thread.started.connect(worker.run)
+        # Cancelled scans may still be winding down, so keep their threads
+        # alive until they finish.
+        self.scan_threads.add((thread, worker))
+        thread.finished.connect(lambda: self.scan_threads.discard((thread, worker)))
+        self.scan_worker = worker
+        thread.start()
+
+    def cancel_prescan(self):
+        """Stops the current pre-scan, if any, and clears its summary."""
+        if self.scan_worker is not None:
+            self.scan_worker.cancel()
+            self.scan_worker = None
+        self.scan_label.setText("")
+
+    def on_prescan_progress(self, files: int, total_bytes: int):
+        """Shows running counts while the pre-scan walks the folder."""
+        if self.sender() is self.scan_worker:
+            self.scan_label.setText(f"Scanning folder... {files:,} files, {total_bytes / (1024 * 1024):,.0f} MB")
+
+    def on_prescan_finished(self, path: str, estimate: dict):
+        """Shows the pre-scan summary if it is still for the selected folder."""
+        if path == self.input_path:
+            self.scan_label.setText(format_estimate(estimate))
+
+    def on_prescan_failed(self, path: str, error_message: str):
+        """Shows why the pre-scan failed; encryption can still be attempted."""
+        if path == self.input_path:
+            self.scan_label.setText(f"Could not scan folder: {error_message}")
+
+    def set_enc_path(self, path):
+        """Sets the input path, or a list of paths, for decryption."""
+        paths = path if isinstance(path, list) else [path]
+        self.enc_file_paths = paths
+        self.enc_file_path = paths[0] if paths else ""
+        self.batch_list.clear()
+        self.batch_items = {}
+        if len(paths) > 1:
+            for file_path in paths:
+                self.batch_list.addItem(os.path.basename(file_path))
+                self.batch_items[file_path] = self.batch_list.item(self.batch_list.count() - 1)
+        self.batch_list.setVisible(len(paths) > 1)
 
     def encrypt(self):
         """Initiates the encryption process."""
@@ -276,6 +344,7 @@ class CryptoGUI(QWidget):
         folder_name = os.path.basename(self.input_path)
         out_file = os.path.join(os.path.dirname(self.input_path), f"{folder_name}.enc")
 
+        self.cancel_prescan()
         self.progress_enc.setValue(0)
         self.btn_encrypt.setEnabled(False)
         self.progress_enc.setFormat("Encrypting... %p%")
@@ -288,7 +357,9 @@ class CryptoGUI(QWidget):
             password=pwd,
             output_path=out_file,
             delete_source=self.delete_source.isChecked(),
-            export_hashes=self.export_hash.isChecked()
+            export_hashes=self.export_hash.isChecked(),
+            in_subprocess=True,
+            catalog=configured_catalog_path(),
         )
         self.worker.moveToThread(self.thread)
         self.worker.progress_updated.connect(self.progress_enc.setValue)
@@ -318,6 +389,9 @@ class CryptoGUI(QWidget):
 
     def decrypt(self):
         """Initiates the decryption process."""
+        if len(self.enc_file_paths) > 1:
+            self.decrypt_batch()
+            return
         in_path = self.enc_file_path
         if not in_path or not os.path.isfile(in_path):
             QMessageBox.warning(self, "Error", "Please select a valid encrypted file.")
@@ -339,6 +413,8 @@ class CryptoGUI(QWidget):
             path=in_path,
             password=pwd,
             import_hashes=self.import_hash.isChecked(),
+            in_subprocess=True,
+            catalog=configured_catalog_path(),
         )
         self.worker.moveToThread(self.thread)
         self.worker.progress_updated.connect(self.progress_dec.setValue)
@@ -347,6 +423,69 @@ class CryptoGUI(QWidget):
         self.thread.started.connect(self.worker.run)
         self.thread.start()
 
+    def decrypt_batch(self):
+        """Decrypts all selected files in parallel with one password."""
+        missing = [path for path in self.enc_file_paths if not os.path.isfile(path)]
+        if missing:
+            QMessageBox.warning(self, "Error", f"File not found: {missing[0]}")
+            return
+
+        pwd = self.password_dec_input.text()
+        if not pwd:
+            QMessageBox.critical(self, "Error", "Password cannot be empty.")
+            return
+
+        self.progress_dec.setValue(0)
+        self.btn_decrypt.setEnabled(False)
+        self.progress_dec.setFormat(f"Decrypting {len(self.enc_file_paths)} files... %p%")
+        self.progress_dec.setTextVisible(True)
+
+        self.thread = QThread()
+        self.worker = BatchDecryptWorker(
+            self.enc_file_paths,
+            password=pwd,
+            import_hashes=self.import_hash.isChecked(),
+            catalog=configured_catalog_path(),
+        )
+        self.worker.moveToThread(self.thread)
+        self.worker.progress_updated.connect(self.progress_dec.setValue)
+        self.worker.file_progress.connect(self.on_batch_file_progress)
+        self.worker.file_finished.connect(self.on_batch_file_finished)
+        self.worker.batch_finished.connect(self.on_batch_finished)
+        self.thread.started.connect(self.worker.run)
+        self.thread.start()
+
+    def on_batch_file_progress(self, path: str, progress: int):
+        """Shows one file's progress in the batch list."""
+        item = self.batch_items.get(path)
+        if item is not None and progress < 100:
+            item.setText(f"{os.path.basename(path)} - {progress}%")
+
+    def on_batch_file_finished(self, path: str, ok: bool, detail: str):
+        """Marks one file of the batch as done or failed."""
+        item = self.batch_items.get(path)
+        if item is not None:
+            item.setText(f"{os.path.basename(path)} - {'done' if ok else 'failed: ' + detail}")
+
+    def on_batch_finished(self, message: str, out_paths: list):
+        """Handles actions upon completion of a batch decryption."""
+        self.thread.quit()
+        self.thread.wait()
+        QMessageBox.information(self, "Batch Complete", message)
+        self.progress_dec.setValue(0)
+        self.progress_dec.setFormat("")
+        self.progress_dec.setTextVisible(False)
+        self.btn_decrypt.setEnabled(True)
+
+        self.password_dec_input.clear()
+        self.import_hash.setChecked(False)
+        self.file_drop_widget.reset()
+        self.enc_file_path = ""
+        self.enc_file_paths = []
+
+        if out_paths:
+            self.open_explorer_and_highlight(out_paths[0])
+
     def on_decryption_finished(self, message: str, out_path: str):
         """Handles actions upon successful decryption completion."""
         QMessageBox.information(self, "Success", message)
@@ -362,6 +501,7 @@ class CryptoGUI(QWidget):
         
         self.file_drop_widget.reset()
         self.enc_file_path = ""
+        self.enc_file_paths = []
 
         self.open_explorer_and_highlight(out_path)
 
@@ -0,0 +1,368 @@
+import base64
+import hashlib
+import io
+import os
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESSIV
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+from .core_crypto import encrypt_stream, decrypt_stream, recover_rekey, MasterKey, DATA_KEY_SIZE
+from .file_operations import scan_folder
+from .profiling import profiled
+from .resource_limits import cpu_workers, MemoryBudget
+
+MIRROR_KEY_FILE = ".fenc-mirror.key"
+MIRROR_CHUNK_SIZE = 1024 * 1024
+MAX_NAME_LENGTH = 255
+# Encrypted names longer than this are stored under a hash of the encrypted
+# name, with the full encrypted name in a NAME_SIDECAR next to it. Neither
+# the prefix nor the suffix can appear in a base32 name.
+LONG_NAME_LENGTH = 143
+LONG_NAME_PREFIX = "fenc-long-"
+NAME_SIDECAR = ".name"
+# Files whose first block compresses worse than this are stored as is.
+COMPRESS_SAMPLE_SIZE = 64 * 1024
+COMPRESS_MIN_SAVING = 0.1
+STORED = b"\x00"
+DEFLATED = b"\x01"
+
+
+class MirrorKeys:
+    """The master key of an encrypted mirror and the keys derived from it."""
+    def __init__(self, master_key: bytes):
+        self._master_key = master_key
+        names = HKDF(algorithm=hashes.SHA256(), length=64, salt=None,
+                     info=b"fenc mirror names").derive(master_key)
+        self._names = AESSIV(names)
+
+    def file_key(self, relative_path: str) -> MasterKey:
+        """
+        Returns the key for the mirror file of a source path.
+
+        The key is derived from the path, so a mirror file moved or swapped
+        with another one fails to decrypt instead of restoring under the
+        wrong name.
+        """
+        path = "/".join(_path_parts(relative_path))
+        return MasterKey(HKDF(algorithm=hashes.SHA256(), length=32, salt=None,
+                              info=b"fenc mirror file\0" + path.encode("utf-8")).derive(self._master_key))
+
+    def encrypt_name(self, name: str) -> str:
+        """
+        Encrypts one path component deterministically.
+
+        The same name always gives the same encrypted name, so unchanged
+        files keep their mirror path and single files can be located
+        without listing the mirror. Base32 keeps names valid on
+        case-insensitive file systems. The result may be longer than a
+        file name can be; see stored_name().
+        """
+        sealed = self._names.encrypt(name.encode("utf-8"), [b"fenc mirror name"])
+        return base64.b32encode(sealed).decode("ascii").rstrip("=").lower()
+
+    def decrypt_name(self, encoded: str) -> str:
+        """Reverses encrypt_name(); raises ValueError for names that are not ours."""
+        try:
+            padded = encoded.upper() + "=" * (-len(encoded) % 8)
+            return self._names.decrypt(base64.b32decode(padded), [b"fenc mirror name"]).decode("utf-8")
+        except Exception:
+            raise ValueError(f"Not an encrypted mirror name: {encoded}")
+
+    def stored_name(self, name: str) -> tuple:
+        """
+        Returns (file name, encrypted name) of one path component in the mirror.
+
+        Encrypted names too long for common file systems are replaced by a
+        hash of the encrypted name; the encrypted name is then kept in a
+        sidecar file, see write_name_sidecars().
+        """
+        encoded = self.encrypt_name(name)
+        if len(encoded) <= LONG_NAME_LENGTH:
+            return encoded, encoded
+        digest = base64.b32encode(hashlib.sha256(encoded.encode("ascii")).digest()).decode("ascii")
+        return LONG_NAME_PREFIX + digest.rstrip("=").lower(), encoded
+
+    def mirror_path(self, mirror_dir: str, relative_path: str) -> str:
+        """Returns the mirror path of a source path relative to the mirrored folder."""
+        return os.path.join(mirror_dir, *(self.stored_name(part)[0] for part in _path_parts(relative_path)))
+
+    def write_name_sidecars(self, mirror_dir: str, relative_path: str):
+        """Creates the missing sidecars for the long names along a mirror path."""
+        directory = mirror_dir
+        for part in _path_parts(relative_path):
+            stored, encoded = self.stored_name(part)
+            sidecar = os.path.join(directory, stored + NAME_SIDECAR)
+            if stored != encoded and not os.path.exists(sidecar):
+                os.makedirs(directory, exist_ok=True)
+                with open(sidecar, "w", encoding="ascii") as f:
+                    f.write(encoded)
+            directory = os.path.join(directory, stored)
+
+    def read_name(self, directory: str, stored: str) -> str:
+        """Decrypts the name of a mirror entry, following its sidecar for long names."""
+        if stored.startswith(LONG_NAME_PREFIX):
+            try:
+                with open(os.path.join(directory, stored + NAME_SIDECAR), encoding="ascii") as f:
+                    encoded = f.read()
+            except (OSError, UnicodeDecodeError):
+                raise ValueError(f"Missing the name of mirror entry: {stored}")
+            name = self.decrypt_name(encoded)
+            if self.stored_name(name)[0] != stored:
+                raise ValueError(f"Name sidecar does not match mirror entry: {stored}")
+            return name
+        return self.decrypt_name(stored)
+
+
+def _path_parts(relative_path: str) -> list:
+    """Splits a relative path on either separator, dropping empty components."""
+    return [part for part in relative_path.replace("\\", "/").split("/") if part]
+
+
+def open_mirror(mirror_dir: str, password, recipients=None) -> MirrorKeys:
+    """
+    Opens an encrypted mirror, creating its master key on first use.
+
+    The master key is stored in MIRROR_KEY_FILE as an ordinary envelope
+    archive, so it can be unlocked by password, keyfile or X25519 identity
+    and its password changed with rekey_file().
+
+    Args:
+        mirror_dir (str): The mirror folder.
+        password (str | PasswordKey | KeyfileKey | IdentityKey): Opens the master key.
+        recipients (list, optional): Extra X25519 recipients when creating the mirror.
+    """
+    key_path = os.path.join(mirror_dir, MIRROR_KEY_FILE)
+    recover_rekey(key_path)
+    if os.path.exists(key_path):
+        master = io.BytesIO()
+        with open(key_path, "rb") as key_file:
+            decrypt_stream(key_file, master, password)
+        return MirrorKeys(master.getvalue())
+
+    os.makedirs(mirror_dir, exist_ok=True)
+    master_key = os.urandom(DATA_KEY_SIZE)
+    with open(key_path, "wb") as key_file:
+        encrypt_stream(io.BytesIO(master_key), key_file, password, recipients=recipients)
+        key_file.flush()
+        os.fsync(key_file.fileno())
+    return MirrorKeys(master_key)
+
+
+class _CompressingReader:
+    """Reads a file as a one-byte STORED/DEFLATED flag followed by its (compressed) content."""
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        sample = fileobj.read(COMPRESS_SAMPLE_SIZE)
+        compress = sample and len(zlib.compress(sample, 1)) < len(sample) * (1 - COMPRESS_MIN_SAVING)
+        self._compressor = zlib.compressobj(6) if compress else None
+        self._buffer = (DEFLATED if compress else STORED) + self._encode(sample)
+        self._eof = False
+
+    def _encode(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) if self._compressor else data
+
+    def read(self, size: int = -1) -> bytes:
+        while not self._eof and (size < 0 or len(self._buffer) < size):
+            data = self.fileobj.read(MIRROR_CHUNK_SIZE)
+            if data:
+                self._buffer += self._encode(data)
+            else:
+                self._eof = True
+                if self._compressor:
+                    self._buffer += self._compressor.flush()
+        if size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+class _DecompressingWriter:
+    """Writes the content behind a STORED/DEFLATED flag written by _CompressingReader."""
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self._decompressor = None
+        self._mode = None
+
+    def write(self, data) -> int:
+        if self._mode is None and data:
+            self._mode = bytes(data[:1])
+            if self._mode == DEFLATED:
+                self._decompressor = zlib.decompressobj()
+            elif self._mode != STORED:
+                raise ValueError("Unknown mirror file encoding.")
+            data = data[1:]
+        self.fileobj.write(self._decompressor.decompress(data) if self._decompressor else data)
+        return len(data)
+
+    def close(self):
+        if self._decompressor:
+            self.fileobj.write(self._decompressor.flush())
+
+
+def _encrypt_file(keys: MirrorKeys, source: str, destination: str, relative_path: str, cipher=None):
+    """Compresses and encrypts one file to its mirror path, atomically."""
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    temp_path = destination + ".tmp"
+    try:
+        with open(source, "rb") as infile, open(temp_path, "wb") as outfile:
+            encrypt_stream(_CompressingReader(infile), outfile, keys.file_key(relative_path),
+                           chunk_size=MIRROR_CHUNK_SIZE, cipher=cipher)
+        stat = os.stat(source)
+        os.utime(temp_path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        os.replace(temp_path, destination)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def _decrypt_file(keys: MirrorKeys, source: str, destination: str, relative_path: str):
+    """Decrypts and decompresses one mirror file."""
+    os.makedirs(os.path.dirname(destination) or ".", exist_ok=True)
+    with open(source, "rb") as infile, open(destination, "wb") as outfile:
+        writer = _DecompressingWriter(outfile)
+        decrypt_stream(infile, writer, keys.file_key(relative_path))
+        writer.close()
+    stat = os.stat(source)
+    os.utime(destination, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+
+def _walk_mirror(keys: MirrorKeys, directory: str, prefix: str = ""):
+    """Yields (relative source path, mirror path) for every file below a mirror folder."""
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.name == MIRROR_KEY_FILE or entry.name.endswith((".tmp", NAME_SIDECAR)):
+                continue
+            try:
+                name = keys.read_name(directory, entry.name)
+            except ValueError:
+                continue
+            relative = f"{prefix}{name}"
+            if entry.is_dir(follow_symlinks=False):
+                yield from _walk_mirror(keys, entry.path, relative + "/")
+            else:
+                yield relative, entry.path
+
+
+def _remove_entry(path: str, remove):
+    """Removes a mirror file or folder together with its long-name sidecar."""
+    remove(path)
+    if os.path.basename(path).startswith(LONG_NAME_PREFIX) and os.path.exists(path + NAME_SIDECAR):
+        os.remove(path + NAME_SIDECAR)
+
+
+def _run_pool(func, jobs: list, workers: int, progress_callback):
+    """Runs func over jobs on a thread pool, reporting (done, total)."""
+    done = 0
+    # Every worker holds a few chunks, so by default the memory budget sizes the pool.
+    with ThreadPoolExecutor(max_workers=cpu_workers(workers) if workers else MemoryBudget().max_workers) as pool:
+        for _ in pool.map(lambda job: func(*job), jobs):
+            done += 1
+            if progress_callback:
+                progress_callback(done, len(jobs))
+
+
+@profiled()
+def mirror_folder(folder_path: str, mirror_dir: str, password, progress_callback=None,
+                  workers: int = None, cipher=None, recipients=None) -> dict:
+    """
+    Mirrors a folder as one encrypted file per source file.
+
+    Every file is compressed (unless it does not compress) and encrypted
+    independently on a worker pool, as a small envelope archive under a key
+    derived from the mirror's master key; file and folder names are
+    encrypted with AES-SIV. Running it again only re-encrypts files whose
+    modification time changed and removes files deleted from the source,
+    so the mirror can be synced incrementally with rsync or similar tools.
+    Each file's key is derived from its path, so files cannot be swapped
+    within the mirror.
+
+    Args:
+        folder_path (str): Folder to mirror.
+        mirror_dir (str): Folder that receives the encrypted mirror.
+        password (str | PasswordKey | KeyfileKey | IdentityKey): Opens (or creates)
+                                                               the master key.
+        progress_callback (callable, optional): A function to call with
+                                                 (encrypted_files, total_files).
+        workers (int, optional): Number of worker threads. Defaults to what the memory
+                                 budget allows, at most the CPU count.
+        cipher (str, optional): Forces "aes-gcm" or "chacha20-poly1305".
+        recipients (list, optional): Extra X25519 recipients when creating the mirror.
+
+    Returns:
+        dict: Counts of "encrypted", "unchanged" and "removed" files.
+    """
+    keys = open_mirror(mirror_dir, password, recipients)
+    jobs = []
+    wanted = set()
+    unchanged = 0
+    for full_path, arcname, _ in scan_folder(folder_path):
+        destination = keys.mirror_path(mirror_dir, arcname)
+        wanted.add(os.path.normcase(destination))
+        try:
+            if os.stat(destination).st_mtime_ns == os.stat(full_path).st_mtime_ns:
+                unchanged += 1
+                continue
+        except FileNotFoundError:
+            pass
+        keys.write_name_sidecars(mirror_dir, arcname)
+        jobs.append((keys, full_path, destination, arcname, cipher))
+    _run_pool(_encrypt_file, jobs, workers, progress_callback)
+
+    removed = 0
+    for _, mirror_path in list(_walk_mirror(keys, mirror_dir)):
+        if os.path.normcase(mirror_path) not in wanted:
+            _remove_entry(mirror_path, os.remove)
+            removed += 1
+    for root, dirs, files in os.walk(mirror_dir, topdown=False):
+        if root != mirror_dir and not os.listdir(root):
+            _remove_entry(root, os.rmdir)
+    return {"encrypted": len(jobs), "unchanged": unchanged, "removed": removed}
+
+
+@profiled()
+def restore_mirror(mirror_dir: str, target_dir: str, password, paths: list = None,
+                   progress_callback=None, workers: int = None) -> int:
+    """
+    Restores all or part of an encrypted mirror.
+
+    Because names are encrypted deterministically, the requested files and
+    folders are located directly; nothing else in the mirror is read.
+
+    Args:
+        mirror_dir (str): The encrypted mirror.
+        target_dir (str): Folder to restore into.
+        password (str | PasswordKey | KeyfileKey | IdentityKey): Opens the master key.
+        paths (list, optional): Files or folders, relative to the mirrored folder,
+                                to restore. Defaults to everything.
+        progress_callback (callable, optional): A function to call with
+                                                 (restored_files, total_files).
+        workers (int, optional): Number of worker threads. Defaults to what the memory
+                                 budget allows, at most the CPU count.
+
+    Returns:
+        int: Number of files restored.
+    """
+    keys = open_mirror(mirror_dir, password)
+    selected = []
+    for path in paths or [""]:
+        path = path.replace("\\", "/").strip("/")
+        source = keys.mirror_path(mirror_dir, path)
+        if os.path.isdir(source):
+            selected.extend(_walk_mirror(keys, source, path + "/" if path else ""))
+        elif os.path.isfile(source):
+            selected.append((path, source))
+        else:
+            raise FileNotFoundError(f"Not in the mirror: {path}")
+
+    jobs = [(keys, source, os.path.join(target_dir, *relative.split("/")), relative) for relative, source in selected]
+    _run_pool(_decrypt_file, jobs, workers, progress_callback)
+    return len(jobs)
+
+
+def list_mirror(mirror_dir: str, password) -> list:
+    """Returns the relative paths of all files in an encrypted mirror, sorted."""
+    keys = open_mirror(mirror_dir, password)
+    return sorted(relative for relative, _ in _walk_mirror(keys, mirror_dir))
@@ -0,0 +1,130 @@
+import os
+import shutil
+import time
+import zlib
+
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+SAMPLE_FILES = 64
+SAMPLE_BYTES = 64 * 1024
+BENCHMARK_BYTES = 4 * 1024 * 1024
+# Opening, reading and closing a file costs a few times more than the
+# stat() the scan already paid for it.
+PER_FILE_COST_FACTOR = 3
+
+_encrypt_rate = None
+
+
+class ScanCancelled(Exception):
+    """Raised inside prescan_folder() when the caller cancels the scan."""
+
+
+def encrypt_throughput() -> float:
+    """Measures AES-256-GCM throughput of this machine in bytes per second, once per process."""
+    global _encrypt_rate
+    if _encrypt_rate is None:
+        aead = AESGCM(AESGCM.generate_key(bit_length=256))
+        data = os.urandom(BENCHMARK_BYTES)
+        start = time.perf_counter()
+        aead.encrypt(os.urandom(12), data, None)
+        _encrypt_rate = BENCHMARK_BYTES / max(time.perf_counter() - start, 1e-6)
+    return _encrypt_rate
+
+
+def prescan_folder(folder_path: str, target_dir: str = None, cancel_event=None, progress_callback=None) -> dict:
+    """
+    Sizes up a folder before it is encrypted.
+
+    Walks the folder with os.scandir(), compresses a sample of the files
+    to estimate compressibility and compression speed, and combines these
+    with a short AES-GCM benchmark into a run-time estimate.
+
+    Args:
+        folder_path (str): Folder that will be encrypted.
+        target_dir (str, optional): Folder the archive will be written to.
+                                    Defaults to the parent of folder_path.
+        cancel_event (threading.Event, optional): Stops the scan with
+                                                  ScanCancelled once set.
+        progress_callback (callable, optional): A function to call with
+                                                 (files, total_bytes) while walking.
+
+    Returns:
+        dict: "files", "bytes", "compress_ratio" (compressed/original of the
+              sample), "free_bytes" on the target, "needed_bytes" (the
+              temporary archive plus the encrypted copy) and "seconds".
+    """
+    target_dir = target_dir or os.path.dirname(os.path.abspath(folder_path))
+    files = []
+    total_bytes = 0
+    start = time.perf_counter()
+    pending = [folder_path]
+    while pending:
+        with os.scandir(pending.pop()) as entries:
+            for entry in entries:
+                if cancel_event is not None and cancel_event.is_set():
+                    raise ScanCancelled()
+                if entry.is_dir(follow_symlinks=False):
+                    pending.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    size = entry.stat(follow_symlinks=False).st_size
+                    files.append((entry.path, size))
+                    total_bytes += size
+                    if progress_callback and len(files) % 1000 == 0:
+                        progress_callback(len(files), total_bytes)
+    scan_seconds = time.perf_counter() - start
+
+    ratio, compress_rate = _sample_compression(files, cancel_event)
+    seconds = total_bytes / compress_rate + total_bytes * ratio / encrypt_throughput()
+    seconds += scan_seconds * PER_FILE_COST_FACTOR
+    return {
+        "files": len(files),
+        "bytes": total_bytes,
+        "compress_ratio": ratio,
+        "free_bytes": shutil.disk_usage(target_dir).free,
+        "needed_bytes": int(total_bytes * ratio * 2),
+        "seconds": seconds,
+    }
+
+
+def _sample_compression(files, cancel_event=None):
+    """Compresses the head of evenly spaced files; returns (ratio, bytes per second)."""
+    if not files:
+        return 1.0, float("inf")
+    step = max(1, len(files) // SAMPLE_FILES)
+    raw = packed = 0
+    elapsed = 0.0
+    for path, _ in files[::step][:SAMPLE_FILES]:
+        if cancel_event is not None and cancel_event.is_set():
+            raise ScanCancelled()
+        try:
+            with open(path, "rb") as f:
+                data = f.read(SAMPLE_BYTES)
+        except OSError:
+            continue
+        start = time.perf_counter()
+        packed += len(zlib.compress(data, 6))
+        elapsed += time.perf_counter() - start
+        raw += len(data)
+    if not raw:
+        return 1.0, float("inf")
+    return min(packed / raw, 1.0), raw / max(elapsed, 1e-6)
+
+
+def _format_size(size: float) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+
+def format_estimate(estimate: dict) -> str:
+    """Returns a one-paragraph summary of a prescan_folder() result for the GUI."""
+    seconds = int(estimate["seconds"]) + 1
+    duration = f"{seconds // 60} min {seconds % 60} s" if seconds >= 60 else f"{seconds} s"
+    text = (f"{estimate['files']:,} files, {_format_size(estimate['bytes'])}, "
+            f"compresses to ~{estimate['compress_ratio']:.0%}. "
+            f"Estimated time: {duration}. Free space: {_format_size(estimate['free_bytes'])}.")
+    if estimate["needed_bytes"] > estimate["free_bytes"]:
+        text += f" Needs about {_format_size(estimate['needed_bytes'])} - not enough free space!"
+    return text
@@ -0,0 +1,143 @@
+import cProfile
+import functools
+import io
+import itertools
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+PROFILE_DIR_ENV = "FOLDER_ENC_PROFILE_DIR"
+TOP_ALLOCATIONS = 25
+TRACEMALLOC_FRAMES = 10
+
+_profile_dir = os.environ.get(PROFILE_DIR_ENV) or None
+# cProfile can only have one active profiler per process on recent Pythons,
+# so a single session runs at a time and nested calls join it.
+_session_lock = threading.Lock()
+_local = threading.local()
+_session_ids = itertools.count(1)
+
+
+def enable_profiling(directory: str):
+    """
+    Turns on per-job profiling.
+
+    Args:
+        directory (str): Folder that receives the .prof files and allocation reports.
+    """
+    global _profile_dir
+    os.makedirs(directory, exist_ok=True)
+    _profile_dir = directory
+
+
+def disable_profiling():
+    """Turns off per-job profiling."""
+    global _profile_dir
+    _profile_dir = None
+
+
+def profiling_enabled() -> bool:
+    """Returns True if profiling is turned on by setting or environment."""
+    return _profile_dir is not None
+
+
+def profiling_directory() -> str:
+    """Returns the folder profiles are written to, or None if profiling is off."""
+    return _profile_dir
+
+
+@contextmanager
+def profile_session(name: str):
+    """
+    Profiles the enclosed block with cProfile and tracemalloc.
+
+    Writes <name>-<timestamp>-<pid>-<n>.prof (loadable with pstats or snakeviz),
+    a .txt summary of the top functions and a .alloc.txt file with the top
+    allocation sites to the profiling directory. Does nothing when profiling
+    is off, when called inside another session, or while another thread is
+    being profiled.
+
+    Args:
+        name (str): Job or function name used in the output file names.
+
+    Yields:
+        dict: Filled on exit with the paths of the written "profile",
+              "summary" and "allocations" files; stays empty if nothing
+              was profiled.
+    """
+    files = {}
+    directory = _profile_dir
+    if directory is None or getattr(_local, "active", False) or not _session_lock.acquire(blocking=False):
+        yield files
+        return
+
+    _local.active = True
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+        try:
+            yield files
+        finally:
+            profiler.disable()
+            snapshot = tracemalloc.take_snapshot()
+            peak = tracemalloc.get_traced_memory()[1]
+            if started_tracing:
+                tracemalloc.stop()
+            files.update(_write_profile(directory, name, profiler, snapshot, peak))
+    finally:
+        _local.active = False
+        _session_lock.release()
+
+
+def _write_profile(directory: str, name: str, profiler, snapshot, peak: int) -> dict:
+    """Dumps the profiler statistics and top allocation sites of one session; returns the file paths."""
+    os.makedirs(directory, exist_ok=True)
+    safe_name = "".join(c if c.isalnum() or c in "-_." else "_" for c in name)
+    base = os.path.join(directory, f"{safe_name}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{next(_session_ids)}")
+
+    profiler.dump_stats(base + ".prof")
+    summary = io.StringIO()
+    pstats.Stats(profiler, stream=summary).sort_stats("cumulative").print_stats(40)
+    with open(base + ".txt", "w", encoding="utf-8") as summary_file:
+        summary_file.write(summary.getvalue())
+
+    snapshot = snapshot.filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    ))
+    with open(base + ".alloc.txt", "w", encoding="utf-8") as alloc_file:
+        alloc_file.write(f"Peak traced memory: {peak} bytes\n\n")
+        for index, stat in enumerate(snapshot.statistics("traceback")[:TOP_ALLOCATIONS], 1):
+            alloc_file.write(f"#{index}: {stat.size} bytes in {stat.count} blocks\n")
+            for line in stat.traceback.format():
+                alloc_file.write(f"    {line}\n")
+    return {"profile": base + ".prof", "summary": base + ".txt", "allocations": base + ".alloc.txt"}
+
+
+def profiled(name: str = None):
+    """
+    Decorator that runs a function inside a profile_session().
+
+    When profiling is off the wrapper only checks one module global before
+    calling through, so hot paths can stay decorated in production.
+
+    Args:
+        name (str, optional): Session name. Defaults to the function's qualified name.
+    """
+    def decorator(func):
+        session_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _profile_dir is None or getattr(_local, "active", False):
+                return func(*args, **kwargs)
+            with profile_session(session_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,433 @@
+import contextlib
+import contextvars
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+
+MEMORY_BUDGET_ENV = "FOLDER_ENC_MEMORY_MB"
+DEFAULT_MEMORY_BUDGET_MB = 256
+MIN_MEMORY_BUDGET_MB = 32
+
+MIN_CHUNK_SIZE = 64 * 1024
+MAX_CHUNK_SIZE = 4 * 1024 * 1024
+
+# Concurrent jobs per disk: solid-state storage handles a few parallel
+# streams well, a spinning disk mostly seeks between them.
+MAX_SSD_JOBS = 4
+UNKNOWN_DISK_JOBS = 2
+
+IO_LIMIT_ENV = "FOLDER_ENC_IO_MBPS"
+CPU_WORKERS_ENV = "FOLDER_ENC_CPU_WORKERS"
+# Bytes the I/O limiter lets through at once after an idle period.
+IO_BURST_SECONDS = 0.25
+
+# Rough per-entry cost of a ZipInfo kept in memory until the central
+# directory is written, excluding the entry name itself.
+ZIP_ENTRY_OVERHEAD = 400
+# Rough per-entry cost of a solid archive's hash manifest and tarfile's
+# inode map, and of its optional member index, excluding the names.
+TAR_ENTRY_OVERHEAD = 300
+TAR_INDEX_ENTRY_OVERHEAD = 120
+
+
+def current_rss() -> int:
+    """Returns the resident set size of this process in bytes (0 if unknown)."""
+    if sys.platform.startswith("linux"):
+        try:
+            with open("/proc/self/statm") as statm:
+                return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError, IndexError):
+            return 0
+    if os.name == "nt":
+        counters = _windows_memory_counters()
+        return counters.WorkingSetSize if counters else 0
+    return peak_rss()
+
+
+def peak_rss() -> int:
+    """
+    Returns the peak resident set size of this process in bytes.
+
+    On Linux this is the high-water mark since the last call to
+    reset_peak_rss(); elsewhere it is the peak over the process lifetime,
+    which is still a valid upper bound for any single job.
+    """
+    if sys.platform.startswith("linux"):
+        try:
+            with open("/proc/self/status") as status:
+                for line in status:
+                    if line.startswith("VmHWM:"):
+                        return int(line.split()[1]) * 1024
+        except (OSError, ValueError, IndexError):
+            pass
+    if os.name == "nt":
+        counters = _windows_memory_counters()
+        return counters.PeakWorkingSetSize if counters else 0
+    try:
+        import resource
+    except ImportError:
+        return 0
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, the other Unixes report kilobytes.
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+def reset_peak_rss() -> bool:
+    """
+    Resets the peak RSS high-water mark so that it covers a single job.
+
+    Returns:
+        bool: True if the platform supports resetting the peak.
+    """
+    if not sys.platform.startswith("linux"):
+        return False
+    try:
+        with open("/proc/self/clear_refs", "w") as clear_refs:
+            clear_refs.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _windows_memory_counters():
+    """Returns PROCESS_MEMORY_COUNTERS for this process, or None on failure."""
+    import ctypes
+    from ctypes import wintypes
+
+    class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+        _fields_ = [
+            ("cb", wintypes.DWORD),
+            ("PageFaultCount", wintypes.DWORD),
+            ("PeakWorkingSetSize", ctypes.c_size_t),
+            ("WorkingSetSize", ctypes.c_size_t),
+            ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+            ("PagefileUsage", ctypes.c_size_t),
+            ("PeakPagefileUsage", ctypes.c_size_t),
+        ]
+
+    counters = PROCESS_MEMORY_COUNTERS()
+    counters.cb = ctypes.sizeof(counters)
+    try:
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        ok = ctypes.windll.psapi.GetProcessMemoryInfo(
+            process, ctypes.byref(counters), counters.cb)
+    except (AttributeError, OSError):
+        return None
+    return counters if ok else None
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket that limits a byte rate.
+
+    Callers take tokens for the bytes they are about to move and sleep when
+    the bucket is empty, so concurrent jobs sharing a bucket share its rate.
+    """
+    def __init__(self, rate: float, burst: float = None):
+        """
+        Initializes the TokenBucket.
+
+        Args:
+            rate (float): Bytes per second.
+            burst (float, optional): Bucket capacity in bytes. Defaults to
+                                     IO_BURST_SECONDS worth of rate.
+        """
+        if rate <= 0:
+            raise ValueError("Rate must be positive.")
+        self.rate = rate
+        self.capacity = burst or max(rate * IO_BURST_SECONDS, 1)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, amount: int):
+        """Takes amount tokens, sleeping until the rate allows it."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # Requests larger than the bucket go into debt instead of
+            # blocking forever; the debt is paid off by the sleep below.
+            self._tokens -= amount
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+
+def _env_number(name: str):
+    value = os.environ.get(name)
+    return float(value) if value else None
+
+
+_io_limiter = None
+_cpu_workers = None
+# Limits of the job running under job_limits() in the current thread (and
+# in the helper threads it starts through in_job()), on top of the
+# process-wide ones.
+_job_io_limiter = contextvars.ContextVar("job_io_limiter", default=None)
+_job_cpu_workers = contextvars.ContextVar("job_cpu_workers", default=None)
+
+
+def set_io_limit(mb_per_s: float = None):
+    """
+    Limits the disk throughput of every job in this process.
+
+    Args:
+        mb_per_s (float, optional): Shared limit in MB/s, or None for no limit.
+    """
+    global _io_limiter
+    _io_limiter = TokenBucket(mb_per_s * 1024 * 1024) if mb_per_s else None
+
+
+def throttle_io(nbytes: int):
+    """Blocks as long as needed to keep nbytes within the I/O limits, if any are set."""
+    for limiter in (_io_limiter, _job_io_limiter.get()):
+        if limiter is not None:
+            limiter.consume(nbytes)
+
+
+def set_cpu_workers(workers: int = None):
+    """
+    Caps the number of CPU-bound worker threads each stage may start.
+
+    Args:
+        workers (int, optional): Maximum worker threads, or None for no cap.
+    """
+    global _cpu_workers
+    if workers is not None and workers < 1:
+        raise ValueError("CPU worker cap must be at least 1.")
+    _cpu_workers = workers
+
+
+def cpu_workers(wanted: int = None) -> int:
+    """Returns wanted (default: the CPU count) reduced to the process and job caps."""
+    wanted = wanted or os.cpu_count() or 1
+    for cap in (_cpu_workers, _job_cpu_workers.get()):
+        if cap:
+            wanted = max(1, min(wanted, cap))
+    return wanted
+
+
+def in_job(func):
+    """
+    Wraps func so it runs under the calling job's limits in another thread.
+
+    Pool threads do not inherit the limits set with job_limits(); submit
+    in_job(func) instead of func for work that should count against them.
+    """
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.copy().run(func, *args, **kwargs)
+
+
+def lower_priority() -> bool:
+    """
+    Lowers the CPU and I/O priority of the calling thread and the threads it starts.
+
+    On Linux this is the thread's nice value and its idle I/O class (via
+    ionice, if installed); on Windows the whole process enters background
+    mode, which also lowers its I/O and memory priority.
+
+    Returns:
+        bool: True if the priority was lowered.
+    """
+    if os.name == "nt":
+        try:
+            import ctypes
+            kernel32 = ctypes.windll.kernel32
+            PROCESS_MODE_BACKGROUND_BEGIN = 0x00100000
+            return bool(kernel32.SetPriorityClass(kernel32.GetCurrentProcess(), PROCESS_MODE_BACKGROUND_BEGIN))
+        except (AttributeError, OSError):
+            return False
+    try:
+        # On Linux setpriority() with who=0 only affects the calling thread.
+        os.setpriority(os.PRIO_PROCESS, 0, min(os.getpriority(os.PRIO_PROCESS, 0) + 10, 19))
+    except (AttributeError, OSError):
+        return False
+    if sys.platform.startswith("linux") and shutil.which("ionice"):
+        subprocess.run(["ionice", "-c", "3", "-p", str(threading.get_native_id())],
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
+    return True
+
+
+def _restore_priority(niceness: int):
+    """Undoes lower_priority() for the calling thread, as far as the OS allows."""
+    if os.name == "nt":
+        try:
+            import ctypes
+            kernel32 = ctypes.windll.kernel32
+            PROCESS_MODE_BACKGROUND_END = 0x00200000
+            kernel32.SetPriorityClass(kernel32.GetCurrentProcess(), PROCESS_MODE_BACKGROUND_END)
+        except (AttributeError, OSError):
+            pass
+        return
+    try:
+        # Unprivileged threads may not lower their nice value again; they
+        # then keep the lower CPU priority until they exit.
+        os.setpriority(os.PRIO_PROCESS, 0, niceness)
+    except (AttributeError, OSError):
+        pass
+    if sys.platform.startswith("linux") and shutil.which("ionice"):
+        subprocess.run(["ionice", "-c", "0", "-p", str(threading.get_native_id())],
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
+
+
+@contextlib.contextmanager
+def job_limits(io_limit_mb_s: float = None, workers: int = None, low_priority: bool = False):
+    """
+    Applies a job's limits to the calling thread while the job runs.
+
+    The limits hold for the calling thread and the helper threads it starts
+    through in_job(), so jobs running side by side each keep their own. They
+    apply on top of the process-wide limits set with set_io_limit() and
+    set_cpu_workers(), which every job shares. low_priority only lowers the
+    calling thread, and its priority is restored on exit.
+
+    Args:
+        io_limit_mb_s (float, optional): Disk throughput limit in MB/s.
+        workers (int, optional): Cap on CPU worker threads.
+        low_priority (bool): Whether to run at lower CPU and I/O priority.
+    """
+    if workers is not None and workers < 1:
+        raise ValueError("CPU worker cap must be at least 1.")
+    io_token = _job_io_limiter.set(TokenBucket(io_limit_mb_s * 1024 * 1024) if io_limit_mb_s else None)
+    workers_token = _job_cpu_workers.set(workers)
+    niceness = None
+    try:
+        if low_priority:
+            niceness = os.getpriority(os.PRIO_PROCESS, 0) if hasattr(os, "getpriority") else 0
+            if not lower_priority():
+                niceness = None
+        yield
+    finally:
+        if niceness is not None:
+            _restore_priority(niceness)
+        _job_cpu_workers.reset(workers_token)
+        _job_io_limiter.reset(io_token)
+
+
+def is_rotational(path: str):
+    """
+    Returns True if path lives on a spinning disk, False for solid-state
+    storage, or None if it cannot be told (non-Linux, network or virtual
+    file systems).
+    """
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        device = os.stat(path).st_dev
+        block = f"/sys/dev/block/{os.major(device)}:{os.minor(device)}"
+        # Partitions have no queue directory of their own; their parent disk does.
+        for queue in (os.path.join(block, "queue"), os.path.join(block, "..", "queue")):
+            rotational = os.path.join(queue, "rotational")
+            if os.path.exists(rotational):
+                with open(rotational) as f:
+                    return f.read().strip() == "1"
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def io_concurrency(path: str) -> int:
+    """Returns how many I/O-heavy jobs should run at once on path's disk."""
+    rotational = is_rotational(path)
+    if rotational:
+        return 1
+    return cpu_workers(MAX_SSD_JOBS if rotational is False else UNKNOWN_DISK_JOBS)
+
+
+class MemoryBudget:
+    """
+    A memory budget for a whole encryption or decryption job.
+
+    The budget is an upper limit for the resident size of the process. The
+    part of it not already used when the job starts is split between I/O
+    buffers, worker pools and the zip index, so every stage can size itself
+    from the same object.
+    """
+    def __init__(self, budget_mb: int = None):
+        """
+        Initializes the MemoryBudget.
+
+        Args:
+            budget_mb (int, optional): Budget in megabytes. Defaults to the
+                                       FOLDER_ENC_MEMORY_MB environment
+                                       variable, or 256 MB.
+        """
+        if budget_mb is None:
+            budget_mb = int(os.environ.get(MEMORY_BUDGET_ENV, DEFAULT_MEMORY_BUDGET_MB))
+        if budget_mb < MIN_MEMORY_BUDGET_MB:
+            raise ValueError(f"Memory budget must be at least {MIN_MEMORY_BUDGET_MB} MB.")
+        self.budget_bytes = budget_mb * 1024 * 1024
+        self.baseline_bytes = current_rss()
+
+    @property
+    def working_bytes(self) -> int:
+        """Bytes available to the job on top of the baseline process size."""
+        return max(self.budget_bytes - self.baseline_bytes, MIN_MEMORY_BUDGET_MB * 1024 * 1024 // 4)
+
+    @property
+    def chunk_size(self) -> int:
+        """Size of a single read/encrypt/write buffer."""
+        chunk = self.working_bytes // 64
+        chunk = max(MIN_CHUNK_SIZE, min(chunk, MAX_CHUNK_SIZE))
+        # Keep buffers a multiple of the AES block size.
+        return chunk - chunk % 16
+
+    @property
+    def max_workers(self) -> int:
+        """Number of concurrent workers that each hold a few buffers."""
+        by_memory = self.working_bytes // (self.chunk_size * 8)
+        return max(1, min(by_memory, cpu_workers()))
+
+    def check_zip_entries(self, entry_count: int, name_bytes: int):
+        """
+        Ensures the in-memory zip central directory fits in the budget.
+
+        Args:
+            entry_count (int): Number of entries that will be archived.
+            name_bytes (int): Total length of all entry names.
+
+        Raises:
+            MemoryError: If the directory would use more than half the budget.
+        """
+        needed = entry_count * ZIP_ENTRY_OVERHEAD + name_bytes * 2
+        if needed > self.working_bytes // 2:
+            raise MemoryError(
+                f"Zip index for {entry_count} files needs about {needed // (1024 * 1024)} MB, "
+                f"which exceeds the memory budget of {self.budget_bytes // (1024 * 1024)} MB.")
+
+    def check_tar_entries(self, entry_count: int, name_bytes: int, member_index: bool = False):
+        """
+        Ensures what a solid archive keeps per entry fits in the budget.
+
+        Args:
+            entry_count (int): Number of entries that will be archived.
+            name_bytes (int): Total length of all entry names.
+            member_index (bool): Whether to include the member offset index.
+
+        Raises:
+            MemoryError: If the entries would use more than half the budget.
+        """
+        needed = entry_count * TAR_ENTRY_OVERHEAD + name_bytes * 2
+        if member_index:
+            needed += entry_count * TAR_INDEX_ENTRY_OVERHEAD + name_bytes
+        if needed > self.working_bytes // 2:
+            raise MemoryError(
+                f"Solid archive index for {entry_count} files needs about {needed // (1024 * 1024)} MB, "
+                f"which exceeds the memory budget of {self.budget_bytes // (1024 * 1024)} MB.")
+
+
+def _apply_environment():
+    """Applies the limits set with FOLDER_ENC_IO_MBPS and FOLDER_ENC_CPU_WORKERS."""
+    set_io_limit(_env_number(IO_LIMIT_ENV))
+    if _env_number(CPU_WORKERS_ENV):
+        set_cpu_workers(int(_env_number(CPU_WORKERS_ENV)))
+
+
+_apply_environment()
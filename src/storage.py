@@ -0,0 +1,400 @@
+import bisect
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, ALL_COMPLETED, FIRST_COMPLETED, wait
+
+S3_ENDPOINT_ENV = "FOLDER_ENC_S3_ENDPOINT"
+S3_PART_SIZE = 16 * 1024 * 1024  # S3 needs parts of at least 5 MiB, except the last
+S3_MAX_PART_SIZE = 5 * 1024 ** 3
+S3_MAX_PARTS = 10000
+S3_PART_GROWTH = 2000  # parts between doublings of the part size
+S3_UPLOAD_WORKERS = 4
+S3_RETRIES = 4
+S3_RETRY_DELAY = 0.5
+VOLUME_SUFFIX = ".{:03d}"
+
+
+def _s3_client():
+    """Creates a boto3 S3 client, honouring FOLDER_ENC_S3_ENDPOINT (e.g. a MinIO server)."""
+    try:
+        import boto3
+    except ImportError as e:
+        raise ImportError("S3 storage needs boto3: pip install boto3") from e
+    return boto3.client("s3", endpoint_url=os.environ.get(S3_ENDPOINT_ENV) or None)
+
+
+def _parse_s3_url(url: str):
+    """Splits s3://bucket/key into (bucket, key)."""
+    bucket, _, key = url[len("s3://"):].partition("/")
+    if not bucket or not key:
+        raise ValueError(f"Expected s3://bucket/key, got {url}")
+    return bucket, key
+
+
+def _retry(func, retries: int):
+    """Calls func, retrying with exponential backoff on any error."""
+    for attempt in range(retries + 1):
+        try:
+            return func()
+        except Exception:
+            # botocore raises several unrelated types for throttling, resets
+            # and timeouts; the last attempt re-raises whatever happened.
+            if attempt == retries:
+                raise
+            time.sleep(S3_RETRY_DELAY * 2 ** attempt)
+
+
+def _s3_part_size(total_size: int = None, part_size: int = S3_PART_SIZE) -> int:
+    """Returns the first part size for an upload, large enough for total_size bytes in S3_MAX_PARTS parts."""
+    if total_size:
+        part_size = max(part_size, -(-total_size // S3_MAX_PARTS))
+    return min(part_size, S3_MAX_PART_SIZE)
+
+
+class LocalSink:
+    """Writes encrypted output to a local file."""
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "wb")
+
+    def write(self, data) -> int:
+        return self._file.write(data)
+
+    def commit(self):
+        """Flushes the file to disk and closes it."""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+
+    def abort(self):
+        """Closes and removes the partial file."""
+        self._file.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+
+
+class VolumeSink(LocalSink):
+    """
+    Splits encrypted output into fixed-size volumes path.000, path.001, ...
+
+    Useful for media or file systems with a maximum file size.
+    """
+    def __init__(self, path: str, volume_size: int):
+        if volume_size <= 0:
+            raise ValueError("Volume size must be positive.")
+        self.base_path = path
+        self.volume_size = volume_size
+        self.volumes = []
+        self._written = 0
+        self._next_volume()
+
+    def _next_volume(self):
+        if self.volumes:
+            super().commit()
+        LocalSink.__init__(self, self.base_path + VOLUME_SUFFIX.format(len(self.volumes)))
+        self.volumes.append(self.path)
+        self._written = 0
+
+    def write(self, data) -> int:
+        view = memoryview(data)
+        while view:
+            if self._written == self.volume_size:
+                self._next_volume()
+            n = self._file.write(view[:self.volume_size - self._written])
+            self._written += n
+            view = view[n:]
+        return len(data)
+
+    def abort(self):
+        """Closes and removes every volume written so far."""
+        self._file.close()
+        for path in self.volumes:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+class S3Sink:
+    """
+    Streams encrypted output to an S3-compatible object store as a multipart upload.
+
+    Parts are uploaded by a small thread pool while encryption continues;
+    at most two parts per worker are buffered, so memory stays bounded
+    regardless of the archive size. Failed part uploads are retried with
+    exponential backoff and an aborted upload is cleaned up on the server.
+
+    S3 allows at most 10,000 parts. The part size starts large enough for
+    total_size when it is known, and doubles every S3_PART_GROWTH parts in
+    any case, so a 16 MiB start reaches about 1 TiB.
+    """
+    def __init__(self, bucket: str, key: str, part_size: int = S3_PART_SIZE, workers: int = S3_UPLOAD_WORKERS,
+                 retries: int = S3_RETRIES, client=None, total_size: int = None):
+        """
+        Initializes the S3Sink.
+
+        Args:
+            bucket (str): Target bucket.
+            key (str): Target object key.
+            part_size (int): Bytes per uploaded part to start with, at least 5 MiB for S3.
+            workers (int): Concurrent part uploads.
+            retries (int): Retries per part before the upload fails.
+            client (optional): A boto3 S3 client. Created from the environment if None.
+            total_size (int, optional): Expected size of the object, if known.
+        """
+        self.client = client or _s3_client()
+        self.bucket = bucket
+        self.key = key
+        self.part_size = _s3_part_size(total_size, part_size)
+        self.workers = workers
+        self.retries = retries
+        self.upload_id = self.client.create_multipart_upload(Bucket=bucket, Key=key)["UploadId"]
+        self._buffer = bytearray()
+        self._etags = {}
+        self._pending = set()
+        self._next_part = 1
+        self._pool = ThreadPoolExecutor(max_workers=workers)
+
+    @classmethod
+    def from_url(cls, url: str, **kwargs):
+        """Creates a sink for an s3://bucket/key URL."""
+        return cls(*_parse_s3_url(url), **kwargs)
+
+    def _current_part_size(self) -> int:
+        return min(self.part_size << ((self._next_part - 1) // S3_PART_GROWTH), S3_MAX_PART_SIZE)
+
+    def write(self, data) -> int:
+        self._buffer += data
+        while len(self._buffer) >= self._current_part_size():
+            part_size = self._current_part_size()
+            self._submit(bytes(self._buffer[:part_size]))
+            del self._buffer[:part_size]
+        return len(data)
+
+    def _submit(self, body: bytes):
+        if self._next_part > S3_MAX_PARTS:
+            raise ValueError(f"S3 upload of {self.key} needs more than {S3_MAX_PARTS} parts.")
+        while len(self._pending) >= self.workers * 2:
+            self._collect(FIRST_COMPLETED)
+        part_number = self._next_part
+        self._next_part += 1
+        self._pending.add(self._pool.submit(self._upload_part, part_number, body))
+
+    def _collect(self, return_when):
+        done, self._pending = wait(self._pending, return_when=return_when)
+        for future in done:
+            future.result()
+
+    def _upload_part(self, part_number: int, body: bytes):
+        response = _retry(lambda: self.client.upload_part(
+            Bucket=self.bucket, Key=self.key, UploadId=self.upload_id, PartNumber=part_number, Body=body),
+            self.retries)
+        self._etags[part_number] = response["ETag"]
+
+    def commit(self):
+        """Uploads the remaining data and completes the multipart upload."""
+        if self._buffer or self._next_part == 1:
+            self._submit(bytes(self._buffer))
+            self._buffer.clear()
+        self._collect(ALL_COMPLETED)
+        self._pool.shutdown()
+        parts = [{"PartNumber": number, "ETag": self._etags[number]} for number in sorted(self._etags)]
+        _retry(lambda: self.client.complete_multipart_upload(
+            Bucket=self.bucket, Key=self.key, UploadId=self.upload_id, MultipartUpload={"Parts": parts}),
+            self.retries)
+
+    def abort(self):
+        """Cancels outstanding parts and aborts the multipart upload."""
+        for future in self._pending:
+            future.cancel()
+        self._pool.shutdown()
+        self.client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+
+
+class VolumeSource:
+    """Reads volumes written by VolumeSink back as one stream."""
+    def __init__(self, path: str):
+        self.volumes = []
+        while os.path.exists(path + VOLUME_SUFFIX.format(len(self.volumes))):
+            self.volumes.append(path + VOLUME_SUFFIX.format(len(self.volumes)))
+        if not self.volumes:
+            raise FileNotFoundError(f"No volumes found for {path}")
+        self._starts = [0]
+        for volume in self.volumes:
+            self._starts.append(self._starts[-1] + os.path.getsize(volume))
+        self.size = self._starts.pop()
+        self._index = 0
+        self._file = open(self.volumes[0], "rb")
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        if whence == os.SEEK_CUR:
+            offset += self.tell()
+        elif whence == os.SEEK_END:
+            offset += self.size
+        index = max(0, bisect.bisect_right(self._starts, offset) - 1)
+        if index != self._index:
+            self._file.close()
+            self._index = index
+            self._file = open(self.volumes[index], "rb")
+        self._file.seek(offset - self._starts[index])
+        return offset
+
+    def tell(self) -> int:
+        return self._starts[self._index] + self._file.tell()
+
+    def read(self, size: int = -1) -> bytes:
+        chunks = []
+        while size != 0:
+            data = self._file.read(size)
+            if data:
+                chunks.append(data)
+                if size > 0:
+                    size -= len(data)
+                continue
+            if self._index + 1 == len(self.volumes):
+                break
+            self._file.close()
+            self._index += 1
+            self._file = open(self.volumes[self._index], "rb")
+        return b"".join(chunks)
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class S3Source:
+    """Reads an object from an S3-compatible store with ranged, retried GETs."""
+    def __init__(self, bucket: str, key: str, part_size: int = S3_PART_SIZE, retries: int = S3_RETRIES,
+                 client=None):
+        self.client = client or _s3_client()
+        self.bucket = bucket
+        self.key = key
+        self.part_size = part_size
+        self.retries = retries
+        self.size = self.client.head_object(Bucket=bucket, Key=key)["ContentLength"]
+        self._position = 0
+        self._buffer = bytearray()
+        self._offset = 0
+
+    @classmethod
+    def from_url(cls, url: str, **kwargs):
+        """Creates a source for an s3://bucket/key URL."""
+        return cls(*_parse_s3_url(url), **kwargs)
+
+    def _fetch(self) -> bytes:
+        end = min(self._position + self.part_size, self.size) - 1
+        response = _retry(lambda: self.client.get_object(
+            Bucket=self.bucket, Key=self.key, Range=f"bytes={self._position}-{end}"), self.retries)
+        data = response["Body"].read()
+        self._position += len(data)
+        return data
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        if whence == os.SEEK_CUR:
+            offset += self.tell()
+        elif whence == os.SEEK_END:
+            offset += self.size
+        self._position = offset
+        self._buffer.clear()
+        self._offset = 0
+        return offset
+
+    def tell(self) -> int:
+        return self._position - len(self._buffer) + self._offset
+
+    def read(self, size: int = -1) -> bytes:
+        if size < 0:
+            size = self.size
+        if len(self._buffer) - self._offset < size and self._position < self.size:
+            # Drop what was read before fetching more, not on every read.
+            del self._buffer[:self._offset]
+            self._offset = 0
+            while len(self._buffer) < size and self._position < self.size:
+                self._buffer += self._fetch()
+        data = bytes(self._buffer[self._offset:self._offset + size])
+        self._offset += len(data)
+        return data
+
+    def close(self):
+        self._buffer.clear()
+        self._offset = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def is_local_path(target: str) -> bool:
+    """Returns True if target names a local file rather than a storage URL or volume set."""
+    if target.startswith("s3://"):
+        return False
+    return os.path.exists(target) or not os.path.exists(target + VOLUME_SUFFIX.format(0))
+
+
+def open_sink(target: str, volume_size: int = None, memory_budget=None, total_size: int = None):
+    """
+    Opens an output sink for encrypted data.
+
+    Args:
+        target (str): A local path or an s3://bucket/key URL.
+        volume_size (int, optional): If set, split local output into volumes
+                                     of this many bytes.
+        memory_budget (MemoryBudget, optional): If given, S3 uploads use fewer
+                                                workers when their buffered parts
+                                                would not fit in half the budget.
+        total_size (int, optional): Expected output size; sizes S3 upload parts.
+
+    Returns:
+        A sink with write(), commit() and abort() that commits on a clean
+        exit from a with block and aborts otherwise.
+    """
+    if target.startswith("s3://"):
+        kwargs = {"total_size": total_size} if total_size else {}
+        if memory_budget is not None:
+            # Each upload worker keeps up to two parts in flight.
+            workers = memory_budget.working_bytes // 2 // (2 * _s3_part_size(total_size))
+            kwargs["workers"] = max(1, min(workers, S3_UPLOAD_WORKERS))
+        return S3Sink.from_url(target, **kwargs)
+    if volume_size:
+        return VolumeSink(target, volume_size)
+    return LocalSink(target)
+
+
+def open_source(target: str):
+    """
+    Opens encrypted input from a local file, a volume set or an s3://bucket/key URL.
+
+    Returns:
+        tuple: (readable file object, total size in bytes).
+    """
+    if target.startswith("s3://"):
+        source = S3Source.from_url(target)
+        return source, source.size
+    if is_local_path(target):
+        return open(target, "rb"), os.path.getsize(target)
+    source = VolumeSource(target)
+    return source, source.size
@@ -0,0 +1,91 @@
+import asyncio
+import os
+
+import pytest
+
+from src.async_api import (
+    ProgressEvents, encrypt_folder, decrypt_archive, encrypt_stream_async, decrypt_stream_async
+)
+
+
+class _Reader:
+    """Async reader over bytes; blocks forever once drained if hang is set."""
+    def __init__(self, data: bytes, hang: bool = False):
+        self.data = data
+        self.hang = hang
+
+    async def read(self, size: int = -1) -> bytes:
+        if not self.data and self.hang:
+            await asyncio.Event().wait()
+        size = len(self.data) if size < 0 else size
+        chunk, self.data = self.data[:size], self.data[size:]
+        return chunk
+
+
+class _Writer:
+    """Async writer that collects what it is given."""
+    def __init__(self):
+        self.data = bytearray()
+
+    async def write(self, data: bytes):
+        await asyncio.sleep(0)
+        self.data += data
+
+
+async def _collect(events: ProgressEvents) -> list:
+    return [event async for event in events]
+
+
+def test_folder_round_trip_with_progress_events(tmp_path):
+    source = tmp_path / "data"
+    (source / "sub").mkdir(parents=True)
+    (source / "a.txt").write_text("alpha " * 1000)
+    (source / "sub" / "b.bin").write_bytes(os.urandom(5000))
+
+    async def main():
+        events = ProgressEvents()
+        collector = asyncio.create_task(_collect(events))
+        output = await encrypt_folder(str(source), str(tmp_path / "data.enc"), "pw", events=events)
+        encrypt_events = await collector
+        events = ProgressEvents()
+        collector = asyncio.create_task(_collect(events))
+        restored = await decrypt_archive(output, str(tmp_path / "out"), "pw", events=events, verify=True)
+        return encrypt_events, await collector, restored
+
+    encrypt_events, decrypt_events, restored = asyncio.run(main())
+    assert encrypt_events[0].stage == "scan" and encrypt_events[-1].stage == "encrypt"
+    assert "archive" in {event.stage for event in encrypt_events}
+    assert {"decrypt", "extract", "verify"} <= {event.stage for event in decrypt_events}
+    assert (tmp_path / "out" / "a.txt").read_text() == "alpha " * 1000
+    assert (tmp_path / "out" / "sub" / "b.bin").read_bytes() == (source / "sub" / "b.bin").read_bytes()
+    assert restored == str(tmp_path / "out") and sorted(os.listdir(restored)) == ["a.txt", "sub"]
+    assert not os.path.exists(str(source) + ".zip")
+
+
+def test_stream_round_trip():
+    data = os.urandom(300_000)
+
+    async def main():
+        encrypted = _Writer()
+        await encrypt_stream_async(_Reader(data), encrypted, "pw", chunk_size=65536)
+        decrypted = _Writer()
+        await decrypt_stream_async(_Reader(bytes(encrypted.data)), decrypted, "pw")
+        return bytes(decrypted.data)
+
+    assert asyncio.run(main()) == data
+
+
+def test_cancelling_the_task_stops_the_stage():
+    async def main():
+        events = ProgressEvents()
+        collector = asyncio.create_task(_collect(events))
+        task = asyncio.create_task(encrypt_stream_async(_Reader(os.urandom(1000), hang=True), _Writer(), "pw",
+                                                        events=events, chunk_size=65536))
+        await asyncio.sleep(0.2)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        # The event stream ends once the cancelled job has unwound.
+        await asyncio.wait_for(collector, 5)
+
+    asyncio.run(main())
@@ -0,0 +1,72 @@
+import hashlib
+import os
+import sqlite3
+
+import pytest
+
+from src import catalog as catalog_module, crypto_worker
+from src.catalog import Catalog, configured_catalog_path, CATALOG_ENV, CATALOG_KEY_ENV
+from src.crypto_worker import CryptoWorker
+from src.file_operations import scan_folder
+
+
+def _digest(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=32).hexdigest()
+
+
+def test_worker_catalogs_nested_digests_with_backslash_arcnames(tmp_path, monkeypatch):
+    source = tmp_path / "src"
+    (source / "sub").mkdir(parents=True)
+    (source / "sub" / "payroll_2024.xlsx").write_bytes(b"pay")
+    catalog_path = str(tmp_path / "catalog.sqlite3")
+    # As on Windows: scan_folder() names use "\\", zip stores "/".
+    monkeypatch.setattr(os, "sep", "\\")
+    monkeypatch.setattr(crypto_worker, "scan_folder", lambda path: [
+        (full_path, arcname.replace("/", "\\"), size) for full_path, arcname, size in scan_folder(path)])
+    worker = CryptoWorker("encrypt", str(source), "pw", output_path=str(tmp_path / "src.enc"),
+                          catalog=catalog_path)
+    worker.execute()
+    assert "catalog_error" not in worker.report.extra
+    with Catalog(catalog_path) as catalog:
+        matches = catalog.find_digest(_digest(b"pay"))
+        assert [(match["archive"], match["path"]) for match in matches] == \
+            [(str(tmp_path / "src.enc"), "sub/payroll_2024.xlsx")]
+
+
+def test_protected_catalog_derives_its_key_once(tmp_path, monkeypatch):
+    calls = []
+    derive_key = catalog_module.derive_key
+    monkeypatch.setattr(catalog_module, "derive_key", lambda *args: calls.append(args) or derive_key(*args))
+    catalog_module._catalog_keys.cache_clear()
+    path = str(tmp_path / "catalog.sqlite3")
+    for _ in range(3):
+        with Catalog(path, secret="catalog secret") as catalog:
+            catalog.add_archive("a.enc", [("a.txt", 1, None)])
+    assert len(calls) == 1
+
+
+def test_tampered_catalog_row_is_rejected(tmp_path):
+    path = str(tmp_path / "catalog.sqlite3")
+    with Catalog(path, secret="catalog secret") as catalog:
+        catalog.add_archive("a.enc", [("dir/a.txt", 1, None), ("dir/b.txt", 2, None)], source="/data")
+    db = sqlite3.connect(path)
+    with db:
+        sealed = db.execute("SELECT path FROM entries WHERE size = 1").fetchone()[0]
+        db.execute("UPDATE entries SET path = ? WHERE size = 1", (sealed[:-1] + bytes([sealed[-1] ^ 1]),))
+        # A valid value moved to another row must not pass either.
+        db.execute("UPDATE archives SET source = (SELECT path FROM entries WHERE size = 2)")
+    db.close()
+    with Catalog(path, secret="catalog secret") as catalog:
+        with pytest.raises(ValueError):
+            catalog.find("a.txt")
+        with pytest.raises(ValueError):
+            catalog.archives()
+        assert catalog.find("b.txt")[0]["path"] == "dir/b.txt"
+
+
+def test_catalog_is_opt_in(monkeypatch, tmp_path):
+    monkeypatch.delenv(CATALOG_ENV, raising=False)
+    monkeypatch.delenv(CATALOG_KEY_ENV, raising=False)
+    assert configured_catalog_path() is None
+    monkeypatch.setenv(CATALOG_ENV, str(tmp_path / "catalog.sqlite3"))
+    assert configured_catalog_path() == str(tmp_path / "catalog.sqlite3")
@@ -0,0 +1,116 @@
+import io
+import os
+import types
+
+import pytest
+
+from src import cli
+from src.core_crypto import (
+    encrypt_file_aes, append_encrypted_part, decrypt_stream, decrypt_file_parts, new_envelope, encrypt_part,
+    write_indexed_archive
+)
+from src.crypto_worker import CryptoWorker
+from src.file_operations import extract_archive
+
+
+@pytest.fixture(autouse=True)
+def password(monkeypatch):
+    monkeypatch.setenv(cli.PASSWORD_ENV, "pw")
+
+
+def _write(path, data: bytes) -> str:
+    with open(path, "wb") as f:
+        f.write(data)
+    return str(path)
+
+
+def test_cli_round_trip(tmp_path):
+    data = os.urandom(300_000)
+    plain = _write(tmp_path / "plain", data)
+    assert cli.main(["encrypt", "-i", plain, "-o", str(tmp_path / "a.enc")]) == 0
+    assert cli.main(["decrypt", "-i", str(tmp_path / "a.enc"), "-o", str(tmp_path / "out")]) == 0
+    assert (tmp_path / "out").read_bytes() == data
+
+
+def test_cli_encrypts_stdin_and_decrypts_to_stdout(monkeypatch):
+    data = os.urandom(300_000)
+    encrypted = io.BytesIO()
+    monkeypatch.setattr(cli.sys, "stdin", types.SimpleNamespace(buffer=io.BytesIO(data)))
+    monkeypatch.setattr(cli.sys, "stdout", types.SimpleNamespace(buffer=encrypted))
+    assert cli.main(["encrypt"]) == 0
+    decrypted = io.BytesIO()
+    monkeypatch.setattr(cli.sys, "stdin", types.SimpleNamespace(buffer=io.BytesIO(encrypted.getvalue())))
+    monkeypatch.setattr(cli.sys, "stdout", types.SimpleNamespace(buffer=decrypted))
+    assert cli.main(["decrypt"]) == 0
+    assert decrypted.getvalue() == data
+
+
+def test_cli_encrypts_to_a_recipient(tmp_path, monkeypatch):
+    monkeypatch.delenv(cli.PASSWORD_ENV)
+    key = str(tmp_path / "backup.key")
+    assert cli.main(["keygen", "-o", key]) == 0
+    plain = _write(tmp_path / "plain", b"backup")
+    assert cli.main(["encrypt", "--recipient", key + ".pub", "-i", plain, "-o", str(tmp_path / "a.enc")]) == 0
+    assert cli.main(["decrypt", "--identity", key, "-i", str(tmp_path / "a.enc"), "-o", str(tmp_path / "out")]) == 0
+    assert (tmp_path / "out").read_bytes() == b"backup"
+
+
+def test_cli_decrypts_every_part_of_an_appended_archive(tmp_path):
+    encrypt_file_aes(_write(tmp_path / "first", b"first part"), str(tmp_path / "a.enc"), "pw")
+    append_encrypted_part(str(tmp_path / "a.enc"), _write(tmp_path / "second", b"second part"), "pw")
+    assert cli.main(["decrypt", "-i", str(tmp_path / "a.enc"), "-o", str(tmp_path / "out")]) == 0
+    assert (tmp_path / "out").read_bytes() == b"first part"
+    assert (tmp_path / "out.1").read_bytes() == b"second part"
+
+
+def test_decrypt_stream_reads_a_single_indexed_part(tmp_path):
+    # A one-shard distributed archive: one part followed by its index.
+    header, data_key = new_envelope("pw")
+    ciphertext = io.BytesIO()
+    encrypt_part(io.BytesIO(b"only part"), ciphertext, header, data_key, header.nonce_prefix)
+    archive = io.BytesIO()
+    write_indexed_archive(archive, header, data_key,
+                          [(io.BytesIO(ciphertext.getvalue()), len(ciphertext.getvalue()), header.nonce_prefix, None)])
+    archive.seek(0)
+    out = io.BytesIO()
+    decrypt_stream(archive, out, "pw")
+    assert out.getvalue() == b"only part"
+
+
+def test_cli_refuses_to_stream_several_parts(tmp_path, capsys):
+    encrypt_file_aes(_write(tmp_path / "first", b"first part"), str(tmp_path / "a.enc"), "pw")
+    append_encrypted_part(str(tmp_path / "a.enc"), _write(tmp_path / "second", b"second part"), "pw")
+    assert cli.main(["decrypt", "-i", str(tmp_path / "a.enc")]) == 1
+    assert "2 parts" in capsys.readouterr().err
+
+
+def test_cli_removes_parts_of_a_corrupted_archive(tmp_path):
+    encrypt_file_aes(_write(tmp_path / "first", b"first part" * 1000), str(tmp_path / "a.enc"), "pw")
+    append_encrypted_part(str(tmp_path / "a.enc"), _write(tmp_path / "second", b"second part"), "pw")
+    data = bytearray((tmp_path / "a.enc").read_bytes())
+    data[200] ^= 0xFF
+    (tmp_path / "a.enc").write_bytes(bytes(data))
+    assert cli.main(["decrypt", "-i", str(tmp_path / "a.enc"), "-o", str(tmp_path / "out")]) == 1
+    assert not (tmp_path / "out").exists()
+    assert not (tmp_path / "out.1").exists()
+
+
+def test_cli_appends_and_compacts_a_folder_archive(tmp_path, capsys):
+    first, update = tmp_path / "first", tmp_path / "update"
+    first.mkdir()
+    update.mkdir()
+    (first / "a.txt").write_text("old")
+    (first / "b.txt").write_text("kept")
+    (update / "a.txt").write_text("new")
+    archive = str(tmp_path / "a.enc")
+    CryptoWorker("encrypt", str(first), "pw", output_path=archive).execute()
+    assert cli.main(["append", "-i", str(update), "-o", archive, "--progress"]) == 0
+    assert "Appended 1 files." in capsys.readouterr().err
+    assert cli.main(["compact", "-i", archive]) == 0
+    parts = decrypt_file_parts(archive, str(tmp_path / "part"), "pw")
+    assert len(parts) == 1
+    extract_archive(parts[0], str(tmp_path / "out"))
+    assert (tmp_path / "out" / "a.txt").read_text() == "new"
+    assert (tmp_path / "out" / "b.txt").read_text() == "kept"
+    assert cli.main(["compact", "-i", archive]) == 0
+    assert "nothing to compact" in capsys.readouterr().err
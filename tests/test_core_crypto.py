@@ -0,0 +1,260 @@
+import io
+import os
+
+import pytest
+
+from src import core_crypto
+from src.core_crypto import (
+    encrypt_file_aes, decrypt_file_parts, append_encrypted_part, rekey_file, decrypt_file_aes, encrypt_stream,
+    decrypt_stream, PasswordKey, KeyfileKey, IdentityKey, generate_keypair
+)
+from src.job_report import JobReport
+
+
+@pytest.fixture
+def kdf_calls(monkeypatch):
+    calls = []
+    derive_key = core_crypto.derive_key
+
+    def counting_derive_key(*args, **kwargs):
+        calls.append(args[1])
+        return derive_key(*args, **kwargs)
+    monkeypatch.setattr(core_crypto, "derive_key", counting_derive_key)
+    return calls
+
+
+class _Pipe:
+    """An unseekable stream that hands out at most a few bytes per read, like a pipe."""
+    def __init__(self, data: bytes):
+        self._data = io.BytesIO(data)
+
+    def read(self, size: int = -1) -> bytes:
+        return self._data.read(min(size, 1000) if size >= 0 else 1000)
+
+
+def _write(path, data: bytes) -> str:
+    with open(path, "wb") as f:
+        f.write(data)
+    return str(path)
+
+
+def test_decrypt_runs_the_kdf_once(tmp_path, kdf_calls):
+    plain = _write(tmp_path / "plain", os.urandom(200_000))
+    encrypt_file_aes(plain, str(tmp_path / "a.enc"), "pw")
+    assert len(kdf_calls) == 1
+    report = JobReport("decrypt", str(tmp_path / "a.enc"))
+    parts = decrypt_file_parts(str(tmp_path / "a.enc"), str(tmp_path / "out"), "pw", report=report)
+    assert len(kdf_calls) == 2
+    assert [stage["name"] for stage in report.stages] == ["kdf", "decrypt"]
+    with open(parts[0], "rb") as f, open(plain, "rb") as g:
+        assert f.read() == g.read()
+
+
+def test_decrypt_appended_archive_returns_every_part(tmp_path, kdf_calls):
+    first = _write(tmp_path / "first", b"first part")
+    second = _write(tmp_path / "second", b"second part")
+    encrypt_file_aes(first, str(tmp_path / "a.enc"), "pw")
+    append_encrypted_part(str(tmp_path / "a.enc"), second, "pw", entries=["b"])
+    kdf_calls.clear()
+    parts = decrypt_file_parts(str(tmp_path / "a.enc"), str(tmp_path / "out"), "pw")
+    assert len(kdf_calls) == 1
+    assert [open(part, "rb").read() for part in parts] == [b"first part", b"second part"]
+
+
+def test_rekey_updates_the_exported_salt(tmp_path):
+    plain = _write(tmp_path / "plain", b"payload")
+    archive = str(tmp_path / "a.enc")
+    encrypt_file_aes(plain, archive, "old", export_hashes=True)
+    rekey_file(archive, "old", "new")
+    decrypt_file_aes(archive, str(tmp_path / "out"), "new", import_hashes=True)
+    assert (tmp_path / "out").read_bytes() == b"payload"
+    with pytest.raises(ValueError):
+        decrypt_file_aes(archive, str(tmp_path / "out"), "old", import_hashes=True)
+
+
+def _interrupt_rekey(monkeypatch, archive: str, torn_slot: bool):
+    """Runs rekey_file() until the in-place slot write, which is torn or never happens."""
+    def crash(path, offset, old_slot, new_slot):
+        if torn_slot:
+            with open(path, "r+b") as f:
+                f.seek(offset + len(new_slot) // 2)
+                f.write(os.urandom(len(new_slot) // 2))
+        raise OSError("power lost")
+    monkeypatch.setattr(core_crypto, "_apply_rekey_journal", crash)
+    with pytest.raises(OSError):
+        rekey_file(archive, "old", "new")
+    monkeypatch.undo()
+
+
+@pytest.mark.parametrize("torn_slot", [False, True])
+def test_interrupted_rekey_is_completed_on_next_open(tmp_path, monkeypatch, torn_slot):
+    plain = _write(tmp_path / "plain", b"payload")
+    archive = str(tmp_path / "a.enc")
+    encrypt_file_aes(plain, archive, "old", export_hashes=True)
+    _interrupt_rekey(monkeypatch, archive, torn_slot)
+    assert os.path.exists(archive + core_crypto.REKEY_JOURNAL_SUFFIX)
+    decrypt_file_aes(archive, str(tmp_path / "out"), "new", import_hashes=True)
+    assert (tmp_path / "out").read_bytes() == b"payload"
+    assert not os.path.exists(archive + core_crypto.REKEY_JOURNAL_SUFFIX)
+
+
+def test_incomplete_rekey_journal_is_discarded(tmp_path):
+    plain = _write(tmp_path / "plain", b"payload")
+    archive = str(tmp_path / "a.enc")
+    encrypt_file_aes(plain, archive, "old")
+    with open(archive + core_crypto.REKEY_JOURNAL_SUFFIX, "wb") as f:
+        f.write(core_crypto.REKEY_MAGIC + b"\0" * 5)
+    decrypt_file_parts(archive, str(tmp_path / "out"), "old")
+    assert (tmp_path / "out").read_bytes() == b"payload"
+    assert not os.path.exists(archive + core_crypto.REKEY_JOURNAL_SUFFIX)
+
+
+def _appended_archive(tmp_path) -> str:
+    encrypt_file_aes(_write(tmp_path / "first", b"first part"), str(tmp_path / "a.enc"), "pw")
+    append_encrypted_part(str(tmp_path / "a.enc"), _write(tmp_path / "second", b"second part"), "pw")
+    return str(tmp_path / "a.enc")
+
+
+@pytest.mark.parametrize("damage", ["truncate_footer", "truncate_index", "flip_index"])
+def test_damaged_part_index_is_rejected(tmp_path, damage):
+    archive = _appended_archive(tmp_path)
+    with open(archive, "rb") as f:
+        data = bytearray(f.read())
+    footer = core_crypto.INDEX_FOOTER.size
+    if damage == "truncate_footer":
+        data = data[:-3]
+    elif damage == "truncate_index":
+        # Drop index bytes but keep a valid-looking footer.
+        data = data[:-footer - 8] + data[-footer:]
+    else:
+        data[-footer - 5] ^= 0x01
+    with open(archive, "wb") as f:
+        f.write(data)
+    with pytest.raises(ValueError):
+        decrypt_file_parts(archive, str(tmp_path / "out"), "pw")
+    assert not os.path.exists(tmp_path / "out")
+    assert not os.path.exists(tmp_path / "out.1")
+
+
+def test_verify_single_part_indexed_archive(tmp_path):
+    # A one-shard distributed archive: one part, under its own nonce prefix, followed by its index.
+    header, data_key = core_crypto.new_envelope("pw")
+    prefix = os.urandom(core_crypto.NONCE_PREFIX_SIZE)
+    ciphertext = io.BytesIO()
+    core_crypto.encrypt_part(io.BytesIO(os.urandom(300_000)), ciphertext, header, data_key, prefix)
+    archive = str(tmp_path / "a.enc")
+    with open(archive, "wb") as f:
+        core_crypto.write_indexed_archive(f, header, data_key,
+                                          [(io.BytesIO(ciphertext.getvalue()), len(ciphertext.getvalue()), prefix, None)])
+    hasher = core_crypto._ciphertext_hasher()
+    hasher.update((tmp_path / "a.enc").read_bytes())
+    core_crypto.verify_encrypted_file(archive, "pw", hasher.hexdigest())
+    with pytest.raises(ValueError):
+        core_crypto.verify_encrypted_file(archive, "pw", "0" * 64)
+
+
+@pytest.mark.parametrize("size", [0, 1, 65536, 200_001])
+def test_stream_round_trip_through_pipes(size):
+    data = os.urandom(size)
+    encrypted = io.BytesIO()
+    progress = []
+    encrypt_stream(_Pipe(data), encrypted, "pw", progress_callback=lambda done, total: progress.append((done, total)))
+    assert progress[-1] == (size, None)
+    decrypted = io.BytesIO()
+    decrypt_stream(_Pipe(encrypted.getvalue()), decrypted, "pw")
+    assert decrypted.getvalue() == data
+
+
+def test_truncated_stream_is_rejected():
+    encrypted = io.BytesIO()
+    encrypt_stream(io.BytesIO(os.urandom(200_000)), encrypted, "pw")
+    with pytest.raises(ValueError):
+        decrypt_stream(_Pipe(encrypted.getvalue()[:-65536]), io.BytesIO(), "pw")
+
+
+def test_batch_shares_one_kdf_per_password(tmp_path, kdf_calls):
+    key = PasswordKey("pw")
+    for name in "abc":
+        encrypt_file_aes(_write(tmp_path / name, name.encode()), str(tmp_path / f"{name}.enc"), key)
+    assert len(kdf_calls) == 1
+    opener = PasswordKey("pw")
+    for name in "abc":
+        decrypt_file_aes(str(tmp_path / f"{name}.enc"), str(tmp_path / f"{name}.out"), opener)
+        assert (tmp_path / f"{name}.out").read_bytes() == name.encode()
+    assert len(kdf_calls) == 2
+    with pytest.raises(ValueError):
+        decrypt_file_aes(str(tmp_path / "a.enc"), str(tmp_path / "wrong.out"), "wrong")
+
+
+def test_keyfile_key_needs_no_password_kdf(tmp_path, kdf_calls):
+    keyfile = _write(tmp_path / "keyfile", os.urandom(32))
+    encrypt_file_aes(_write(tmp_path / "plain", b"secret"), str(tmp_path / "a.enc"), KeyfileKey(keyfile))
+    decrypt_file_aes(str(tmp_path / "a.enc"), str(tmp_path / "out"), KeyfileKey(keyfile))
+    assert (tmp_path / "out").read_bytes() == b"secret"
+    assert not kdf_calls
+    other = KeyfileKey(_write(tmp_path / "other", os.urandom(32)))
+    with pytest.raises(ValueError):
+        decrypt_file_aes(str(tmp_path / "a.enc"), str(tmp_path / "wrong"), other)
+
+
+def test_recipients_open_archives_without_a_password(tmp_path, kdf_calls):
+    for name in ("alice", "bob", "eve"):
+        generate_keypair(str(tmp_path / name), str(tmp_path / f"{name}.pub"))
+    if os.name == "posix":
+        assert os.stat(tmp_path / "alice").st_mode & 0o777 == 0o600
+    plain = _write(tmp_path / "plain", os.urandom(100_000))
+    encrypt_file_aes(plain, str(tmp_path / "a.enc"), None,
+                     recipients=[str(tmp_path / "alice.pub"), str(tmp_path / "bob.pub")])
+    assert not kdf_calls
+    for name in ("alice", "bob"):
+        decrypt_file_aes(str(tmp_path / "a.enc"), str(tmp_path / f"{name}.out"), IdentityKey.load(str(tmp_path / name)))
+        assert (tmp_path / f"{name}.out").read_bytes() == (tmp_path / "plain").read_bytes()
+    with pytest.raises(ValueError):
+        decrypt_file_aes(str(tmp_path / "a.enc"), str(tmp_path / "eve.out"), IdentityKey.load(str(tmp_path / "eve")))
+    with pytest.raises(ValueError):
+        decrypt_file_aes(str(tmp_path / "a.enc"), str(tmp_path / "pw.out"), "pw")
+
+
+def test_password_and_recipient_slots_both_open(tmp_path):
+    generate_keypair(str(tmp_path / "id"), str(tmp_path / "id.pub"))
+    encrypt_file_aes(_write(tmp_path / "plain", b"data"), str(tmp_path / "a.enc"), "pw",
+                     recipients=[str(tmp_path / "id.pub")])
+    decrypt_file_aes(str(tmp_path / "a.enc"), str(tmp_path / "pw.out"), "pw")
+    decrypt_file_aes(str(tmp_path / "a.enc"), str(tmp_path / "id.out"), IdentityKey.load(str(tmp_path / "id")))
+    assert (tmp_path / "pw.out").read_bytes() == (tmp_path / "id.out").read_bytes() == b"data"
+
+
+def _header_cipher(path) -> int:
+    with open(path, "rb") as f:
+        return core_crypto.ArchiveHeader.read(f, f.read(len(core_crypto.MAGIC))).cipher
+
+
+@pytest.mark.parametrize("cipher", ["aes-gcm", "chacha20-poly1305"])
+def test_cipher_is_recorded_and_dispatched_on(tmp_path, cipher):
+    plain = _write(tmp_path / "plain", os.urandom(100_000))
+    encrypt_file_aes(plain, str(tmp_path / "a.enc"), "pw", cipher=cipher)
+    assert _header_cipher(tmp_path / "a.enc") == core_crypto.CIPHERS[cipher]
+    decrypt_file_aes(str(tmp_path / "a.enc"), str(tmp_path / "out"), "pw")
+    assert (tmp_path / "out").read_bytes() == (tmp_path / "plain").read_bytes()
+
+
+@pytest.mark.parametrize("has_aes, aes_seconds, expected", [
+    (True, None, core_crypto.CIPHER_AES_GCM),
+    (False, None, core_crypto.CIPHER_CHACHA20_POLY1305),
+    (None, 2.0, core_crypto.CIPHER_CHACHA20_POLY1305),
+    (None, 0.5, core_crypto.CIPHER_AES_GCM),
+])
+def test_preferred_cipher_follows_the_cpu(monkeypatch, has_aes, aes_seconds, expected):
+    monkeypatch.delenv(core_crypto.CIPHER_ENV, raising=False)
+    monkeypatch.setattr(core_crypto, "_preferred_cipher", None)
+    monkeypatch.setattr(core_crypto, "_cpu_has_aes", lambda: has_aes)
+    monkeypatch.setattr(core_crypto, "_benchmark_cipher",
+                        lambda cipher: aes_seconds if cipher == core_crypto.CIPHER_AES_GCM else 1.0)
+    assert core_crypto.preferred_cipher() == expected
+    monkeypatch.setenv(core_crypto.CIPHER_ENV, "chacha20-poly1305")
+    assert core_crypto.preferred_cipher() == core_crypto.CIPHER_CHACHA20_POLY1305
+
+
+def test_unknown_cipher_is_rejected():
+    with pytest.raises(ValueError):
+        core_crypto.cipher_id("des")
@@ -0,0 +1,103 @@
+import json
+import os
+
+import pytest
+
+from src import core_crypto
+from src.archive_append import append_folder
+from src.core_crypto import PasswordKey
+from src.crypto_worker import CryptoWorker, BatchDecryptWorker
+from src.profiling import enable_profiling, disable_profiling
+
+
+def _encrypt(tmp_path):
+    source = tmp_path / "data"
+    source.mkdir()
+    (source / "a.txt").write_text("old")
+    (source / "b.txt").write_text("kept")
+    CryptoWorker("encrypt", str(source), "pw", output_path=str(tmp_path / "data.enc")).execute()
+    return source
+
+
+def _stages(worker):
+    return [stage["name"] for stage in worker.report.stages]
+
+
+def test_job_report_is_emitted_and_written(tmp_path):
+    source = tmp_path / "data"
+    source.mkdir()
+    (source / "a.txt").write_text("a" * 1000)
+    worker = CryptoWorker("encrypt", str(source), "pw", output_path=str(tmp_path / "data.enc"), write_report=True)
+    emitted = []
+    worker.report_ready.connect(emitted.append)
+    worker.execute()
+    with open(tmp_path / "data.enc.report.json") as report_file:
+        written = json.load(report_file)
+    assert [report["status"] for report in (emitted[0], written)] == ["ok", "ok"]
+    assert [stage["name"] for stage in written["stages"]] == ["scan", "compress", "kdf", "encrypt", "fsync", "cleanup"]
+    assert written["stages"][0]["files"] == 1 and written["stages"][1]["bytes"] == 1000
+
+
+def test_failed_job_still_reports(tmp_path):
+    worker = CryptoWorker("decrypt", str(tmp_path / "missing.enc"), "pw")
+    emitted = []
+    worker.report_ready.connect(emitted.append)
+    with pytest.raises(Exception):
+        worker.execute()
+    assert emitted[0]["status"] == "failed" and emitted[0]["error"]
+
+
+def test_restore_is_not_verified_by_default(tmp_path):
+    _encrypt(tmp_path)
+    worker = CryptoWorker("decrypt", str(tmp_path / "data.enc"), "pw")
+    worker.execute()
+    assert "verify_restore" not in _stages(worker)
+
+
+def test_verified_restore_of_an_appended_archive(tmp_path):
+    source = _encrypt(tmp_path)
+    update = tmp_path / "update"
+    update.mkdir()
+    (update / "a.txt").write_text("new")
+    append_folder(str(tmp_path / "data.enc"), str(update), "pw")
+    worker = CryptoWorker("decrypt", str(tmp_path / "data.enc"), "pw", verify_restore=True)
+    worker.execute()
+    assert _stages(worker)[-2:] == ["verify_restore", "cleanup"]
+    assert (source / "a.txt").read_text() == "new"
+    assert (source / "b.txt").read_text() == "kept"
+
+
+@pytest.mark.parametrize("in_subprocess", [False, True])
+def test_jobs_are_profiled_where_they_run(tmp_path, in_subprocess):
+    source = tmp_path / "data"
+    source.mkdir()
+    (source / "a.txt").write_text("a")
+    enable_profiling(str(tmp_path / "profiles"))
+    try:
+        worker = CryptoWorker("encrypt", str(source), "pw", output_path=str(tmp_path / "data.enc"),
+                              in_subprocess=in_subprocess)
+        worker.execute()
+    finally:
+        disable_profiling()
+    assert os.path.exists(worker.profile_files["profile"])
+    with open(worker.profile_files["summary"]) as summary:
+        assert "encrypt_file_aes" in summary.read()
+
+
+def test_batch_decrypt_derives_each_salt_once(tmp_path, monkeypatch):
+    shared = PasswordKey("pw")
+    paths = []
+    for name, password in (("a", shared), ("b", shared), ("c", "pw")):
+        source = tmp_path / name
+        source.mkdir()
+        (source / "file.txt").write_text(name)
+        paths.append(str(tmp_path / f"{name}.enc"))
+        CryptoWorker("encrypt", str(source), password, output_path=paths[-1]).execute()
+    derived = []
+    derive_key = core_crypto.derive_key
+    monkeypatch.setattr(core_crypto, "derive_key",
+                        lambda password, salt, iterations: derived.append(salt) or derive_key(password, salt, iterations))
+    BatchDecryptWorker(paths, "pw", workers=3).run()
+    assert len(derived) == 2 and shared.salt in derived
+    for name in "abc":
+        assert (tmp_path / name / "file.txt").read_text() == name
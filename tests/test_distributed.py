@@ -0,0 +1,114 @@
+import datetime
+import ipaddress
+import os
+import ssl
+import threading
+import zipfile
+
+import pytest
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+
+from src import distributed
+from src.core_crypto import decrypt_file_parts
+from src.distributed import ShardWorkerServer, encrypt_distributed
+
+SECRET = "k7V1pQ9Xz0bWc3Rr8YtLmN2sHdE5aJfU"
+
+
+@pytest.fixture
+def worker():
+    server = ShardWorkerServer(("127.0.0.1", 0), secret=SECRET)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield "127.0.0.1:%d" % server.server_address[1]
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def folder(tmp_path):
+    source = tmp_path / "src"
+    (source / "sub").mkdir(parents=True)
+    for i in range(6):
+        (source / "sub" / f"file{i}.txt").write_bytes(os.urandom(1000))
+    return source
+
+
+def _assert_restores(tmp_path, archive, folder, parts):
+    outputs = decrypt_file_parts(archive, str(tmp_path / "out"), "pw")
+    assert len(outputs) == parts
+    restored = {}
+    for output in outputs:
+        with zipfile.ZipFile(output) as zf:
+            restored.update((name, zf.read(name)) for name in zf.namelist() if name.startswith("sub/"))
+    assert restored == {f"sub/{path.name}": path.read_bytes() for path in (folder / "sub").iterdir()}
+
+
+def test_distributed_round_trip(tmp_path, worker, folder):
+    archive = str(tmp_path / "a.enc")
+    parts = encrypt_distributed(str(folder), archive, "pw", [worker], secret=SECRET, shards=3)
+    assert parts == 3
+    _assert_restores(tmp_path, archive, folder, parts)
+
+
+def test_distributed_retries_use_fresh_nonce_prefixes(tmp_path, worker, folder, monkeypatch):
+    run_shard = distributed._run_shard
+    prefixes = []
+
+    def flaky_run_shard(address, secret, job, segment, ssl_context=None):
+        prefixes.append(job["nonce_prefix"])
+        length = run_shard(address, secret, job, segment, ssl_context)
+        if len(prefixes) == 1:
+            raise ValueError("lost the reply")
+        return length
+
+    monkeypatch.setattr(distributed, "_run_shard", flaky_run_shard)
+    archive = str(tmp_path / "a.enc")
+    encrypt_distributed(str(folder), archive, "pw", [worker], secret=SECRET, shards=2)
+    assert len(prefixes) == 3
+    assert len(set(prefixes)) == 3
+    _assert_restores(tmp_path, archive, folder, 2)
+
+
+def _self_signed_certificate(tmp_path):
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "shard worker")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    certificate = (x509.CertificateBuilder().subject_name(name).issuer_name(name).public_key(key.public_key())
+                   .serial_number(x509.random_serial_number())
+                   .not_valid_before(now - datetime.timedelta(minutes=1))
+                   .not_valid_after(now + datetime.timedelta(days=1))
+                   .add_extension(x509.SubjectAlternativeName([x509.IPAddress(ipaddress.ip_address("127.0.0.1"))]),
+                                  critical=False)
+                   .add_extension(x509.BasicConstraints(ca=True, path_length=None), critical=True)
+                   .sign(key, hashes.SHA256()))
+    cert_path, key_path = tmp_path / "worker.pem", tmp_path / "worker.key"
+    cert_path.write_bytes(certificate.public_bytes(serialization.Encoding.PEM))
+    key_path.write_bytes(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                           serialization.NoEncryption()))
+    return str(cert_path), str(key_path)
+
+
+def test_distributed_over_tls(tmp_path, folder):
+    cert_path, key_path = _self_signed_certificate(tmp_path)
+    server_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    server_context.load_cert_chain(cert_path, key_path)
+    server = ShardWorkerServer(("127.0.0.1", 0), secret=SECRET, ssl_context=server_context)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        archive = str(tmp_path / "a.enc")
+        encrypt_distributed(str(folder), archive, "pw", ["127.0.0.1:%d" % server.server_address[1]],
+                            secret=SECRET, shards=2, ssl_context=ssl.create_default_context(cafile=cert_path))
+    finally:
+        server.shutdown()
+        server.server_close()
+    _assert_restores(tmp_path, archive, folder, 2)
+
+
+def test_distributed_rejects_wrong_cluster_secret(tmp_path, worker, folder):
+    with pytest.raises(RuntimeError, match="cluster secret"):
+        encrypt_distributed(str(folder), str(tmp_path / "a.enc"), "pw", [worker], secret="wrong", shards=2)
+    assert not (tmp_path / "a.enc").exists()
@@ -0,0 +1,224 @@
+import os
+
+import pytest
+
+from src import file_operations
+from src.file_operations import scan_folder, zip_folder, check_source_unchanged
+
+
+def _make_tree(root):
+    os.makedirs(os.path.join(root, "sub", "deep"))
+    with open(os.path.join(root, "top.txt"), "w") as f:
+        f.write("top")
+    with open(os.path.join(root, "sub", "deep", "nested.txt"), "w") as f:
+        f.write("nested")
+
+
+def test_check_source_unchanged_accepts_backslash_arcnames(tmp_path, monkeypatch):
+    source = str(tmp_path / "src")
+    _make_tree(source)
+    inventory = scan_folder(source)
+    manifest = zip_folder(source, str(tmp_path / "a.zip"), inventory=inventory)
+    # As on Windows: scan_folder() names use "\\", manifest names use "/".
+    monkeypatch.setattr(os, "sep", "\\")
+    windows_inventory = [(path, arcname.replace("/", "\\"), size) for path, arcname, size in inventory]
+    check_source_unchanged(source, windows_inventory, manifest)
+
+
+def test_check_source_unchanged_detects_changes(tmp_path):
+    source = str(tmp_path / "src")
+    _make_tree(source)
+    inventory = scan_folder(source)
+    manifest = zip_folder(source, str(tmp_path / "a.zip"), inventory=inventory)
+    with open(os.path.join(source, "sub", "added.txt"), "w") as f:
+        f.write("late")
+    with pytest.raises(ValueError, match="sub/added.txt"):
+        check_source_unchanged(source, inventory, manifest)
+
+
+def test_check_source_unchanged_detects_resized_file(tmp_path):
+    source = str(tmp_path / "src")
+    _make_tree(source)
+    inventory = scan_folder(source)
+    with open(os.path.join(source, "top.txt"), "a") as f:
+        f.write(" grown")
+    with pytest.raises(ValueError, match="Source changed"):
+        check_source_unchanged(source, inventory)
+
+
+def test_archive_name_uses_forward_slashes(monkeypatch):
+    monkeypatch.setattr(os, "sep", "\\")
+    assert file_operations.archive_name("a\\b\\c.txt") == "a/b/c.txt"
+
+
+def test_delete_path_does_not_descend_into_junctions(tmp_path, monkeypatch):
+    tree = tmp_path / "tree"
+    (tree / "sub").mkdir(parents=True)
+    (tree / "sub" / "file.txt").write_text("x")
+    junction = tree / "sub" / "junction"
+    junction.mkdir()
+    (junction / "keep.txt").write_text("outside data")
+    removed = []
+    # Junctions only exist on Windows; flag a directory as one and record
+    # its removal instead of rmdir'ing the link.
+    monkeypatch.setattr(file_operations, "_is_junction",
+                        lambda entry: (entry if isinstance(entry, str) else entry.path) == str(junction))
+
+    def remove_junction(path):
+        removed.append(path)
+        os.replace(path, tmp_path / "unlinked")
+    monkeypatch.setattr(file_operations, "_remove_junction", remove_junction)
+
+    file_operations.delete_path(str(tree))
+    assert removed == [str(junction)]
+    assert not tree.exists()
+    assert (tmp_path / "unlinked" / "keep.txt").read_text() == "outside data"
+
+
+def _make_solid_archive(tmp_path, monkeypatch):
+    source = tmp_path / "src"
+    source.mkdir()
+    for i in range(50):
+        (source / f"file{i}.bin").write_bytes(os.urandom(700) * 3)
+    # Small blocks so members span several of them.
+    monkeypatch.setattr(file_operations, "SOLID_BLOCK_SIZE", 4096)
+    archive = tmp_path / "a.tar"
+    file_operations.tar_folder(str(source), str(archive))
+    return source, archive
+
+
+def test_solid_archive_round_trip(tmp_path, monkeypatch):
+    source, archive = _make_solid_archive(tmp_path, monkeypatch)
+    out = tmp_path / "out"
+    file_operations.extract_archive(str(archive), str(out), verify=True)
+    for path in source.iterdir():
+        assert (out / path.name).read_bytes() == path.read_bytes()
+
+
+def test_solid_archive_rejects_corrupted_block(tmp_path, monkeypatch):
+    _, archive = _make_solid_archive(tmp_path, monkeypatch)
+    data = bytearray(archive.read_bytes())
+    data[len(file_operations.SOLID_MAGIC) + file_operations.SOLID_BLOCK_HEADER.size + 10] ^= 0xFF
+    archive.write_bytes(bytes(data))
+    with pytest.raises(ValueError):
+        file_operations.extract_archive(str(archive), str(tmp_path / "out"))
+
+
+def test_solid_archive_rejects_truncation(tmp_path, monkeypatch):
+    _, archive = _make_solid_archive(tmp_path, monkeypatch)
+    data = archive.read_bytes()
+    archive.write_bytes(data[:len(data) // 2])
+    with pytest.raises(ValueError):
+        file_operations.extract_archive(str(archive), str(tmp_path / "out"))
+
+
+def test_compression_tuner_recovers_from_storing():
+    tuner = file_operations.CompressionTuner(level=0)
+    batch = file_operations.ADAPTIVE_BATCH_BYTES
+    # Stored batches have a ratio of 1.0; a slow disk must still raise the level.
+    tuner.record(batch, batch, compress_seconds=0.01, write_seconds=1.0)
+    assert tuner.level == 1
+    tuner.record(batch, batch // 3, compress_seconds=0.1, write_seconds=1.0)
+    assert tuner.level == 3
+
+
+def test_compression_tuner_stores_incompressible_data():
+    tuner = file_operations.CompressionTuner(level=1)
+    batch = file_operations.ADAPTIVE_BATCH_BYTES
+    tuner.record(batch, batch, compress_seconds=0.1, write_seconds=1.0)
+    assert tuner.level == 0
+
+
+def test_preallocate_sets_the_size_on_windows(tmp_path, monkeypatch):
+    monkeypatch.delattr(os, "posix_fallocate", raising=False)
+    monkeypatch.setattr(os, "name", "nt")
+    fd = os.open(tmp_path / "restored", os.O_WRONLY | os.O_CREAT)
+    try:
+        file_operations._preallocate(fd, 1 << 20)
+    finally:
+        os.close(fd)
+    assert os.path.getsize(tmp_path / "restored") == 1 << 20
+
+
+@pytest.mark.parametrize("create", [file_operations.zip_folder, file_operations.tar_folder])
+def test_deduplicate_keeps_hard_links_that_are_also_copies(tmp_path, create):
+    source = tmp_path / "src"
+    source.mkdir()
+    (source / "a.txt").write_text("same")
+    (source / "b.txt").write_text("same")
+    os.link(source / "b.txt", source / "c.txt")
+    inventory = sorted(scan_folder(str(source)), key=lambda entry: entry[1])
+    archive = str(tmp_path / "archive")
+    create(str(source), archive, inventory=inventory, deduplicate=True)
+    restored = tmp_path / "out"
+    file_operations.extract_archive(archive, str(restored), verify=True)
+    for name in ("a.txt", "b.txt", "c.txt"):
+        assert (restored / name).read_text() == "same"
+    assert os.path.samefile(restored / "b.txt", restored / "c.txt")
+    assert not os.path.samefile(restored / "a.txt", restored / "b.txt")
+
+
+def test_overwrite_gives_up_after_one_chmod(tmp_path, monkeypatch):
+    target = tmp_path / "locked.bin"
+    target.write_bytes(b"secret")
+    attempts = []
+
+    def denied(path, mode="r", *args, **kwargs):
+        attempts.append(path)
+        raise PermissionError(13, "Permission denied", path)
+    monkeypatch.setattr(file_operations, "open", denied, raising=False)
+    with pytest.raises(PermissionError):
+        file_operations.delete_path(str(target), overwrite_bytes=4096)
+    assert len(attempts) == 2
+    assert target.read_bytes() == b"secret"
+
+
+@pytest.mark.parametrize("create", [file_operations.zip_folder, file_operations.tar_folder])
+def test_files_named_like_manifests_are_kept(tmp_path, create):
+    source = tmp_path / "src"
+    source.mkdir()
+    names = [file_operations.HASH_MANIFEST, file_operations.DEDUP_MANIFEST, ".fenc-~escaped", "dup.txt"]
+    for name in names:
+        (source / name).write_text(f"user {name}")
+    (source / ".fenc-copy").write_text("user dup.txt")
+    archive = str(tmp_path / "archive")
+    manifest = create(str(source), archive, deduplicate=True)
+    restored = tmp_path / "out"
+    assert file_operations.extract_archive(archive, str(restored), verify=True) == manifest
+    for name in names:
+        assert (restored / name).read_text() == f"user {name}"
+    assert (restored / ".fenc-copy").read_text() == "user dup.txt"
+    check_source_unchanged(str(source), scan_folder(str(source)), manifest)
+
+
+@pytest.mark.parametrize("failing", [(), ("_copy_file_range",), ("_copy_file_range", "_sendfile")])
+def test_stored_entries_are_copied_with_fallbacks(tmp_path, monkeypatch, failing):
+    source = tmp_path / "src"
+    source.mkdir()
+    data = os.urandom(3 * 1024 * 1024 + 5)
+    (source / "big.bin").write_bytes(data)
+    (source / "empty").write_bytes(b"")
+    zip_folder(str(source), str(tmp_path / "a.zip"), compression_level=0)
+    monkeypatch.setattr(file_operations, "COPY_RANGE_SIZE", 1024 * 1024)
+
+    def unsupported(*args):
+        raise OSError("not supported")
+    for name in failing:
+        monkeypatch.setattr(file_operations, name, unsupported)
+    file_operations.unzip_folder(str(tmp_path / "a.zip"), str(tmp_path / "out"), verify=True)
+    assert (tmp_path / "out" / "big.bin").read_bytes() == data
+    assert (tmp_path / "out" / "empty").read_bytes() == b""
+
+
+def test_verify_manifest_reports_changed_and_missing_files(tmp_path):
+    source = str(tmp_path / "src")
+    _make_tree(source)
+    manifest = zip_folder(source, str(tmp_path / "a.zip"))
+    assert set(manifest["files"]) == {"top.txt", "sub/deep/nested.txt"}
+    file_operations.verify_manifest(source, manifest)
+    with open(os.path.join(source, "top.txt"), "w") as f:
+        f.write("changed")
+    os.remove(os.path.join(source, "sub", "deep", "nested.txt"))
+    with pytest.raises(ValueError, match="top.txt") as error:
+        file_operations.verify_manifest(source, manifest)
+    assert "sub/deep/nested.txt" in str(error.value)
@@ -0,0 +1,26 @@
+import json
+
+from src.job_report import JobReport, stage_timer
+
+
+def test_report_computes_throughput_and_slowest_stage(tmp_path):
+    report = JobReport("encrypt", "in")
+    with report.stage("scan", files=3):
+        pass
+    with report.stage("encrypt") as record:
+        record["bytes"] = 4 * 1024 * 1024
+    report.stages[1]["seconds"] = 2.0
+    report.finish(output_path="out.enc")
+    result = report.to_dict()
+    assert result["slowest_stage"] == "encrypt"
+    assert result["stages"][0]["throughput_mb_s"] is None
+    assert result["stages"][1]["throughput_mb_s"] == 2.0
+    report.write_json(str(tmp_path / "report.json"))
+    with open(tmp_path / "report.json") as report_file:
+        assert json.load(report_file)["output_path"] == "out.enc"
+
+
+def test_stage_timer_without_a_report():
+    with stage_timer(None)("kdf", files=1) as record:
+        record["bytes"] = 5
+    assert record == {"name": "kdf", "bytes": 5, "files": 1}
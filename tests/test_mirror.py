@@ -0,0 +1,56 @@
+import os
+import shutil
+
+import pytest
+
+from src import mirror
+from src.mirror import mirror_folder, restore_mirror, list_mirror, open_mirror
+
+
+@pytest.fixture
+def folder(tmp_path):
+    source = tmp_path / "src"
+    (source / "docs").mkdir(parents=True)
+    (source / "docs" / "a.txt").write_text("alpha " * 100)
+    (source / "docs" / "b.txt").write_text("beta")
+    return source
+
+
+def test_mirror_round_trip(tmp_path, folder):
+    mirror_dir = str(tmp_path / "mirror")
+    assert mirror_folder(str(folder), mirror_dir, "pw", workers=2)["encrypted"] == 2
+    assert list_mirror(mirror_dir, "pw") == ["docs/a.txt", "docs/b.txt"]
+    restore_mirror(mirror_dir, str(tmp_path / "out"), "pw", paths=["docs/b.txt"])
+    assert (tmp_path / "out" / "docs" / "b.txt").read_text() == "beta"
+    assert not (tmp_path / "out" / "docs" / "a.txt").exists()
+
+
+def test_mirror_keeps_long_names(tmp_path, folder):
+    long_dir = "d" * 200
+    long_file = "é" * 120 + ".txt"
+    (folder / long_dir).mkdir()
+    (folder / long_dir / long_file).write_text("long")
+    mirror_dir = str(tmp_path / "mirror")
+    mirror_folder(str(folder), mirror_dir, "pw")
+    for _, dirs, files in os.walk(mirror_dir):
+        assert all(len(name) <= mirror.MAX_NAME_LENGTH for name in dirs + files)
+    assert f"{long_dir}/{long_file}" in list_mirror(mirror_dir, "pw")
+    restore_mirror(mirror_dir, str(tmp_path / "out"), "pw", paths=[long_dir])
+    assert (tmp_path / "out" / long_dir / long_file).read_text() == "long"
+
+    shutil.rmtree(folder / long_dir)
+    assert mirror_folder(str(folder), mirror_dir, "pw")["removed"] == 1
+    assert sorted(os.listdir(mirror_dir)) == sorted([mirror.MIRROR_KEY_FILE,
+                                                     open_mirror(mirror_dir, "pw").stored_name("docs")[0]])
+
+
+def test_mirror_files_are_bound_to_their_path(tmp_path, folder):
+    mirror_dir = str(tmp_path / "mirror")
+    mirror_folder(str(folder), mirror_dir, "pw")
+    keys = open_mirror(mirror_dir, "pw")
+    first, second = keys.mirror_path(mirror_dir, "docs/a.txt"), keys.mirror_path(mirror_dir, "docs/b.txt")
+    os.replace(first, first + ".swap")
+    os.replace(second, first)
+    os.replace(first + ".swap", second)
+    with pytest.raises(ValueError):
+        restore_mirror(mirror_dir, str(tmp_path / "out"), "pw", paths=["docs/a.txt"])
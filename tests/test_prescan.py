@@ -0,0 +1,53 @@
+import os
+import threading
+
+import pytest
+
+from src.crypto_worker import ScanWorker
+from src.prescan import prescan_folder, format_estimate, ScanCancelled
+
+
+@pytest.fixture
+def folder(tmp_path):
+    source = tmp_path / "data"
+    (source / "sub").mkdir(parents=True)
+    (source / "text.txt").write_text("compressible " * 5000)
+    (source / "sub" / "random.bin").write_bytes(os.urandom(50_000))
+    return source
+
+
+def test_prescan_counts_files_and_estimates(folder):
+    estimate = prescan_folder(str(folder))
+    assert estimate["files"] == 2
+    assert estimate["bytes"] == 65_000 + 50_000
+    assert 0 < estimate["compress_ratio"] < 1
+    assert estimate["needed_bytes"] == int(estimate["bytes"] * estimate["compress_ratio"] * 2)
+    assert estimate["free_bytes"] > 0 and estimate["seconds"] > 0
+    assert format_estimate(estimate).startswith("2 files, 112.3 KB")
+
+
+def test_prescan_warns_about_free_space(folder):
+    estimate = dict(prescan_folder(str(folder)), free_bytes=1)
+    assert "not enough free space" in format_estimate(estimate)
+
+
+def test_prescan_can_be_cancelled(folder):
+    cancel = threading.Event()
+    cancel.set()
+    with pytest.raises(ScanCancelled):
+        prescan_folder(str(folder), cancel_event=cancel)
+
+
+def test_cancelled_scan_worker_emits_no_result(folder):
+    worker = ScanWorker(str(folder))
+    finished, done = [], []
+    worker.scan_finished.connect(lambda path, estimate: finished.append(estimate))
+    worker.done.connect(lambda: done.append(True))
+    worker.run()
+    assert finished[0]["files"] == 2 and done == [True]
+
+    worker = ScanWorker(str(folder))
+    worker.scan_finished.connect(lambda path, estimate: finished.append(estimate))
+    worker.cancel()
+    worker.run()
+    assert len(finished) == 1
@@ -0,0 +1,45 @@
+import os
+
+import pytest
+
+from src import profiling
+from src.file_operations import zip_folder
+from src.profiling import enable_profiling, disable_profiling, profile_session, profiled
+
+
+@pytest.fixture
+def profile_dir(tmp_path):
+    directory = tmp_path / "profiles"
+    enable_profiling(str(directory))
+    yield directory
+    disable_profiling()
+
+
+def test_profiling_is_off_by_default():
+    assert not profiling.profiling_enabled()
+    with profile_session("job") as files:
+        pass
+    assert files == {}
+
+
+def test_decorated_function_writes_profile_and_allocations(tmp_path, profile_dir):
+    source = tmp_path / "data"
+    source.mkdir()
+    (source / "a.txt").write_text("a" * 10000)
+    zip_folder(str(source), str(tmp_path / "a.zip"))
+    names = os.listdir(profile_dir)
+    assert {os.path.splitext(name)[1] for name in names} == {".prof", ".txt"}
+    allocations = [name for name in names if name.endswith(".alloc.txt")]
+    assert len(allocations) == 1 and allocations[0].startswith("zip_folder-")
+    assert (profile_dir / allocations[0]).read_text().startswith("Peak traced memory:")
+
+
+def test_nested_calls_join_the_outer_session(profile_dir):
+    @profiled("inner")
+    def inner():
+        return 42
+
+    with profile_session("outer") as files:
+        assert inner() == 42
+    assert os.path.basename(files["profile"]).startswith("outer-")
+    assert len(os.listdir(profile_dir)) == 3
@@ -0,0 +1,137 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from src import resource_limits, file_operations, storage, crypto_worker
+from src.crypto_worker import CryptoWorker
+from src.resource_limits import job_limits, in_job, cpu_workers, set_cpu_workers, set_io_limit, MemoryBudget
+
+
+@pytest.fixture(autouse=True)
+def no_limits():
+    set_io_limit(None)
+    set_cpu_workers(None)
+    yield
+    set_io_limit(None)
+    set_cpu_workers(None)
+
+
+def test_job_limits_are_restored():
+    set_cpu_workers(8)
+    with job_limits(io_limit_mb_s=5, workers=2):
+        assert cpu_workers(16) == 2
+        assert resource_limits._job_io_limiter.get().rate == 5 * 1024 * 1024
+    assert cpu_workers(16) == 8
+    assert resource_limits._job_io_limiter.get() is None
+
+
+def test_overlapping_jobs_keep_their_own_limits():
+    set_cpu_workers(8)
+    started, release = threading.Barrier(2), threading.Event()
+    seen = {}
+
+    def job(workers, io_limit):
+        with job_limits(io_limit_mb_s=io_limit, workers=workers):
+            started.wait()
+            release.wait()
+            limiter = resource_limits._job_io_limiter.get()
+            with ThreadPoolExecutor(max_workers=1) as pool:
+                in_pool = pool.submit(in_job(cpu_workers), 16).result()
+            seen[workers] = (cpu_workers(16), in_pool, limiter and limiter.rate)
+
+    threads = [threading.Thread(target=job, args=(2, None)), threading.Thread(target=job, args=(3, 5))]
+    for thread in threads:
+        thread.start()
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert seen == {2: (2, 2, None), 3: (3, 3, 5 * 1024 * 1024)}
+    assert cpu_workers(16) == 8
+
+
+def test_worker_restores_limits_after_failing(tmp_path):
+    worker = CryptoWorker("decrypt", str(tmp_path / "missing.enc"), "pw", io_limit_mb_s=1, cpu_workers=1)
+    with pytest.raises(Exception):
+        worker.execute()
+    assert resource_limits._job_io_limiter.get() is None
+    assert cpu_workers(16) == 16
+
+
+def test_extraction_is_throttled(tmp_path, monkeypatch):
+    source = tmp_path / "src"
+    source.mkdir()
+    (source / "a.txt").write_bytes(b"compressible " * 10000)
+    file_operations.zip_folder(str(source), str(tmp_path / "a.zip"), compression_level=6)
+    throttled = []
+    monkeypatch.setattr(file_operations, "throttle_io", throttled.append)
+    file_operations.extract_archive(str(tmp_path / "a.zip"), str(tmp_path / "out"))
+    assert sum(throttled) >= 130000
+
+
+def test_s3_upload_workers_fit_the_memory_budget(monkeypatch):
+    opened = {}
+    monkeypatch.setattr(storage.S3Sink, "from_url", classmethod(lambda cls, url, **kwargs: opened.update(kwargs)))
+    budget = MemoryBudget(64)
+    budget.baseline_bytes = 0
+    storage.open_sink("s3://bucket/key", memory_budget=budget)
+    # Two 16 MiB parts per worker in at most half of 64 MiB.
+    assert opened == {"workers": 1}
+
+
+def test_verification_pool_follows_the_memory_budget(tmp_path, monkeypatch):
+    source = tmp_path / "src"
+    source.mkdir()
+    (source / "a.txt").write_bytes(b"a")
+    file_operations.zip_folder(str(source), str(tmp_path / "a.zip"))
+    pools = []
+    monkeypatch.setattr(file_operations, "verify_manifest", lambda path, manifest, workers=None: pools.append(workers))
+    budget = MemoryBudget(64)
+    file_operations.extract_archive(str(tmp_path / "a.zip"), str(tmp_path / "out"), verify=True, memory_budget=budget)
+    assert pools == [budget.max_workers]
+
+
+def _budget(mb):
+    budget = MemoryBudget(mb)
+    budget.baseline_bytes = 0
+    return budget
+
+
+def test_archive_format_falls_back_to_tar_only_if_it_fits():
+    # About 420 bytes per zip entry and 320 per tar entry against half of 64 MiB.
+    inventory = [("/unused", "f%08d" % i, 1 << 20) for i in range(90000)]
+    assert file_operations.choose_archive_format(inventory, _budget(64)) == "tar"
+    with pytest.raises(MemoryError):
+        file_operations.choose_archive_format(inventory * 2, _budget(64))
+
+
+def test_tar_drops_the_member_index_that_does_not_fit(tmp_path, monkeypatch):
+    source = tmp_path / "src"
+    source.mkdir()
+    (source / "a.txt").write_text("a")
+    monkeypatch.setattr(resource_limits, "TAR_INDEX_ENTRY_OVERHEAD", 1 << 40)
+    archive = str(tmp_path / "a.tar")
+    file_operations.tar_folder(str(source), archive, memory_budget=_budget(64))
+    with pytest.raises(KeyError):
+        file_operations.extract_tar_member(archive, "a.txt", str(tmp_path / "out"))
+    file_operations.extract_archive(archive, str(tmp_path / "out"), verify=True)
+    assert (tmp_path / "out" / "a.txt").read_text() == "a"
+
+
+def test_peak_memory_is_labelled_by_scope(tmp_path, monkeypatch):
+    source = tmp_path / "src"
+    source.mkdir()
+    (source / "a.txt").write_text("a")
+    monkeypatch.setattr(crypto_worker, "reset_peak_rss", lambda: True)
+    alone = CryptoWorker("encrypt", str(source), "pw", output_path=str(tmp_path / "a.enc"))
+    alone.execute()
+    assert alone.report.extra["peak_rss_scope"] == "job"
+
+    # A job still running elsewhere in the process shares the high-water mark.
+    other = CryptoWorker("decrypt", str(tmp_path / "a.enc"), "pw")
+    other.peak_rss_scope = "job"
+    monkeypatch.setattr(crypto_worker, "_running_jobs", {other})
+    shared = CryptoWorker("encrypt", str(source), "pw", output_path=str(tmp_path / "b.enc"))
+    message, _ = shared.execute()
+    assert shared.report.extra["peak_rss_scope"] == other.peak_rss_scope == "process"
+    assert "Peak process memory" in message
@@ -0,0 +1,93 @@
+import io
+import os
+
+import pytest
+
+from src import storage
+from src.storage import S3Sink, S3Source
+
+
+class FakeS3:
+    """Just enough of a boto3 S3 client for S3Sink and S3Source."""
+    def __init__(self, objects=None):
+        self.objects = dict(objects or {})
+        self.uploads = {}
+        self.part_sizes = []
+        self.gets = 0
+
+    def create_multipart_upload(self, Bucket, Key):
+        self.uploads["upload"] = {}
+        return {"UploadId": "upload"}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        self.uploads[UploadId][PartNumber] = Body
+        self.part_sizes.append(len(Body))
+        return {"ETag": f"etag-{PartNumber}"}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        parts = self.uploads.pop(UploadId)
+        self.objects[Key] = b"".join(parts[part["PartNumber"]] for part in MultipartUpload["Parts"])
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.uploads.pop(UploadId)
+
+    def head_object(self, Bucket, Key):
+        return {"ContentLength": len(self.objects[Key])}
+
+    def get_object(self, Bucket, Key, Range):
+        self.gets += 1
+        start, end = map(int, Range[len("bytes="):].split("-"))
+        return {"Body": io.BytesIO(self.objects[Key][start:end + 1])}
+
+
+def test_s3_sink_uploads_parts_in_order():
+    client = FakeS3()
+    data = os.urandom(10000)
+    with S3Sink("bucket", "key", part_size=1000, client=client) as sink:
+        for start in range(0, len(data), 333):
+            sink.write(data[start:start + 333])
+    assert client.objects["key"] == data
+    assert not client.uploads
+
+
+def test_s3_sink_aborts_the_upload_on_error():
+    client = FakeS3()
+    with pytest.raises(RuntimeError):
+        with S3Sink("bucket", "key", client=client) as sink:
+            sink.write(b"partial")
+            raise RuntimeError("encryption failed")
+    assert not client.uploads and "key" not in client.objects
+
+
+def test_s3_sink_part_size_fits_the_total_size():
+    sink = S3Sink("bucket", "key", client=FakeS3(), total_size=400 * 1024 ** 3)
+    assert sink.part_size * storage.S3_MAX_PARTS >= 400 * 1024 ** 3
+    sink.abort()
+
+
+def test_s3_sink_grows_parts_when_the_size_is_unknown(monkeypatch):
+    monkeypatch.setattr(storage, "S3_PART_GROWTH", 2)
+    client = FakeS3()
+    with S3Sink("bucket", "key", part_size=10, workers=1, client=client) as sink:
+        sink.write(bytes(150))
+    assert client.part_sizes == [10, 10, 20, 20, 40, 40, 10]
+    assert len(client.objects["key"]) == 150
+
+
+def test_s3_source_reads_small_chunks_and_seeks():
+    data = os.urandom(5000)
+    client = FakeS3({"key": data})
+    source = S3Source("bucket", "key", part_size=1024, client=client)
+    chunks = []
+    while True:
+        chunk = source.read(7)
+        if not chunk:
+            break
+        chunks.append(chunk)
+    assert b"".join(chunks) == data
+    assert client.gets == 5
+    source.seek(-100, os.SEEK_END)
+    assert source.tell() == 4900
+    assert source.read(10) == data[4900:4910]
+    assert source.tell() == 4910
+    assert source.read() == data[4910:]